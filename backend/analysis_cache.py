@@ -0,0 +1,101 @@
+"""
+In-process cache of parsed analysis files and their serialized responses.
+
+Entries are keyed by path and validated against the file's mtime and
+size on every lookup, so a rewritten analysis is picked up immediately
+while unchanged files are never re-read or re-parsed. Each entry also
+keeps the JSON bodies built from it (one per endpoint), serialized once,
+with an ETag and Last-Modified value for conditional requests. The cache
+is bounded by the total size of files and bodies held, evicting the
+least recently used entries first.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+
+class CachedAnalysis:
+    def __init__(self, path: str, mtime_ns: int, size: int, data: dict):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.data = data
+        self.last_modified = formatdate(mtime_ns / 1e9, usegmt=True)
+        self.nbytes = size
+        self._bodies = {}  # kind -> (body bytes, etag)
+
+    def body(self, kind: str, build):
+        """Serialized build(data) for this kind of response, built once."""
+        cached = self._bodies.get(kind)
+        if cached is None:
+            body = json.dumps(build(self.data)).encode("utf-8")
+            cached = (body, f'"{self.mtime_ns:x}-{self.size:x}-{kind}"')
+            self._bodies[kind] = cached
+            self.nbytes += len(body)
+        return cached
+
+    def not_modified(self, etag: str, if_none_match: str = None, if_modified_since: str = None) -> bool:
+        """Conditional request check; If-None-Match takes precedence over If-Modified-Since."""
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.mtime_ns / 1e9) <= since
+        return False
+
+
+class AnalysisCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # path -> CachedAnalysis, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str):
+        """
+        The cached analysis for path, re-read if the file changed. Returns
+        None if it does not exist; raises ValueError if it is not valid JSON.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+
+        with open(path, "r") as f:
+            data = json.load(f)
+        entry = CachedAnalysis(path, stat.st_mtime_ns, stat.st_size, data)
+        with self._lock:
+            self.misses += 1
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            self._evict()
+        return entry
+
+    def _evict(self):
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, oldest = self._entries.popitem(last=False)
+            total -= oldest.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry.nbytes for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Inference backend benchmark: images/sec and agreement with the Keras reference.
+
+Decodes and preprocesses frames from a video the same way the pipeline
+does, runs them through each backend in batches and reports throughput,
+the mean cosine similarity of the features to the first backend's and
+the rate at which the SVM makes the same anomaly decision.
+
+Usage:
+    python benchmarks/bench_backends.py path/to/video.mp4 [--backends keras onnx tflite] [--frames 500] [--batch-size 100] [--threads 0]
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_buffer import IMAGENET_MEAN_BGR
+from frame_source import probe_video, open_frame_source
+from inference_backends import INFERENCE_BACKENDS, create_backend
+
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "weights")
+
+
+def load_inputs(video_path, count):
+    input_fps, total_frames = probe_video(video_path)
+    frame_skip = max(1, total_frames // count)
+    inputs = []
+    for _, frame in open_frame_source(video_path, "opencv", input_fps, frame_skip, total_frames):
+        if len(inputs) >= count:
+            break
+        inputs.append(frame[:, :, ::-1].astype(np.float32) - IMAGENET_MEAN_BGR)
+    return np.stack(inputs)
+
+
+def run(backend, inputs, batch_size):
+    backend.predict(inputs[:1])  # Warm-up outside the timing
+    features = []
+    start = time.perf_counter()
+    for i in range(0, len(inputs), batch_size):
+        features.append(backend.predict(inputs[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    return np.concatenate(features), len(inputs) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--svm", default=os.path.join(WEIGHTS_DIR, "svm_model.pkl"))
+    args = parser.parse_args()
+
+    inputs = load_inputs(args.video, args.frames)
+    svm_model = joblib.load(args.svm)
+    print(f"{len(inputs)} frames, batch size {args.batch_size}")
+
+    reference = None
+    print(f"{'backend':<8} {'images/s':>9} {'cosine':>8} {'SVM agreement':>14} {'anomalous':>10}")
+    for name in args.backends:
+        try:
+            backend = create_backend(name, WEIGHTS_DIR, threads=args.threads)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"{name:<8} skipped: {e}")
+            continue
+        features, rate = run(backend, inputs, args.batch_size)
+        predictions = svm_model.predict(features)
+        if reference is None:
+            reference = (name, features, predictions)
+        ref_name, ref_features, ref_predictions = reference
+        cosine = np.mean(np.sum(features * ref_features, axis=1)
+                         / (np.linalg.norm(features, axis=1) * np.linalg.norm(ref_features, axis=1) + 1e-12))
+        agreement = np.mean(predictions == ref_predictions)
+        print(f"{name:<8} {rate:>9.1f} {cosine:>8.4f} {agreement:>13.1%} {np.mean(predictions == 1):>9.1%}")
+    if reference is not None:
+        print(f"(cosine and agreement are relative to {reference[0]})")
+
+
+if __name__ == "__main__":
+    main()
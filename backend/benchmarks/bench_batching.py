@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Feature-extraction batching benchmark: chunk-bounded model calls vs. the
+shared cross-chunk / cross-video batcher.
+
+First runs the batch size sweep the service runs at model load and prints
+the table and the chosen size. Then replays the frames of --videos videos
+of --chunks chunks each, concurrently. Every chunk yields the sampled
+frames of CHUNK_DURATION_SECONDS at TARGET_FPS, of which --active-ratio
+pass the motion gate on average. The same frames go through
+  - chunk-bounded: one model call per FrameBatch with its active frames
+    (the previous inference stage), and
+  - batched: InferenceBatcher at the tuned size, with the in-flight window
+    of the inference stage,
+and images/sec, model calls and mean batch fill are compared.
+
+--backend loads the real ResNet50 (needs weights/); --stand-in builds a
+small random-weight ConvNet with ONNX Runtime instead, so the effect of
+batch size on a real CPU inference engine can be measured without weights.
+
+Usage:
+    python benchmarks/bench_batching.py --backend onnx [--videos 2 --chunks 12 --active-ratio 0.6]
+    python benchmarks/bench_batching.py --stand-in
+"""
+import argparse
+import collections
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_batcher import InferenceBatcher, tune_batch_size
+
+CHUNK_FRAMES = 50  # CHUNK_DURATION_SECONDS * TARGET_FPS in indexing_video
+
+
+def stand_in_onnx():
+    """ONNX model, NHWC float32 (n, 224, 224, 3) -> (n, 2048): four strided convs, global pooling, projection."""
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    nodes = [helper.make_node("Transpose", ["input"], ["x0"], perm=[0, 3, 1, 2])]
+    initializers = []
+    channels = [3, 32, 64, 128, 256]
+    for i, (cin, cout) in enumerate(zip(channels, channels[1:])):
+        kernel = 7 if i == 0 else 3
+        weight = (rng.standard_normal((cout, cin, kernel, kernel)) / np.sqrt(cin * kernel * kernel)).astype(np.float32)
+        initializers.append(numpy_helper.from_array(weight, f"w{i}"))
+        nodes.append(helper.make_node("Conv", [f"x{i}", f"w{i}"], [f"c{i}"], strides=[2, 2], pads=[kernel // 2] * 4))
+        nodes.append(helper.make_node("Relu", [f"c{i}"], [f"x{i + 1}"]))
+    initializers.append(numpy_helper.from_array(rng.standard_normal((256, 2048)).astype(np.float32) / 16, "proj"))
+    nodes += [
+        helper.make_node("GlobalAveragePool", ["x4"], ["pooled"]),
+        helper.make_node("Flatten", ["pooled"], ["flat"]),
+        helper.make_node("MatMul", ["flat", "proj"], ["features"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "stand_in",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["n", 224, 224, 3])],
+        [helper.make_tensor_value_info("features", TensorProto.FLOAT, ["n", 2048])],
+        initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+
+
+def stand_in_model():
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(stand_in_onnx().SerializeToString(), providers=["CPUExecutionProvider"])
+    return lambda batch: session.run(None, {"input": np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+
+def workload(videos, chunks, active_ratio, seed=0):
+    """Active-frame count of every FrameBatch, per video (one batch per chunk, as with BATCH_SIZE 100)."""
+    rng = np.random.default_rng(seed)
+    return [[int(rng.binomial(CHUNK_FRAMES, active_ratio)) for _ in range(chunks)] for _ in range(videos)]
+
+
+def run_videos(per_video, work):
+    threads = [threading.Thread(target=work, args=(counts,)) for counts in per_video]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["keras", "onnx", "tflite"])
+    parser.add_argument("--stand-in", action="store_true")
+    parser.add_argument("--videos", type=int, default=2)
+    parser.add_argument("--chunks", type=int, default=12)
+    parser.add_argument("--active-ratio", type=float, default=0.6, help="Share of sampled frames that pass the motion gate")
+    parser.add_argument("--candidates", default="8,16,32,64,128")
+    parser.add_argument("--max-batch-ms", type=float, default=0)
+    args = parser.parse_args()
+    if not args.backend and not args.stand_in:
+        parser.error("give --backend or --stand-in")
+
+    if args.stand_in:
+        predict = stand_in_model()
+        print("Model: stand-in ConvNet (ONNX Runtime, CPU)")
+    else:
+        from inference_backends import create_backend
+        extractor = create_backend(args.backend, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "weights"))
+        predict = extractor.predict
+        print(f"Model: ResNet50 ({args.backend})")
+    predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+
+    candidates = [int(n) for n in args.candidates.split(",")]
+    tuning = tune_batch_size(predict, candidates, baseline=CHUNK_FRAMES, max_batch_ms=args.max_batch_ms)
+    print(f"{'batch':>6} {'images/s':>10} {'ms/batch':>10}")
+    for row in tuning["sweep"]:
+        mark = "  <- chosen" if row["batch_size"] == tuning["batch_size"] else ("  (chunk batch)" if row["batch_size"] == CHUNK_FRAMES else "")
+        print(f"{row['batch_size']:>6} {row['images_per_second']:>10.1f} {row['batch_ms']:>10.1f}{mark}")
+    print(f"chosen batch size {tuning['batch_size']}: {tuning['speedup']}x the images/s of {CHUNK_FRAMES}-frame chunk batches")
+    print()
+
+    per_video = workload(args.videos, args.chunks, args.active_ratio)
+    frames = sum(map(sum, per_video))
+    inputs = np.random.default_rng(1).standard_normal((CHUNK_FRAMES, 224, 224, 3)).astype(np.float32)
+    print(f"{args.videos} video(s) x {args.chunks} chunks, {frames} active frames "
+          f"(batches of {min(map(min, per_video))}-{max(map(max, per_video))} frames)")
+
+    calls = []
+
+    def chunk_bounded(counts):
+        for n in counts:
+            if n:
+                predict(inputs[:n])
+                calls.append(n)
+
+    seconds = run_videos(per_video, chunk_bounded)
+    before = frames / seconds
+    print(f"{'chunk-bounded':>14}: {before:8.1f} images/s, {len(calls)} model calls, mean {np.mean(calls):.1f} frames per call")
+
+    batcher = InferenceBatcher(predict, batch_size=tuning["batch_size"])
+    max_in_flight = max(2, -(-batcher.batch_size // CHUNK_FRAMES) + 1)
+
+    def batched(counts):
+        in_flight = collections.deque()
+        for n in counts:
+            in_flight.append(batcher.submit(inputs[:n]))
+            while len(in_flight) > max_in_flight or (in_flight and in_flight[0].done()):
+                in_flight.popleft().result()
+        for future in in_flight:
+            future.result()
+
+    seconds = run_videos(per_video, batched)
+    after = frames / seconds
+    stats = batcher.stats()
+    print(f"{'batched':>14}: {after:8.1f} images/s, {stats['batches']} model calls, mean batch fill {stats['mean_batch_fill']:.0%}")
+    print(f"{'gain':>14}: {after / before:.2f}x ({after - before:+.1f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
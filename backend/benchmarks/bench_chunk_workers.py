@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Chunk-parallel scaling benchmark.
+
+Detects every chunk of one video (decode, motion gate, feature extraction,
+SVM) with ChunkWorkerPool for each process count in --processes, and prints
+the wall time, chunks/s, speedup and parallel efficiency against the
+reference: one worker reading the whole file in a single pass, i.e. the
+previous single-decoder, single-session setup. Each worker gets
+cores / processes intra-op threads (at least 1). The merged results of
+every run are hashed and must match the reference bit for bit.
+
+--backend loads the real ResNet50 replicas (needs weights/); --stand-in
+writes the random-weight ConvNet of bench_batching.py as an ONNX file and a
+random linear SVM, so the scaling can be measured without weights.
+
+Usage:
+    python benchmarks/bench_chunk_workers.py --stand-in [--chunks 16 --processes 1,2,4]
+    python benchmarks/bench_chunk_workers.py --backend onnx path/to/video.mp4
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from chunk_workers import ChunkWorkerPool, load_models
+from frame_source import probe_video
+
+FPS = 25
+CHUNK_SECONDS = 10  # CHUNK_DURATION_SECONDS in indexing_video
+TARGET_FPS = 5
+
+
+def make_video(path, chunks):
+    """Moving bars with a few static stretches, so the motion gate has work to do."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (320, 240))
+    for i in range(chunks * CHUNK_SECONDS * FPS):
+        frame = np.full((240, 320, 3), 40, np.uint8)
+        if (i // (FPS * 7)) % 3:
+            x = (i * 5) % 300
+            frame[:, x:x + 20] = 200
+            frame[(i * 3) % 220:(i * 3) % 220 + 20, :] = 120
+        writer.write(frame)
+    writer.release()
+
+
+def stand_in_models(folder):
+    """Write resnet50.onnx and svm_model.pkl stand-ins; returns the SVM path."""
+    import joblib
+    from sklearn.svm import LinearSVC
+
+    from bench_batching import stand_in_onnx
+
+    with open(os.path.join(folder, "resnet50.onnx"), "wb") as f:
+        f.write(stand_in_onnx().SerializeToString())
+    rng = np.random.default_rng(0)
+    svm = LinearSVC(dual=False).fit(rng.standard_normal((200, 2048)), rng.integers(0, 2, 200))
+    svm_path = os.path.join(folder, "svm_model.pkl")
+    joblib.dump(svm, svm_path)
+    return svm_path
+
+
+def run(pool, video, input_fps, total_frames, batch_size):
+    """Seconds to detect every chunk, and a hash of the merged results."""
+    frame_skip = max(1, int(input_fps / TARGET_FPS))
+    frames_per_chunk = int(CHUNK_SECONDS * input_fps)
+    total_chunks = int(np.ceil(total_frames / frames_per_chunk))
+    pool.start()
+    digest = hashlib.sha256()
+    started = time.perf_counter()
+    for piece in pool.process_video(video, "opencv", input_fps, frame_skip, frames_per_chunk, total_frames, 0, total_chunks,
+                                    "diff", 0.01, batch_size):
+        for key in ("frame_numbers", "active", "features", "scores"):
+            digest.update(piece[key].tobytes())
+    return time.perf_counter() - started, total_chunks, digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path", nargs="?")
+    parser.add_argument("--backend", choices=["keras", "onnx", "tflite"])
+    parser.add_argument("--stand-in", action="store_true")
+    parser.add_argument("--chunks", type=int, default=16, help="Length of the synthetic video, in chunks")
+    parser.add_argument("--processes", default=None, help="Comma-separated process counts (default: 1, 2, 4, ... up to the core count)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    if not args.backend and not args.stand_in:
+        parser.error("give --backend or --stand-in")
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    counts = [int(n) for n in args.processes.split(",")] if args.processes else sorted({1, 2, cores} | {2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores})
+
+    work = tempfile.mkdtemp(prefix="bench_chunk_workers_")
+    try:
+        if args.stand_in:
+            loader_args = ("onnx", work, stand_in_models(work))
+            print("Model: stand-in ConvNet (ONNX Runtime, CPU) + linear SVM")
+        else:
+            loader_args = (args.backend, os.path.join(BACKEND_DIR, "weights"), os.path.join(BACKEND_DIR, "weights", "svm_model.pkl"))
+            print(f"Model: ResNet50 ({args.backend}) + SVM")
+        video = args.video_path
+        if not video:
+            video = os.path.join(work, "synthetic.avi")
+            make_video(video, args.chunks)
+        input_fps, total_frames = probe_video(video)
+        print(f"{os.path.basename(video)}: {total_frames / input_fps:.0f}s, {cores} cores")
+
+        # Reference: one process reads the whole file in one pass
+        pool = ChunkWorkerPool(1, cores, load_models, loader_args, span=1 << 30)
+        reference_seconds, total_chunks, reference = run(pool, video, input_fps, total_frames, args.batch_size)
+        pool.shutdown()
+        print(f"{'processes':>9} {'threads':>7} {'seconds':>8} {'chunks/s':>9} {'speedup':>8} {'efficiency':>10}  results")
+        print(f"{'1 pass':>9} {cores:>7} {reference_seconds:>8.2f} {total_chunks / reference_seconds:>9.2f} {1.0:>7.2f}x {'':>10}  reference")
+        for processes in counts:
+            threads = max(1, cores // processes)
+            pool = ChunkWorkerPool(processes, threads, load_models, loader_args)
+            seconds, _, digest = run(pool, video, input_fps, total_frames, args.batch_size)
+            pool.shutdown()
+            speedup = reference_seconds / seconds
+            print(f"{processes:>9} {threads:>7} {seconds:>8.2f} {total_chunks / seconds:>9.2f} {speedup:>7.2f}x "
+                  f"{speedup / min(processes, cores):>10.0%}  {'identical' if digest == reference else 'DIFFERENT'}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
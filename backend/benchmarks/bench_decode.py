@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Decode benchmark: per-chunk seek + read() loop vs. the single-pass frame sources.
+
+Usage:
+    python benchmarks/bench_decode.py path/to/video.mp4 [--modes legacy opencv ffmpeg]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_source import FRAME_SIZE, probe_video, open_frame_source
+
+TARGET_FPS = 5
+CHUNK_DURATION_SECONDS = 10
+
+
+def legacy_frames(video_path, input_fps, total_frames, frame_skip, frames_per_chunk):
+    """The original process_video_task loop: seek to every chunk, read() every frame."""
+    cap = cv2.VideoCapture(video_path)
+    total_chunks = -(-total_frames // frames_per_chunk)
+    for chunk_index in range(total_chunks):
+        start_frame = chunk_index * frames_per_chunk
+        end_frame = min((chunk_index + 1) * frames_per_chunk, total_frames)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_count = start_frame
+        while frame_count < end_frame:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if (frame_count - start_frame) % frame_skip == 0:
+                yield frame_count, cv2.resize(frame, (FRAME_SIZE, FRAME_SIZE))
+            frame_count += 1
+    cap.release()
+
+
+def run(mode, video_path, input_fps, total_frames, frame_skip, frames_per_chunk):
+    if mode == "legacy":
+        frames = legacy_frames(video_path, input_fps, total_frames, frame_skip, frames_per_chunk)
+    else:
+        frames = open_frame_source(video_path, mode, input_fps, frame_skip, frames_per_chunk)
+
+    sampled = 0
+    last_frame = 0
+    start = time.perf_counter()
+    for frame_number, _ in frames:
+        if frame_number >= total_frames:
+            break
+        sampled += 1
+        last_frame = frame_number
+    elapsed = time.perf_counter() - start
+
+    # Video frames walked through per second, i.e. how fast the decoder
+    # gets through the file regardless of how many frames are kept
+    return {
+        "mode": mode,
+        "seconds": elapsed,
+        "sampled_frames": sampled,
+        "video_fps": (last_frame + 1) / elapsed if elapsed > 0 else 0.0,
+        "sampled_fps": sampled / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path")
+    parser.add_argument("--modes", nargs="+", default=["legacy", "opencv", "ffmpeg"])
+    args = parser.parse_args()
+
+    input_fps, total_frames = probe_video(args.video_path)
+    frame_skip = max(1, int(input_fps / TARGET_FPS))
+    frames_per_chunk = int(CHUNK_DURATION_SECONDS * input_fps)
+    print(f"{os.path.basename(args.video_path)}: {total_frames} frames @ {input_fps:.2f} fps, frame_skip={frame_skip}")
+
+    results = [run(mode, args.video_path, input_fps, total_frames, frame_skip, frames_per_chunk) for mode in args.modes]
+
+    baseline = next((r for r in results if r["mode"] == "legacy"), None)
+    print(f"{'mode':<8} {'seconds':>9} {'sampled':>8} {'video fps':>10} {'sampled fps':>12} {'speedup':>8}")
+    for r in results:
+        speedup = baseline["seconds"] / r["seconds"] if baseline and r["seconds"] > 0 else 1.0
+        print(f"{r['mode']:<8} {r['seconds']:>9.2f} {r['sampled_frames']:>8} {r['video_fps']:>10.1f} {r['sampled_fps']:>12.1f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Offline check of the Gemini work pool against a fake model with injected latency.
+
+Submits one analysis per chunk, sequentially and through GeminiPool, and
+reports wall time, the peak number of concurrent requests, the achieved
+request rate and whether results came back in chunk order.
+
+Usage:
+    python benchmarks/bench_gemini_pool.py [--chunks 20] [--latency 2.0] [--concurrency 4] [--rpm 60]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_pool import GeminiPool
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Stands in for genai.GenerativeModel: sleeps, then returns a JSON answer."""
+
+    def __init__(self, latency: float, jitter: float = 0.5):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = []
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, content):
+        with self._lock:
+            self.calls.append(time.monotonic())
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+            return FakeResponse(json.dumps({"overall_scene": {"critical_level": "Low", "prompt": content[0]}}))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def analyze(model, chunk_index):
+    # Same shape of work as analyze_with_gemini: one blocking call, parse JSON
+    response = model.generate_content([f"chunk {chunk_index}"])
+    data = json.loads(response.text)
+    data["chunk_metadata"] = {"chunk_index": chunk_index}
+    return data
+
+
+def run_sequential(model, chunks):
+    start = time.monotonic()
+    results = [analyze(model, i) for i in range(chunks)]
+    return results, time.monotonic() - start
+
+
+def run_pool(model, chunks, concurrency, rpm):
+    pool = GeminiPool(max_concurrency=concurrency, requests_per_minute=rpm)
+    start = time.monotonic()
+    batch = pool.batch()
+    for i in range(chunks):
+        batch.submit(analyze, model, i)
+    results = batch.results()
+    elapsed = time.monotonic() - start
+    pool.shutdown()
+    return results, elapsed
+
+
+def describe(name, model, results, elapsed, chunks):
+    in_order = [r["chunk_metadata"]["chunk_index"] for r in results] == list(range(chunks))
+    span = model.calls[-1] - model.calls[0] if len(model.calls) > 1 else 0.0
+    rate = (len(model.calls) - 1) / span * 60 if span > 0 else 0.0
+    print(f"{name:<10} {elapsed:>8.2f}s  peak concurrency {model.peak_active:>2}  "
+          f"request rate {rate:>6.1f}/min  in chunk order: {in_order}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=60)
+    args = parser.parse_args()
+
+    model = FakeGeminiModel(args.latency)
+    results, elapsed = run_sequential(model, args.chunks)
+    describe("sequential", model, results, elapsed, args.chunks)
+
+    model = FakeGeminiModel(args.latency)
+    results, elapsed = run_pool(model, args.chunks, args.concurrency, args.rpm)
+    describe("pool", model, results, elapsed, args.chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Keyframe selection benchmark: evenly spaced frames vs. diverse keyframes.
+
+Treats every chunk of the video as one anomaly interval and compares, per
+chunk, the old selection (every FRAME_INTERVAL-th sampled frame) with
+select_keyframes(). Reports frames and base64 JPEG bytes per request, the
+near-duplicates among the sent frames (pHash Hamming distance <= 6) and
+the Gemini latency: modelled as base + per-image cost by default, or
+measured against the real API with --live (needs GEMINI_API_KEY).
+
+Uses the saved ResNet50 embeddings of the video when they exist under
+anomaly/<video>/, color histograms otherwise.
+
+Usage:
+    python benchmarks/bench_keyframes.py path/to/video.mp4 [--keyframes 4] [--live]
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_source import probe_video, open_frame_source
+from embedding_store import EmbeddingStore
+from gemini_cache import phash
+from keyframes import select_keyframes, select_even
+
+TARGET_FPS = 5
+CHUNK_DURATION_SECONDS = 10
+FRAME_INTERVAL = 10  # The previous fixed stride
+ANOMALY_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "anomaly")
+
+
+def chunks(video_path, input_fps, total_frames, frame_skip, frames_per_chunk):
+    """Yield (frame_numbers, frames) for every chunk of the video."""
+    numbers, frames, current = [], [], 0
+    for frame_number, frame in open_frame_source(video_path, "opencv", input_fps, frame_skip, frames_per_chunk):
+        if frame_number >= total_frames:
+            break
+        if frame_number // frames_per_chunk != current and frames:
+            yield np.array(numbers), np.stack(frames)
+            numbers, frames = [], []
+        current = frame_number // frames_per_chunk
+        numbers.append(frame_number)
+        frames.append(frame.copy())
+    if frames:
+        yield np.array(numbers), np.stack(frames)
+
+
+def load_embeddings(video_path):
+    folder = os.path.join(ANOMALY_FOLDER, os.path.splitext(os.path.basename(video_path))[0])
+    if not EmbeddingStore.exists(folder):
+        return {}
+    store = EmbeddingStore(folder)
+    return {int(n): np.asarray(f, dtype=np.float32) for n, f in zip(store.frame_numbers, store.features)}
+
+
+def payload_bytes(frames):
+    return sum(len(base64.b64encode(cv2.imencode(".jpg", frame)[1])) for frame in frames)
+
+
+def near_duplicates(frames, max_distance=6):
+    hashes = [int(phash(frame), 16) for frame in frames]
+    return sum(1 for i in range(len(hashes)) for j in range(i + 1, len(hashes))
+               if bin(hashes[i] ^ hashes[j]).count("1") <= max_distance)
+
+
+def live_latency(frames):
+    import google.generativeai as genai
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    model = genai.GenerativeModel("gemini-2.5-flash")
+    images = [{"mime_type": "image/jpeg", "data": base64.b64encode(cv2.imencode(".jpg", f)[1]).decode("utf-8")} for f in frames]
+    start = time.perf_counter()
+    model.generate_content(["Describe these surveillance frames in one sentence."] + images)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--keyframes", type=int, default=4)
+    parser.add_argument("--min-distance", type=float, default=0.02)
+    parser.add_argument("--base-latency", type=float, default=2.0, help="Modelled seconds per request")
+    parser.add_argument("--image-latency", type=float, default=0.4, help="Modelled seconds per image")
+    parser.add_argument("--live", action="store_true", help="Measure latency against the real Gemini API")
+    args = parser.parse_args()
+
+    input_fps, total_frames = probe_video(args.video)
+    frame_skip = max(1, int(input_fps / TARGET_FPS))
+    frames_per_chunk = int(CHUNK_DURATION_SECONDS * input_fps)
+    embeddings = load_embeddings(args.video)
+    print(f"{args.video}: {total_frames} frames at {input_fps:.1f} fps, "
+          f"descriptors: {'ResNet50 embeddings' if embeddings else 'color histograms'}")
+
+    totals = {name: {"frames": 0, "bytes": 0, "duplicates": 0, "latency": 0.0} for name in ("even", "diverse")}
+    chunk_count = 0
+    for numbers, frames in chunks(args.video, input_fps, total_frames, frame_skip, frames_per_chunk):
+        chunk_count += 1
+        has_features = np.array([int(n) in embeddings for n in numbers])
+        features = None
+        if has_features.all():
+            features = np.stack([embeddings[int(n)] for n in numbers])
+        scores = np.zeros(len(frames), dtype=np.float32)
+
+        picks = {
+            "even": select_even(len(frames), int(np.ceil(len(frames) / FRAME_INTERVAL))),
+            "diverse": select_keyframes(frames, scores, args.keyframes, "diverse", features=features,
+                                        has_features=has_features, min_distance=args.min_distance),
+        }
+        for name, indices in picks.items():
+            selected = frames[indices]
+            totals[name]["frames"] += len(selected)
+            totals[name]["bytes"] += payload_bytes(selected)
+            totals[name]["duplicates"] += near_duplicates(selected)
+            if args.live:
+                totals[name]["latency"] += live_latency(selected)
+            else:
+                totals[name]["latency"] += args.base_latency + args.image_latency * len(selected)
+
+    if not chunk_count:
+        print("No frames decoded")
+        return
+    print(f"{chunk_count} chunks, latency {'measured' if args.live else 'modelled'}")
+    print(f"{'selection':<10} {'frames/req':>10} {'KB/req':>8} {'dup pairs':>10} {'latency/req':>12}")
+    for name, t in totals.items():
+        print(f"{name:<10} {t['frames'] / chunk_count:>10.1f} {t['bytes'] / chunk_count / 1024:>8.1f} "
+              f"{t['duplicates']:>10} {t['latency'] / chunk_count:>11.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Live ingestion benchmark: replay a video file in real time as a stand-in
+camera and measure how quickly anomaly events come out.
+
+The file is attached exactly like POST /streams does (same detector,
+motion gate and models) and played at its own frame rate. Prints every
+event with its capture-to-event latency, then capture-to-score and
+capture-to-event percentiles, dropped frames, detection lag and peak RSS,
+and fails if the p95 capture-to-event latency exceeds --target-ms.
+
+--synthetic generates a video with bright flashes at known times, and
+--stand-in-models replaces ResNet50 + SVM by a brightness score (plus an
+optional simulated inference time), so the ingestion path can be measured
+without model weights.
+
+Usage:
+    python benchmarks/bench_live.py path/to/video.mp4 [--target-ms 2000]
+    python benchmarks/bench_live.py --synthetic 60 --stand-in-models [--model-latency-ms 150]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indexing_video
+from frame_buffer import IMAGENET_MEAN_BGR
+from live_stream import LiveStream
+from motion import MotionGate
+from smoothing import AnomalyIntervalDetector
+
+
+def make_synthetic(path, seconds, fps=25, flash_every=15.0, flash_seconds=3.0):
+    """Dark scene with a moving bar; a bright flash of flash_seconds every flash_every seconds."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (320, 240))
+    flashes = [t for t in np.arange(flash_every / 2, seconds - flash_seconds, flash_every)]
+    for i in range(int(seconds * fps)):
+        t = i / fps
+        bright = any(start <= t < start + flash_seconds for start in flashes)
+        frame = np.full((240, 320, 3), 230 if bright else 20, np.uint8)
+        x = (i * 3) % 300
+        frame[:, x:x + 20] = 128
+        writer.write(frame)
+    writer.release()
+    return [round(float(t), 2) for t in flashes]
+
+
+def use_stand_in_models(latency_ms):
+    class FeatureExtractor:
+        def predict(self, batch):
+            time.sleep(latency_ms / 1000.0)
+            brightness = (batch + IMAGENET_MEAN_BGR).mean(axis=(1, 2, 3)) / 255.0
+            return np.repeat(brightness[:, None], 2048, axis=1).astype(np.float32)
+
+    class SVM:
+        classes_ = np.array([0, 1])
+
+        def decision_function(self, features):
+            return features[:, 0] - 0.5
+
+    indexing_video.models.set("feature_extractor", FeatureExtractor())
+    indexing_video.models.set("svm", SVM())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path", nargs="?")
+    parser.add_argument("--synthetic", type=float, metavar="SECONDS", help="Generate a test video of this length")
+    parser.add_argument("--stand-in-models", action="store_true", help="Score frame brightness instead of ResNet50 + SVM")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="Simulated inference time per batch for the stand-in models")
+    parser.add_argument("--sample-fps", type=float, default=indexing_video.LIVE_SAMPLE_FPS)
+    parser.add_argument("--batch-size", type=int, default=indexing_video.LIVE_BATCH_SIZE)
+    parser.add_argument("--target-ms", type=float, default=2000.0)
+    args = parser.parse_args()
+    if not args.video_path and not args.synthetic:
+        parser.error("give a video path or --synthetic SECONDS")
+
+    flashes = None
+    video_path = args.video_path
+    if args.synthetic:
+        video_path = os.path.join(tempfile.mkdtemp(prefix="bench_live_"), "synthetic.avi")
+        flashes = make_synthetic(video_path, args.synthetic)
+        print(f"Synthetic video: {args.synthetic:.0f}s, flashes at {flashes}")
+    if args.stand_in_models:
+        use_stand_in_models(args.model_latency_ms)
+    else:
+        print("Loading models...")
+        indexing_video.models.get("feature_extractor")
+        indexing_video.models.get("svm")
+
+    stream = LiveStream(
+        "bench", video_path, indexing_video.score_batch,
+        AnomalyIntervalDetector(indexing_video.SMOOTHING_WINDOW, indexing_video.ANOMALY_ENTER_THRESHOLD,
+                                indexing_video.ANOMALY_EXIT_THRESHOLD, indexing_video.MIN_ANOMALY_FRAMES),
+        MotionGate(indexing_video.MOTION_GATE, indexing_video.MOTION_THRESHOLD),
+        sample_fps=args.sample_fps, realtime=True, batch_size=args.batch_size,
+        buffer_frames=indexing_video.LIVE_BUFFER_FRAMES, max_delay=indexing_video.LIVE_MAX_DELAY_SECONDS,
+        window_seconds=indexing_video.LIVE_WINDOW_SECONDS
+    )
+    started = time.monotonic()
+    stream.start()
+    max_lag = 0.0
+    while not stream.finished:
+        time.sleep(0.2)
+        max_lag = max(max_lag, stream.metrics()["lag_seconds"])
+    elapsed = time.monotonic() - started
+
+    print()
+    for event in stream.events:
+        if event["type"] == "anomaly_start":
+            print(f"  #{event['event_id']} start {event['start_time']:7.2f}s  latency {event['latency_ms']:7.1f} ms")
+        else:
+            print(f"  #{event['event_id']} end   {event['end_time']:7.2f}s")
+    metrics = stream.metrics()
+    print()
+    print(f"replayed in {elapsed:.1f}s, status {stream.state}" + (f" ({stream.error})" if stream.error else ""))
+    print(f"frames: decoded {metrics['frames_decoded']}, sampled {metrics['frames_sampled']}, "
+          f"scored {metrics['frames_scored']}, dropped {metrics['frames_dropped']}, batches {metrics['batches']}")
+    for key in ("capture_to_score_ms", "capture_to_event_ms"):
+        m = metrics[key]
+        print(f"{key:>20}: p50 {m['p50']} / p95 {m['p95']} / max {m['max']} ms (n={m['count']})")
+    print(f"{'max lag':>20}: {max_lag * 1000:.1f} ms")
+    print(f"{'peak RSS':>20}: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    starts = [e for e in stream.events if e["type"] == "anomaly_start"]
+    failures = []
+    if flashes is not None:
+        matched = sum(any(abs(e["start_time"] - t) < 1.0 for e in starts) for t in flashes)
+        print(f"{'flashes detected':>20}: {matched}/{len(flashes)}")
+        if matched != len(flashes) or len(starts) != len(flashes):
+            failures.append(f"{len(starts)} events for {len(flashes)} flashes")
+    p95 = metrics["capture_to_event_ms"]["p95"]
+    if p95 is not None and p95 > args.target_ms:
+        failures.append(f"p95 capture-to-event {p95} ms exceeds {args.target_ms:.0f} ms")
+    print("FAIL: " + "; ".join(failures) if failures else f"OK: events within {args.target_ms:.0f} ms of capture")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Pipeline benchmark: sequential (one thread) vs. overlapped stages.
+
+Runs process_video_task twice on the same video with Gemini disabled and
+prints the per-stage timing report and queue depths of each run.
+
+Usage:
+    python benchmarks/bench_pipeline.py path/to/video.mp4 [--queue-size 4]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indexing_video
+from pipeline import format_report
+
+
+def run(video_path, threaded, queue_size):
+    indexing_video.PIPELINE_THREADED = threaded
+    indexing_video.PIPELINE_QUEUE_SIZE = queue_size
+    indexing_video.process_video_task(video_path)
+
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    analysis_path = os.path.join(indexing_video.ANOMALY_FOLDER, video_name, f"analysis_{video_name}.json")
+    with open(analysis_path, "r") as f:
+        return json.load(f)["processing_stats"]["pipeline"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path")
+    parser.add_argument("--queue-size", type=int, default=indexing_video.PIPELINE_QUEUE_SIZE)
+    args = parser.parse_args()
+
+    # Measure the local pipeline only, and keep artifacts out of anomaly/
+    indexing_video.models.set("gemini", None)
+    indexing_video.models.set("gemini_flash", None)
+    indexing_video.ANOMALY_FOLDER = tempfile.mkdtemp(prefix="bench_pipeline_")
+
+    sequential = run(args.video_path, False, args.queue_size)
+    threaded = run(args.video_path, True, args.queue_size)
+
+    print()
+    print(format_report(sequential))
+    print()
+    print(format_report(threaded))
+    print()
+    speedup = sequential["wall_seconds"] / threaded["wall_seconds"] if threaded["wall_seconds"] > 0 else 0.0
+    print(f"Wall-clock speedup: {speedup:.2f}x ({sequential['wall_seconds']:.2f}s -> {threaded['wall_seconds']:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Job scheduler benchmark: API responsiveness while several uploads are
+processed, and a check of priorities, queue positions and cancellation.
+
+Serves the app with uvicorn on a local port, with the random-weight
+ConvNet of bench_batching.py (ONNX Runtime) and a random SVM standing in
+for ResNet50 and the trained SVM, and a fake Gemini model, so no weights
+or API key are needed. --videos distinct synthetic videos are uploaded at
+once, and /health and /jobs are probed every 20 ms until every job is
+done, with processing run:
+
+    unbounded threads   one thread per upload in the server process, as
+                        with FastAPI BackgroundTasks before
+    threads             JOB_CONCURRENCY threads in the server process
+    processes           JOB_CONCURRENCY job worker processes
+
+The check then fills the queue behind a running job with low-priority
+uploads, adds a high-priority one, cancels a queued and the running job,
+and verifies the high-priority job started first and the cancelled ones
+ended as cancelled.
+
+Usage:
+    python benchmarks/bench_scheduler.py [--videos 6] [--chunks 6] [--concurrency 2]
+"""
+import argparse
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("MODEL_LOADING", "lazy")
+os.environ.update(GEMINI_CACHE="0", GEMINI_REQUESTS_PER_MINUTE="0", RENDITIONS="0", CHECKPOINTS="0", INFERENCE_BATCH_SIZE="32")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+import uvicorn
+
+import indexing_video as iv
+from bench_chunk_workers import make_video, stand_in_models
+from job_registry import COMPLETE, CANCELLED, TERMINAL_STATES
+from job_scheduler import JobScheduler
+
+
+def install_stand_ins(work):
+    """Stand-in models and folders, in the server and in every job worker."""
+    import json
+
+    import joblib
+    from inference_backends import create_backend
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    class GeminiModel:
+        model_name = "fake-gemini"
+
+        def generate_content(self, content):
+            return Response(json.dumps({"overall_scene": {"critical_level": "High", "chunk_time_range": ""}}))
+
+    iv.UPLOAD_FOLDER = os.path.join(work, "uploaded_videos")
+    iv.ANOMALY_FOLDER = os.path.join(work, "anomaly")
+    iv.models.set("feature_extractor", create_backend("onnx", work, mixed_float16=False))
+    iv.models.set("svm", joblib.load(os.path.join(work, "svm_model.pkl")))
+    iv.models.set("gemini", GeminiModel())
+    iv.models.set("gemini_flash", None)
+
+
+def init_bench_worker():
+    install_stand_ins(os.environ["BENCH_SCHEDULER_WORK"])
+    iv.init_job_worker()
+
+
+def run_bench_job(job_id, args, cancel, emit):
+    iv.run_job(job_id, args, cancel, emit)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def probe(base, stop, latencies):
+    with httpx.Client(base_url=base, timeout=60) as client:
+        while not stop.is_set():
+            for route in ("/health", "/jobs"):
+                started = time.perf_counter()
+                client.get(route)
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            time.sleep(0.02)
+
+
+def upload(client, path, priority="normal"):
+    with open(path, "rb") as f:
+        response = client.post("/process_video", params={"priority": priority}, files={"file": (os.path.basename(path), f, "video/avi")})
+    response.raise_for_status()
+    return response.json()
+
+
+def wait_for(client, job_ids, timeout=600):
+    """Final job dicts, and the order in which the jobs left the queue."""
+    deadline = time.monotonic() + timeout
+    started = []
+    while time.monotonic() < deadline:
+        jobs = {job["job_id"]: job for job in client.get("/jobs").json()["jobs"]}
+        started += [job_id for job_id in job_ids if job_id not in started and jobs[job_id]["status"] != "queued"]
+        if all(jobs[job_id]["status"] in TERMINAL_STATES for job_id in job_ids):
+            return jobs, started
+        time.sleep(0.05)
+    raise TimeoutError("jobs did not finish")
+
+
+def use_scheduler(concurrency, processes, queue_size=50):
+    iv.job_scheduler.shutdown()
+    iv.job_scheduler = JobScheduler(run_bench_job, iv.handle_job_event, concurrency=concurrency, max_queued=queue_size,
+                                    processes=processes, initializer=init_bench_worker, call_handler=iv.handle_job_call).start()
+    if processes:
+        # Wait until the workers have loaded their models
+        scratch = [iv.jobs.create("warm-up", "warm-up", None) for _ in range(concurrency)]
+        for job in scratch:
+            iv.job_scheduler.submit(job.id, (os.devnull, "warm-up", "warm-up"))
+        while not all(job.finished for job in scratch):
+            time.sleep(0.05)
+
+
+def run(base, videos, concurrency, processes):
+    use_scheduler(concurrency, processes)
+    latencies = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(base, stop, latencies))
+    prober.start()
+    started = time.perf_counter()
+    with httpx.Client(base_url=base, timeout=600) as client:
+        job_ids = [upload(client, path)["job_id"] for path in videos]
+        jobs, _ = wait_for(client, job_ids)
+    seconds = time.perf_counter() - started
+    stop.set()
+    prober.join()
+    done = sum(jobs[job_id]["status"] == COMPLETE for job_id in job_ids)
+    return seconds, np.array(latencies), done
+
+
+def check_scheduling(base, videos):
+    """Priorities, queue positions and cancellation with one worker process."""
+    use_scheduler(1, True, queue_size=len(videos) - 1)  # One running, the rest fill the queue
+    failures = []
+    with httpx.Client(base_url=base, timeout=600) as client:
+        running = upload(client, videos[0], "low")
+        low = [upload(client, path, "low") for path in videos[1:-1]]
+        high = upload(client, videos[-1], "high")
+        print(f"queue positions: low {[job['queue_position'] for job in low]}, then high {high['queue_position']}")
+        if high["queue_position"] != 1:
+            failures.append("the high-priority upload did not go to the head of the queue")
+        rejected = client.post("/process_video", files={"file": ("extra.avi", b"0" * 1024, "video/avi")})
+        if rejected.status_code != 429:
+            failures.append(f"upload to a full queue returned {rejected.status_code}, not 429")
+        cancelled_queued = client.delete(f"/jobs/{low[0]['job_id']}").json()
+        while client.get(f"/jobs/{running['job_id']}").json()["status"] == "queued":
+            time.sleep(0.05)
+        time.sleep(0.5)
+        cancelled_running = client.delete(f"/jobs/{running['job_id']}").json()
+        print(f"cancel: queued job -> {cancelled_queued['cancel']}, running job -> {cancelled_running['cancel']}")
+        jobs, started = wait_for(client, [running["job_id"], high["job_id"]] + [job["job_id"] for job in low[1:]])
+        print(f"states: running {jobs[running['job_id']]['status']}, cancelled queued {jobs[low[0]['job_id']]['status']}, "
+              f"high {jobs[high['job_id']]['status']}, low {[jobs[job['job_id']]['status'] for job in low[1:]]}")
+        if jobs[running["job_id"]]["status"] != CANCELLED or jobs[low[0]["job_id"]]["status"] != CANCELLED:
+            failures.append("a cancelled job did not end as cancelled")
+        if started[:2] != [running["job_id"], high["job_id"]]:
+            failures.append("the high-priority job did not start first")
+        if any(jobs[job["job_id"]]["status"] != COMPLETE for job in low[1:] + [high]):
+            failures.append("some job that was not cancelled did not complete")
+        print(f"scheduler: {client.get('/scheduler/stats').json()}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=6)
+    parser.add_argument("--chunks", type=int, default=6, help="Length of each synthetic video, in chunks")
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_scheduler_")
+    os.environ["BENCH_SCHEDULER_WORK"] = work
+    stand_in_models(work)
+    install_stand_ins(work)
+    os.makedirs(iv.UPLOAD_FOLDER)
+    iv.upload_index = iv.UploadIndex(iv.UPLOAD_FOLDER)
+    source = os.path.join(work, "source.avi")
+    make_video(source, args.chunks)
+
+    def copies(tag):
+        # Distinct bytes per upload, so content-hash dedup does not skip any
+        paths = []
+        for i in range(args.videos):
+            path = os.path.join(work, f"{tag}_{i}.avi")
+            shutil.copyfile(source, path)
+            with open(path, "ab") as f:
+                f.write(f"{tag}{i}".encode())
+            paths.append(path)
+        return paths
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(iv.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+    print(f"{args.videos} uploads of {args.chunks * 10}s, {os.cpu_count()} cores, JOB_CONCURRENCY={args.concurrency}")
+    print(f"{'mode':>18} {'seconds':>8} {'done':>5} {'API p50 ms':>11} {'p95 ms':>8} {'max ms':>8}")
+    for name, concurrency, processes in (("unbounded threads", args.videos, False),
+                                         ("threads", args.concurrency, False),
+                                         ("processes", args.concurrency, True)):
+        seconds, latencies, done = run(base, copies(name.replace(" ", "_")), concurrency, processes)
+        print(f"{name:>18} {seconds:>8.2f} {done:>5} {np.percentile(latencies, 50):>11.1f} {np.percentile(latencies, 95):>8.1f} "
+              f"{latencies.max():>8.1f}")
+
+    failures = check_scheduling(base, copies("check")[:5])
+    iv.job_scheduler.shutdown()
+    server.should_exit = True
+    shutil.rmtree(work, ignore_errors=True)
+    print("FAIL: " + "; ".join(failures) if failures else "OK: priorities, queue positions and cancellation behave")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Clip extraction benchmark: full re-encode vs. keyframe-aware stream copy,
+request coalescing and event-loop responsiveness.
+
+Cuts --clips random ranges from the video with the fast path off (the
+previous behaviour) and on, each into its own empty cache, and prints
+the time per clip, the duration error against the requested range and
+whether the clip decodes without errors. Then fires --concurrent
+overlapping requests at once and reports how many ffmpeg jobs actually
+ran, and how late a 10 ms asyncio timer fired meanwhile. Last, the first
+view of clips that ingest already rendered with prepare() is compared
+with cutting them on demand.
+
+Usage:
+    python benchmarks/bench_segments.py path/to/video.mp4 [--clips 10] [--length 8]
+    python benchmarks/bench_segments.py --synthetic 120
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segments import SegmentCache, SegmentExtractor
+
+
+def make_synthetic(path, seconds):
+    """H.264 test pattern with a 2 s GOP and an AAC tone."""
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=25",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+        "-t", str(seconds), "-c:v", "libx264", "-preset", "veryfast", "-g", "50",
+        "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def duration(path):
+    out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip())
+
+
+def decodes_cleanly(path):
+    result = subprocess.run(["ffmpeg", "-v", "error", "-i", path, "-f", "null", "-"], capture_output=True, text=True)
+    return result.returncode == 0 and not result.stderr.strip()
+
+
+async def loop_stall(task):
+    """Worst lateness (ms) of a 10 ms timer while task runs."""
+    worst = 0.0
+    while not task.done():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, (time.perf_counter() - started - 0.01) * 1000.0)
+    return worst
+
+
+async def cut_all(video, ranges, fast_path, work):
+    folder = os.path.join(work, "fast" if fast_path else "full")
+    extractor = SegmentExtractor(SegmentCache(folder, 1 << 40), concurrency=1, fast_path=fast_path, coalesce_slack=0.0)
+    rows = []
+    for start, end in ranges:
+        started = time.perf_counter()
+        task = asyncio.ensure_future(extractor.get(video, "bench", start, end))
+        stall = await loop_stall(task)
+        path, _, _, method = await task
+        rows.append((time.perf_counter() - started, abs(duration(path) - (end - start)), decodes_cleanly(path), method, stall))
+    return rows
+
+
+def summarize(name, rows):
+    seconds = np.array([r[0] for r in rows])
+    errors = np.array([r[1] for r in rows])
+    methods = {m: sum(r[3] == m for r in rows) for m in ("fast", "full")}
+    print(f"{name:>14}: {seconds.mean():6.2f}s per clip (max {seconds.max():.2f}s), duration error mean {errors.mean() * 1000:.0f} ms"
+          f" / max {errors.max() * 1000:.0f} ms, clean decodes {sum(r[2] for r in rows)}/{len(rows)}, {methods},"
+          f" worst loop stall {max(r[4] for r in rows):.1f} ms")
+    return seconds.mean()
+
+
+async def coalescing(video, work, concurrent, length):
+    extractor = SegmentExtractor(SegmentCache(os.path.join(work, "coalesce"), 1 << 40), concurrency=2, coalesce_slack=2.0)
+    # Overlapping requests around one event: the widest comes first, the rest lie inside it
+    base = 10.0
+    ranges = [(base, base + length)] + [(base + random.uniform(0, 1.0), base + length - random.uniform(0, 1.0)) for _ in range(concurrent - 1)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(extractor.get(video, "bench", s, e) for s, e in ranges))
+    seconds = time.perf_counter() - started
+    sources = {}
+    for _, _, _, source in results:
+        sources[source] = sources.get(source, 0) + 1
+    jobs = extractor.counts["fast"] + extractor.counts["full"]
+    print(f"{'coalescing':>14}: {concurrent} overlapping requests -> {jobs} ffmpeg job(s) in {seconds:.2f}s, served as {sources}")
+
+
+async def first_view(video, work, ranges):
+    extractor = SegmentExtractor(SegmentCache(os.path.join(work, "prepared"), 1 << 40))
+    started = time.perf_counter()
+    for start, end in ranges:
+        await extractor.prepare(video, "bench", start, end)
+    prepare_seconds = time.perf_counter() - started
+    views = []
+    for start, end in ranges:
+        started = time.perf_counter()
+        _, _, _, source = await extractor.get(video, "bench", start, end)
+        views.append((time.perf_counter() - started) * 1000.0)
+    print(f"{'first view':>14}: {np.mean(views):.2f} ms per clip after prepare() ({prepare_seconds / len(ranges):.2f}s per"
+          f" rendition in the background), served from {source}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path", nargs="?")
+    parser.add_argument("--synthetic", type=float, metavar="SECONDS")
+    parser.add_argument("--clips", type=int, default=10)
+    parser.add_argument("--length", type=float, default=8.0, help="Clip length in seconds")
+    parser.add_argument("--concurrent", type=int, default=8)
+    args = parser.parse_args()
+    if not args.video_path and not args.synthetic:
+        parser.error("give a video path or --synthetic SECONDS")
+
+    work = tempfile.mkdtemp(prefix="bench_segments_")
+    video = args.video_path
+    if args.synthetic:
+        video = os.path.join(work, "synthetic.mp4")
+        make_synthetic(video, args.synthetic)
+    total = duration(video)
+    random.seed(0)
+    ranges = []
+    for _ in range(args.clips):
+        start = round(random.uniform(0, max(0.0, total - args.length - 0.5)), 1)
+        ranges.append((start, round(start + args.length, 1)))
+    print(f"{os.path.basename(video)}: {total:.1f}s, {args.clips} clips of {args.length:.1f}s")
+
+    try:
+        full = summarize("full re-encode", await cut_all(video, ranges, False, work))
+        fast = summarize("fast path", await cut_all(video, ranges, True, work))
+        print(f"{'speedup':>14}: {full / fast:.1f}x")
+        await coalescing(video, work, args.concurrent, args.length)
+        await first_view(video, work, ranges)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
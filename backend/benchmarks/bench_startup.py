@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Service startup benchmark: eager model loading vs. background warm-up.
+
+Starts a fresh interpreter per run, imports indexing_video and runs its
+startup hook, then waits for every model. Reports the time until the app
+accepts uploads (import + startup hook, what uvicorn waits for) and until
+/ready would report ready. "cold" runs use an empty model cache, "warm"
+runs load the serialized model written by the cold run.
+
+Usage:
+    python benchmarks/bench_startup.py [--modes eager background] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import indexing_video
+indexing_video.start_model_warmup()
+accepting = time.perf_counter() - start
+indexing_video.models.wait()
+ready = time.perf_counter() - start
+print("BENCH " + json.dumps({{"accepting": accepting, "ready": ready, "status": indexing_video.models.status()}}))
+"""
+
+
+def run(mode, cache_dir):
+    env = dict(os.environ, MODEL_LOADING=mode, MODEL_CACHE_DIR=cache_dir)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD.format(backend=BACKEND_DIR)], env=env,
+                            capture_output=True, text=True, cwd=BACKEND_DIR)
+    total = time.perf_counter() - start
+    for line in result.stdout.splitlines():
+        if line.startswith("BENCH "):
+            data = json.loads(line[len("BENCH "):])
+            data["process"] = total
+            return data
+    raise RuntimeError(f"Child run failed:\n{result.stdout}\n{result.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["eager", "background"], choices=["eager", "background", "lazy"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<11} {'cache':<5} {'accepting uploads':>18} {'ready':>8}   model load times")
+    for mode in args.modes:
+        cache_dir = tempfile.mkdtemp(prefix="bench_startup_")
+        for i in range(args.repeat):
+            data = run(mode, cache_dir)
+            loads = ", ".join(f"{name} {m['load_seconds']}s" for name, m in data["status"]["models"].items()
+                              if m["load_seconds"] is not None)
+            print(f"{mode:<11} {'cold' if i == 0 else 'warm':<5} {data['accepting']:>17.2f}s {data['ready']:>7.2f}s   {loads}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Upload benchmark: throughput of POST /process_video and event-loop
+latency while a large upload is in flight.
+
+Serves the app with uvicorn on a local port, with processing stubbed out,
+and uploads a generated file of --size-mb. During each upload a probe
+requests /health every 20 ms; its response times show how long the event
+loop was blocked. The streaming endpoint is compared with the previous
+implementation (shutil.copyfileobj on the event loop), mounted on a
+benchmark-only route. Finally the same file is uploaded again to time the
+content-hash dedup short-circuit.
+
+Usage:
+    python benchmarks/bench_upload.py [--size-mb 1024] [--chunk-kb 1024]
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("MODEL_LOADING", "lazy")
+os.environ.setdefault("JOB_PROCESSES", "0")  # Processing is stubbed in this process
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import File, UploadFile
+
+import indexing_video
+from job_registry import STARTING, PROCESSING, FINALIZING, COMPLETE
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_file(path, size_mb):
+    block = np.random.default_rng(0).integers(0, 256, 1 << 20, dtype=np.uint8).tobytes()
+    with open(path, "wb") as f:
+        for i in range(size_mb):
+            f.write(block[i % 7:] + block[:i % 7])  # Distinct blocks, cheap to generate
+
+
+def finish_without_processing(video_path, save_embeddings=None, job_id=None):
+    """Stand-in for process_video_task: completes the job with an empty analysis."""
+    job = indexing_video.jobs.get(job_id)
+    os.makedirs(job.folder, exist_ok=True)
+    with open(os.path.join(job.folder, f"analysis_{job.video_name}.json"), "w") as f:
+        json.dump({"anomalous_chunks": []}, f)
+    for state in (STARTING, PROCESSING, FINALIZING, COMPLETE):
+        indexing_video.jobs.update(job_id, state=state)
+
+
+def probe(base, stop, latencies):
+    with httpx.Client(base_url=base, timeout=60) as client:
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get("/health")
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            time.sleep(0.02)
+
+
+def upload(base, route, path):
+    latencies = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(base, stop, latencies))
+    prober.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    with open(path, "rb") as f, httpx.Client(base_url=base, timeout=600) as client:
+        response = client.post(route, files={"file": (os.path.basename(path), f, "video/mp4")})
+    seconds = time.perf_counter() - started
+    stop.set()
+    prober.join()
+    response.raise_for_status()
+    return seconds, np.array(latencies), response.json()
+
+
+def report(name, size_mb, seconds, latencies):
+    print(f"{name:>22}: {size_mb / seconds:8.1f} MB/s   /health p50 {np.percentile(latencies, 50):7.1f} ms"
+          f"   p95 {np.percentile(latencies, 95):7.1f} ms   max {latencies.max():8.1f} ms   ({len(latencies)} probes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--chunk-kb", type=int, default=indexing_video.UPLOAD_CHUNK_BYTES // 1024)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_upload_")
+    indexing_video.UPLOAD_FOLDER = os.path.join(work, "uploaded_videos")
+    indexing_video.ANOMALY_FOLDER = os.path.join(work, "anomaly")
+    os.makedirs(indexing_video.UPLOAD_FOLDER)
+    indexing_video.upload_index = indexing_video.UploadIndex(indexing_video.UPLOAD_FOLDER)
+    indexing_video.UPLOAD_CHUNK_BYTES = args.chunk_kb * 1024
+    indexing_video.process_video_task = finish_without_processing  # Measure the upload only
+
+    @indexing_video.app.post("/bench/blocking_upload")
+    async def blocking_upload(file: UploadFile = File(...)):
+        # The previous /process_video body: a blocking copy on the event loop
+        with open(os.path.join(work, "blocking_" + file.filename), "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        return {"filename": file.filename}
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(indexing_video.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+
+    path = os.path.join(work, "upload.mp4")
+    make_file(path, args.size_mb)
+    print(f"{args.size_mb} MB upload, {args.chunk_kb} KB chunks")
+
+    seconds, latencies, _ = upload(base, "/bench/blocking_upload", path)
+    report("blocking copy", args.size_mb, seconds, latencies)
+    seconds, latencies, first = upload(base, "/process_video", path)
+    report("streaming + sha256", args.size_mb, seconds, latencies)
+    seconds, latencies, second = upload(base, "/process_video", path)
+    report("duplicate upload", args.size_mb, seconds, latencies)
+    print(f"sha256 {first['sha256'][:16]}..., server-side copy {first['upload_seconds']:.2f}s; "
+          f"second upload duplicate={second['duplicate']} ({second['message']})")
+
+    server.should_exit = True
+    shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Gemini cache check: entries written by another instance or process are hits.
+
+Opens two GeminiCache instances on one folder before anything is cached,
+puts an entry through the first and reads it through the second, then
+has a separate process put an entry and reads it through both. It also
+checks that an unknown key is a miss, and that an entry the first
+instance evicted is a miss in the second and drops out of its index.
+
+Usage:
+    python benchmarks/check_gemini_cache.py
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_cache import GeminiCache
+
+
+def put_in_other_process(folder):
+    GeminiCache(folder).put("from-process", {"summary": "written by another process"})
+
+
+def main():
+    folder = tempfile.mkdtemp(prefix="check_gemini_cache_")
+    failures = []
+    a = GeminiCache(folder, max_bytes=200)
+    b = GeminiCache(folder, max_bytes=200)
+
+    a.put("k", {"summary": "written by a"})
+    if b.get("k") != {"summary": "written by a"}:
+        failures.append("an entry put through one instance is a miss in another")
+
+    process = multiprocessing.get_context("spawn").Process(target=put_in_other_process, args=(folder,))
+    process.start()
+    process.join()
+    for name, cache in (("a", a), ("b", b)):
+        if cache.get("from-process") != {"summary": "written by another process"}:
+            failures.append(f"an entry put by another process is a miss in {name}")
+
+    if b.get("unknown") is not None:
+        failures.append("an unknown key is a hit")
+
+    # Entries of ~50 bytes under a 200-byte limit: a evicts "k" and "from-process"
+    for i in range(4):
+        a.put(f"filler-{i}", {"summary": "x" * 20})
+    if os.path.exists(os.path.join(folder, "k.json")):
+        failures.append("a did not evict its oldest entry")
+    if b.get("k") is not None:
+        failures.append("an entry evicted by another instance is still a hit")
+    if "k" in b._entries:
+        failures.append("an entry evicted by another instance stays in the index")
+
+    stats = b.stats()
+    print(f"second instance: {stats}")
+    if (stats["hits"], stats["misses"]) != (2, 2):
+        failures.append(f"second instance counted {stats['hits']} hits and {stats['misses']} misses, expected 2 and 2")
+
+    shutil.rmtree(folder, ignore_errors=True)
+    print("FAIL: " + "; ".join(failures) if failures else "OK: entries of other instances and processes are read from disk")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
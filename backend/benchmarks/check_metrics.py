@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Metrics check: /metrics of both services and the per-video stage breakdown.
+
+Serves the analysis app with uvicorn and the stand-in models of
+bench_scheduler.py (no weights or API key), with an SVM that flags every
+other frame batch so some chunks go to the fake Gemini model, processes
+--videos synthetic uploads in a job worker process, then scrapes /metrics and checks that
+the exposition parses, that every histogram is consistent (cumulative
+buckets, +Inf bucket equal to the count), that the counters recorded in
+the worker process reached the server (decoded frames, chunks, model
+batches, SVM calls, one Gemini request per anomalous chunk) and that each
+analysis JSON carries processing_stats.stages and .source. The search
+service's /metrics is checked after a query. Finally it prints the cost
+of one histogram observation and of one scrape.
+
+Usage:
+    python benchmarks/check_metrics.py [--videos 2] [--chunks 4]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+os.environ.setdefault("MODEL_LOADING", "lazy")
+os.environ.update(GEMINI_CACHE="0", GEMINI_REQUESTS_PER_MINUTE="0", RENDITIONS="0", CHECKPOINTS="0", INFERENCE_BATCH_SIZE="32")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+import uvicorn
+
+import indexing_video as iv
+from bench_chunk_workers import make_video, stand_in_models
+from bench_scheduler import install_stand_ins, free_port, upload, wait_for, run_bench_job
+from job_registry import COMPLETE
+from job_scheduler import JobScheduler
+from metrics import MetricsRegistry
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+class AlternatingSVM:
+    """Scores every other call's frames as anomalous."""
+    classes_ = np.array([0, 1])
+
+    def __init__(self):
+        self.calls = 0
+
+    def decision_function(self, features):
+        self.calls += 1
+        return np.full(len(features), 1.0 if self.calls % 2 else -1.0)
+
+
+def init_check_worker():
+    install_stand_ins(os.environ["BENCH_SCHEDULER_WORK"])
+    iv.models.set("svm", AlternatingSVM())
+    iv.init_job_worker()
+
+
+def parse(text):
+    """{name: [(labels dict, value)]}; raises on a line that is not valid exposition."""
+    samples = defaultdict(list)
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        if match is None:
+            raise ValueError(f"Bad sample line: {line!r}")
+        samples[match.group(1)].append((dict(LABEL.findall(match.group(3) or "")), float(match.group(4))))
+    return samples
+
+
+def total(samples, name, **labels):
+    return sum(value for found, value in samples.get(name, []) if all(found.get(k) == v for k, v in labels.items()))
+
+
+def histogram_problems(samples):
+    problems = []
+    for name in [name[:-len("_bucket")] for name in samples if name.endswith("_bucket")]:
+        series = defaultdict(list)
+        for labels, value in samples[name + "_bucket"]:
+            key = tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+            series[key].append((float(labels["le"]), value))
+        for key, buckets in series.items():
+            counts = [value for _, value in sorted(buckets)]
+            count = total(samples, name + "_count", **dict(key))
+            if counts != sorted(counts) or counts[-1] != count:
+                problems.append(f"{name}{dict(key)}: buckets {counts}, count {count}")
+    return problems
+
+
+def check_search(failures):
+    import search
+    from fastapi.testclient import TestClient
+
+    with TestClient(search.app) as client:
+        client.get("/search", params={"query": "person"})
+        client.get("/index_stats")
+        text = client.get("/metrics").text
+    samples = parse(text)
+    failures += [f"search: {problem}" for problem in histogram_problems(samples)]
+    if total(samples, "search_query_seconds_count") != 1 or total(samples, "search_http_requests_total", route="/search") != 1:
+        failures.append("search: the query was not counted")
+    print(f"search /metrics: {len(samples)} series, segments {total(samples, 'search_segments'):.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=2)
+    parser.add_argument("--chunks", type=int, default=4)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="check_metrics_")
+    os.environ["BENCH_SCHEDULER_WORK"] = work
+    stand_in_models(work)
+    install_stand_ins(work)
+    os.makedirs(iv.UPLOAD_FOLDER)
+    iv.upload_index = iv.UploadIndex(iv.UPLOAD_FOLDER)
+    videos = []
+    for i in range(args.videos):
+        path = os.path.join(work, f"metrics_{i}.avi")
+        make_video(path, args.chunks + i)
+        videos.append(path)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(iv.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    # Metrics are recorded in the job worker process and forwarded to the server
+    iv.job_scheduler.shutdown()
+    iv.job_scheduler = JobScheduler(run_bench_job, iv.handle_job_event, concurrency=1, processes=True,
+                                    initializer=init_check_worker, call_handler=iv.handle_job_call).start()
+
+    failures = []
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        job_ids = [upload(client, path)["job_id"] for path in videos]
+        jobs, _ = wait_for(client, job_ids)
+        if any(jobs[job_id]["status"] != COMPLETE for job_id in job_ids):
+            failures.append("some video did not complete")
+        text = client.get("/metrics").text
+
+    analyses = []
+    for path in videos:
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(os.path.join(iv.ANOMALY_FOLDER, name, f"analysis_{name}.json"), "r") as f:
+            analyses.append(json.load(f))
+    samples = parse(text)
+    failures += histogram_problems(samples)
+
+    chunks = sum(analysis["video_metadata"]["total_chunks"] for analysis in analyses)
+    anomalous = sum(analysis["video_metadata"]["anomalous_chunks_count"] for analysis in analyses)
+    decoded = sum(analysis["processing_stats"]["stages"]["decode"]["frames"] for analysis in analyses)
+    counts = {
+        "decoded frames": (total(samples, "video_analysis_decoded_frames_total"), decoded),
+        "chunks": (total(samples, "video_analysis_chunks_total"), chunks),
+        "anomalous chunks": (total(samples, "video_analysis_chunks_total", result="anomalous"), anomalous),
+        "Gemini requests": (total(samples, "video_analysis_gemini_request_seconds_count", call="chunk"), anomalous),
+        "keyframe JPEGs": (total(samples, "video_analysis_jpeg_write_seconds_count", kind="keyframe"),
+                           sum(analysis["processing_stats"]["stages"].get("keyframe_jpeg", {}).get("count", 0) for analysis in analyses)),
+        "uploads": (total(samples, "video_analysis_http_requests_total", route="/process_video"), len(videos)),
+    }
+    if not anomalous:
+        failures.append("no chunk was anomalous, so Gemini and keyframe metrics went unchecked")
+    for what, (scraped, expected) in counts.items():
+        print(f"{what:>17}: /metrics {scraped:.0f}, expected {expected}")
+        if scraped != expected:
+            failures.append(f"/metrics has {scraped:.0f} {what}, expected {expected}")
+    for name in ("video_analysis_feature_extractor_batch_seconds_count", "video_analysis_svm_seconds_count",
+                 "video_analysis_stage_seconds_count", "video_analysis_pipeline_queue_depth_count"):
+        if not total(samples, name):
+            failures.append(f"{name} is empty")
+
+    for analysis in analyses:
+        stats = analysis["processing_stats"]
+        missing = {"decode", "motion", "preprocess", "inference", "artifacts", "svm"} - set(stats["stages"])
+        if missing or not stats["source"]["width"]:
+            failures.append(f"{analysis['video_metadata']['filename']}: stage breakdown lacks {sorted(missing)} or the source is unknown")
+    stats = analyses[0]["processing_stats"]
+    print(f"source: {stats['source']}")
+    print("stages of the first video:")
+    for stage, row in stats["stages"].items():
+        print(f"  {stage:<14} {row['count']:>5} calls {row['seconds']:>8.3f}s  mean {row['mean_ms']:>8.2f} ms  max {row['max_ms']:>8.2f} ms"
+              + (f"  {row['frames_per_second']} frames/s" if "frames_per_second" in row else ""))
+
+    check_search(failures)
+
+    # Instrumentation cost
+    registry = MetricsRegistry()
+    histogram = registry.histogram("cost_seconds", "Observation cost", ("stage",)).labels(stage="decode")
+    started = time.perf_counter()
+    for i in range(100000):
+        histogram.observe(i * 1e-5)
+    observe_us = (time.perf_counter() - started) / 100000 * 1e6
+    started = time.perf_counter()
+    for _ in range(20):
+        iv.metrics.render()
+    print(f"cost: {observe_us:.2f} us per histogram observation, {(time.perf_counter() - started) / 20 * 1000:.2f} ms per scrape "
+          f"({len(text) / 1024:.0f} KB)")
+
+    iv.job_scheduler.shutdown()
+    server.should_exit = True
+    shutil.rmtree(work, ignore_errors=True)
+    print("FAIL: " + "; ".join(failures) if failures else "OK: both /metrics endpoints parse and agree with the analysis files")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
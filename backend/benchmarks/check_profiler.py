@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Profiler check: /jobs/{job_id}/profile and /profile of the analysis app.
+
+Serves the app with uvicorn and the stand-in models of bench_scheduler.py
+(no weights or API key) and processes a synthetic upload of --chunks
+chunks three times in a job worker process: once unprofiled, once with a
+profile started while it runs (until it ends), and once more unprofiled.
+It checks that the profile reached the server, that its collapsed stacks
+and summary are in the job's folder, that every collapsed line parses and
+the counts add up to the samples, and that the samples show the job
+(process_video_task on the stack). It then profiles a job running on a
+scheduler thread, where only that job's threads may appear, and the
+server process for one second, and prints the profiled job's time
+against the unprofiled ones and the sampler's own CPU share.
+
+Usage:
+    python benchmarks/check_profiler.py [--chunks 8] [--interval-ms 5]
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("MODEL_LOADING", "lazy")
+os.environ.update(GEMINI_CACHE="0", GEMINI_REQUESTS_PER_MINUTE="0", RENDITIONS="0", CHECKPOINTS="0", INFERENCE_BATCH_SIZE="32")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+
+import indexing_video as iv
+from bench_chunk_workers import make_video, stand_in_models
+from bench_scheduler import install_stand_ins, init_bench_worker, free_port, upload, wait_for, run_bench_job
+from job_registry import COMPLETE, TERMINAL_STATES
+from job_scheduler import JobScheduler
+
+COLLAPSED_LINE = re.compile(r"^([^;]+(?:;[^;]+)*) (\d+)$")
+
+
+def use_scheduler(processes):
+    iv.job_scheduler.shutdown()
+    iv.job_scheduler = JobScheduler(run_bench_job, iv.handle_job_event, concurrency=1, processes=processes,
+                                    initializer=init_bench_worker, signal_handler=iv.handle_job_signal,
+                                    call_handler=iv.handle_job_call).start()
+
+
+def run_job(client, path, profile=None):
+    """Process path, profiling it once it runs when profile is query params; returns (job, seconds)."""
+    job_id = upload(client, path)["job_id"]
+    if profile is not None:
+        while client.get(f"/jobs/{job_id}").json()["status"] == "queued":
+            time.sleep(0.02)
+        response = client.post(f"/jobs/{job_id}/profile", params=profile)
+        response.raise_for_status()
+    jobs, _ = wait_for(client, [job_id])
+    job = jobs[job_id]
+    return job, sum(seconds for state, seconds in job["stage_timings"].items() if "." not in state and state != "queued")
+
+
+def wait_profile(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(f"/jobs/{job_id}/profile")
+        if response.status_code == 200 and response.json()["state"] != "running":
+            return response.json()
+        time.sleep(0.05)
+    return None
+
+
+def check_profile(profile, failures, what, allowed_threads=None):
+    if profile is None or profile["state"] != "done":
+        failures.append(f"{what}: no finished profile ({profile})")
+        return
+    total = 0
+    stacks = []
+    with open(profile["files"]["collapsed"], "r") as f:
+        for line in f:
+            match = COLLAPSED_LINE.match(line.rstrip("\n"))
+            if match is None:
+                failures.append(f"{what}: bad collapsed line {line!r}")
+                return
+            total += int(match.group(2))
+            stacks.append(match.group(1).split(";"))
+    if total != profile["samples"] or not total:
+        failures.append(f"{what}: collapsed counts add up to {total}, the profile has {profile['samples']} samples")
+    if not any(frame.startswith("process_video_task ") for stack in stacks for frame in stack[1:]):
+        failures.append(f"{what}: process_video_task is on no sampled stack")
+    if allowed_threads is not None:
+        strangers = {stack[0] for stack in stacks if not allowed_threads(stack[0])}
+        if strangers:
+            failures.append(f"{what}: threads of other work were sampled: {sorted(strangers)}")
+    if not os.path.exists(profile["files"]["summary"]):
+        failures.append(f"{what}: no summary file")
+    print(f"{what}: {profile['samples']} samples of {len(profile['threads'])} threads in {profile['seconds']:.2f}s, "
+          f"sampler overhead {profile['overhead_percent']}% of one core")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--interval-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="check_profiler_")
+    os.environ["BENCH_SCHEDULER_WORK"] = work
+    stand_in_models(work)
+    install_stand_ins(work)
+    os.makedirs(iv.UPLOAD_FOLDER)
+    iv.upload_index = iv.UploadIndex(iv.UPLOAD_FOLDER)
+    iv.PROFILE_DIR = os.path.join(work, "profiles")
+    paths = []
+    make_video(os.path.join(work, "profiled.avi"), args.chunks)
+    for i in range(4):
+        # Bytes past the end keep the copies apart, so none is served from an earlier upload's analysis
+        path = os.path.join(work, f"profiled_{i}.avi")
+        shutil.copy(os.path.join(work, "profiled.avi"), path)
+        with open(path, "ab") as f:
+            f.write(bytes(i + 1))
+        paths.append(path)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(iv.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    use_scheduler(processes=True)
+
+    failures = []
+    params = {"seconds": 0, "interval_ms": args.interval_ms}
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        _, before = run_job(client, paths[0])
+        job, profiled = run_job(client, paths[1], params)
+        _, after = run_job(client, paths[2])
+        if job["status"] != COMPLETE:
+            failures.append(f"the profiled job ended {job['status']}")
+        profile = wait_profile(client, job["job_id"])
+        check_profile(profile, failures, "job worker profile")
+        folder = iv.jobs.get(job["job_id"]).folder
+        if profile and profile.get("files") and os.path.dirname(profile["files"]["collapsed"]) != folder:
+            failures.append(f"the profile was written to {profile['files']['collapsed']}, not into {folder}")
+        if client.post(f"/jobs/{job['job_id']}/profile", params=params).status_code != 409:
+            failures.append("profiling a finished job was not refused")
+        print(f"job seconds: unprofiled {before:.2f} and {after:.2f}, profiled every {args.interval_ms:g} ms {profiled:.2f}")
+        if profile:
+            print("top functions of the job:")
+            for row in profile["top"][:8]:
+                print(f"  {row['own_percent']:>6.1f}% own {row['total_percent']:>6.1f}% total  {row['function']}")
+
+        # On a scheduler thread only the job's own threads are sampled
+        use_scheduler(processes=False)
+        job, _ = run_job(client, paths[3], params)
+        job_id = job["job_id"]
+        check_profile(wait_profile(client, job_id), failures, "scheduler thread profile",
+                      lambda name: name == f"job-{job_id}" or name.startswith(f"pipeline-{job_id}-"))
+
+        response = client.post("/profile", params={"seconds": 1, "interval_ms": args.interval_ms})
+        if response.status_code != 200 or not response.json()["samples"] or not os.path.exists(response.json()["files"]["collapsed"]):
+            failures.append(f"the process profile failed: {response.status_code} {response.text[:200]}")
+        else:
+            process = response.json()
+            print(f"process profile: {process['samples']} samples of {len(process['threads'])} threads in {process['seconds']:.2f}s")
+
+    if not all(job["status"] in TERMINAL_STATES for job in iv.jobs.list()):
+        failures.append("a job did not finish")
+    iv.job_scheduler.shutdown()
+    server.should_exit = True
+    shutil.rmtree(work, ignore_errors=True)
+    print("FAIL: " + "; ".join(failures) if failures else "OK: job and process profiles are written, parse and show the job")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
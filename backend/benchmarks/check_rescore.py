@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Re-score check: POST /rescore with an unchanged SVM reproduces the events
+of ingest.
+
+Builds a synthetic video whose bright (anomalous) intervals run into
+stretches the motion gate finds static: a still frame inside an event, an
+event just before a fully static chunk and one just after it. It is
+processed with the stand-in models of check_resume.py and the embeddings
+saved, then re-scored from the stored embeddings. The check fails unless
+the re-score finds the same anomalous chunks with the same event spans
+(peak scores within the float16 storage error of the features).
+
+Usage:
+    python benchmarks/check_rescore.py [--motion-gate diff]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FPS = 25
+CHUNK_SECONDS = 10
+# Per chunk: seconds (from the chunk start) that are bright, and seconds the moving bar stands still
+BRIGHT = {1: (6, 9), 3: (0, 3), 5: (3, 8)}
+STILL = {1: (8, 10), 2: (0, 10), 3: (0, 1), 5: (4, 7)}
+
+
+def make_video(path, chunks):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (320, 240))
+    x = 0
+    for i in range(chunks * CHUNK_SECONDS * FPS):
+        chunk, second = divmod(i / FPS, CHUNK_SECONDS)
+        lo, hi = BRIGHT.get(int(chunk), (0, 0))
+        frame = np.full((240, 320, 3), 230 if lo <= second < hi else 20, np.uint8)
+        lo, hi = STILL.get(int(chunk), (0, 0))
+        if not lo <= second < hi:
+            x = (x + 3) % 300
+        frame[:, x:x + 20] = 128
+        writer.write(frame)
+    writer.release()
+
+
+def install_stand_ins(iv):
+    from frame_buffer import IMAGENET_MEAN_BGR
+
+    class FeatureExtractor:
+        def predict(self, batch):
+            # Mean brightness of the frame (undoing the caffe mean), repeated
+            brightness = (batch + IMAGENET_MEAN_BGR).mean(axis=(1, 2, 3)) / 255.0
+            return np.repeat(brightness[:, None], 2048, axis=1).astype(np.float32)
+
+    class SVM:
+        classes_ = np.array([0, 1])
+
+        def decision_function(self, features):
+            return features[:, 0] - 0.5
+
+        def predict(self, features):
+            return (self.decision_function(features) > 0).astype(int)
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    class GeminiModel:
+        model_name = "fake-gemini"
+
+        def generate_content(self, content):
+            return Response(json.dumps({"overall_scene": {"critical_level": "High", "chunk_time_range": ""}}))
+
+    iv.models.set("feature_extractor", FeatureExtractor())
+    iv.models.set("svm", SVM())
+    iv.models.set("gemini", GeminiModel())
+    iv.models.set("gemini_flash", None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--motion-gate", default="diff", choices=["diff", "mog2"])
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="check_rescore_")
+    os.environ.update(MOTION_GATE=args.motion_gate, GEMINI_CACHE="0", GEMINI_REQUESTS_PER_MINUTE="0", RENDITIONS="0",
+                      CHECKPOINTS="0", MODEL_LOADING="lazy")
+    import indexing_video as iv
+
+    iv.ANOMALY_FOLDER = os.path.join(work, "anomaly")
+    install_stand_ins(iv)
+    video = os.path.join(work, "rescore_check.avi")
+    make_video(video, 6)
+    iv.process_video_task(video, save_embeddings=True)
+
+    with open(os.path.join(iv.ANOMALY_FOLDER, "rescore_check", "analysis_rescore_check.json"), "r") as f:
+        analysis = json.load(f)
+    ingest = {c["chunk_metadata"]["chunk_index"]: c["chunk_metadata"]["events"] for c in analysis["anomalous_chunks"]}
+    rescore = iv.rescore_video("rescore_check")
+    rescored = {c["chunk_index"]: c["events"] for c in rescore["anomalous_chunks"]}
+
+    motion = analysis["processing_stats"]["motion_gate"]
+    print(f"motion gate: {motion['frames_static']}/{motion['frames_seen']} frames static, {motion['static_chunks']} chunks fully static")
+    print(f"rescore: {rescore['frames_scored']} of {rescore['frames_sampled']} sampled frames embedded")
+    for chunk_index in sorted(set(ingest) | set(rescored)):
+        print(f"chunk {chunk_index}: ingest {ingest.get(chunk_index)}")
+        print(f"{'':>{len(str(chunk_index)) + 7}} rescore {rescored.get(chunk_index)}")
+
+    failures = []
+    if not motion["frames_static"] or not motion["static_chunks"]:
+        failures.append("the video has no static frames or chunks, so the check proves nothing")
+    if not ingest:
+        failures.append("ingest found no anomalies")
+    if sorted(ingest) != sorted(rescored):
+        failures.append(f"anomalous chunks differ: ingest {sorted(ingest)}, rescore {sorted(rescored)}")
+    for chunk_index in set(ingest) & set(rescored):
+        spans = lambda events: [(e["start_time"], e["end_time"]) for e in events]
+        if spans(ingest[chunk_index]) != spans(rescored[chunk_index]):
+            failures.append(f"chunk {chunk_index}: event spans differ")
+        elif any(abs(a["peak_score"] - b["peak_score"]) > 1e-2 for a, b in zip(ingest[chunk_index], rescored[chunk_index])):
+            failures.append(f"chunk {chunk_index}: peak scores differ")
+
+    shutil.rmtree(work, ignore_errors=True)
+    print("FAIL: " + "; ".join(failures) if failures else "OK: the re-score reproduces the ingest events")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Crash-injection check for chunk checkpointing.
+
+Builds a synthetic video with anomalies (bright flashes) in several chunks
+and processes it with a cheap stand-in feature extractor, SVM and Gemini
+model, so no weights or API key are needed. The first run is killed with
+os._exit() right after the checkpoint of chunk --crash-after is written;
+the second run resumes. Every chunk detection and every Gemini call is
+logged across both runs, and the check fails unless each chunk was
+detected exactly once, each anomalous chunk cost exactly one Gemini call
+and the resumed analysis and score timeline match an uninterrupted run.
+
+Usage:
+    python benchmarks/check_resume.py [--chunks 6] [--crash-after 2] [--frame-source opencv]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FPS = 25
+CHUNK_SECONDS = 10
+
+
+def make_video(path, chunks, anomalous_chunks):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (320, 240))
+    for i in range(chunks * CHUNK_SECONDS * FPS):
+        second = i / FPS
+        chunk = int(second // CHUNK_SECONDS)
+        bright = chunk in anomalous_chunks and 4 <= second % CHUNK_SECONDS < 7
+        frame = np.full((240, 320, 3), 230 if bright else 20, np.uint8)
+        x = (i * 3) % 300
+        frame[:, x:x + 20] = 128  # Moving bar
+        # Distinct content per chunk, so the Gemini cache (keyed by perceptual
+        # hash) cannot serve one chunk's analysis for another
+        cv2.putText(frame, str(chunk), (40 + 40 * chunk, 200), cv2.FONT_HERSHEY_SIMPLEX, 5, (0, 0, 255), 12)
+        writer.write(frame)
+    writer.release()
+
+
+def child(args):
+    """One processing run with instrumented hooks; may crash on purpose."""
+    sys.path.insert(0, BACKEND_DIR)
+    import indexing_video as iv
+    from frame_buffer import IMAGENET_MEAN_BGR
+
+    iv.ANOMALY_FOLDER = args.anomaly_folder
+    log = open(args.log, "a")
+
+    def note(line):
+        log.write(line + "\n")
+        log.flush()
+        os.fsync(log.fileno())
+
+    class FeatureExtractor:
+        def predict(self, batch):
+            # Mean brightness of the frame (undoing the caffe mean), repeated
+            brightness = (batch + IMAGENET_MEAN_BGR).mean(axis=(1, 2, 3)) / 255.0
+            return np.repeat(brightness[:, None], 2048, axis=1).astype(np.float32)
+
+    class SVM:
+        classes_ = np.array([0, 1])
+
+        def decision_function(self, features):
+            return features[:, 0] - 0.5
+
+        def predict(self, features):
+            return (self.decision_function(features) > 0).astype(int)
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    class GeminiModel:
+        model_name = "fake-gemini"
+
+        def generate_content(self, content):
+            chunk = content[0].split("(time: ")[1].split("s")[0]
+            note(f"vlm {chunk}")
+            return Response(json.dumps({"overall_scene": {"critical_level": "High", "chunk_time_range": ""}}))
+
+    iv.models.set("feature_extractor", FeatureExtractor())
+    iv.models.set("svm", SVM())
+    iv.models.set("gemini", GeminiModel())
+    iv.models.set("gemini_flash", None)
+
+    save_chunk = iv.ChunkCheckpoint.save_chunk
+    saved = []
+
+    def save_chunk_and_maybe_crash(self, chunk_index, record):
+        save_chunk(self, chunk_index, record)
+        note(f"detect {chunk_index}")
+        saved.append(chunk_index)
+        if args.exit_after is not None and chunk_index == args.exit_after:
+            note("crash")
+            os._exit(17)
+
+    iv.ChunkCheckpoint.save_chunk = save_chunk_and_maybe_crash
+    iv.process_video_task(args.video)
+
+
+def run_child(video, anomaly_folder, log, crash_after=None):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--video", video,
+           "--anomaly-folder", anomaly_folder, "--log", log]
+    if crash_after is not None:
+        cmd += ["--exit-after", str(crash_after)]
+    return subprocess.run(cmd, cwd=BACKEND_DIR, env=os.environ.copy(), capture_output=True, text=True)
+
+
+def load_analysis(anomaly_folder, video):
+    name = os.path.splitext(os.path.basename(video))[0]
+    with open(os.path.join(anomaly_folder, name, f"analysis_{name}.json"), "r") as f:
+        data = json.load(f)
+    return data, [(c["chunk_metadata"]["chunk_index"], c["chunk_metadata"].get("events")) for c in data["anomalous_chunks"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=6)
+    parser.add_argument("--crash-after", type=int, default=2)
+    parser.add_argument("--frame-source", default="opencv", choices=["opencv", "ffmpeg"])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--video", help=argparse.SUPPRESS)
+    parser.add_argument("--anomaly-folder", help=argparse.SUPPRESS)
+    parser.add_argument("--log", help=argparse.SUPPRESS)
+    parser.add_argument("--exit-after", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    work = tempfile.mkdtemp(prefix="check_resume_")
+    os.environ.update(FRAME_SOURCE=args.frame_source, GEMINI_CACHE_DIR=os.path.join(work, "gemini_cache"),
+                      GEMINI_REQUESTS_PER_MINUTE="0", MOTION_GATE="off", SAVE_EMBEDDINGS="1")
+    anomalous = set(range(1, args.chunks, 2))
+    video = os.path.join(work, "resume_check.avi")
+    make_video(video, args.chunks, anomalous)
+
+    # Reference: one uninterrupted run, without any checkpoint to start from
+    os.environ["GEMINI_CACHE"] = "0"
+    reference = run_child(video, os.path.join(work, "reference"), os.path.join(work, "reference.log"))
+    if reference.returncode != 0:
+        sys.exit(f"Reference run failed:\n{reference.stdout}\n{reference.stderr}")
+    _, expected = load_analysis(os.path.join(work, "reference"), video)
+
+    # Crash, then resume, logging into one file
+    os.environ["GEMINI_CACHE"] = "1"
+    anomaly_folder = os.path.join(work, "anomaly")
+    log = os.path.join(work, "runs.log")
+    crashed = run_child(video, anomaly_folder, log, crash_after=args.crash_after)
+    print(f"run 1: exit code {crashed.returncode} (crash injected after chunk {args.crash_after})")
+    resumed = run_child(video, anomaly_folder, log)
+    print(f"run 2: exit code {resumed.returncode}")
+    if resumed.returncode != 0:
+        sys.exit(f"Resumed run failed:\n{resumed.stdout}\n{resumed.stderr}")
+
+    with open(log, "r") as f:
+        lines = f.read().split()
+    entries = [tuple(lines[i:i + 2]) for i in range(0, len(lines)) if lines[i] in ("detect", "vlm")]
+    detections = Counter(int(value) for kind, value in entries if kind == "detect")
+    vlm_calls = Counter(float(value) for kind, value in entries if kind == "vlm")
+    data, actual = load_analysis(anomaly_folder, video)
+
+    print(f"detections per chunk: {dict(sorted(detections.items()))}")
+    print(f"Gemini calls per chunk start time: {dict(sorted(vlm_calls.items()))}")
+    print(f"checkpoint stats: {data['processing_stats']['checkpoint']}")
+    failures = []
+    if sorted(detections) != list(range(args.chunks)) or any(n != 1 for n in detections.values()):
+        failures.append("some chunk was not detected exactly once")
+    if any(n != 1 for n in vlm_calls.values()) or len(vlm_calls) != len(anomalous):
+        failures.append("some anomalous chunk did not cost exactly one Gemini call")
+    if actual != expected:
+        failures.append(f"resumed analysis differs from the uninterrupted run: {actual} != {expected}")
+    for name in ("timeline_scores.f16", "timeline_frames.i32", "timeline_sprites_0.jpg"):
+        with open(os.path.join(work, "reference", "resume_check", name), "rb") as f, \
+                open(os.path.join(anomaly_folder, "resume_check", name), "rb") as g:
+            if f.read() != g.read():
+                failures.append(f"resumed {name} differs from the uninterrupted run")
+    if os.path.exists(os.path.join(anomaly_folder, "resume_check", "checkpoint")):
+        failures.append("checkpoint folder was not removed after completion")
+    print("FAIL: " + "; ".join(failures) if failures else "OK: no chunk was processed twice")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Worker-failure check for sharded processing.
+
+Builds a synthetic video with anomalies (bright flashes) in several chunks
+and processes it once unsharded and once split into shards of
+--shard-chunks chunks, with a coordinator and two shard workers in their
+own processes, all using cheap stand-in models (no weights or API key).
+The first worker is SIGKILLed while it holds its first lease, so its shard
+must expire and be re-leased by the other worker. The check fails unless
+that shard was re-queued, every shard result was stored exactly once and
+the merged anomalous chunks match the unsharded run.
+
+Usage:
+    python benchmarks/check_shards.py [--chunks 8] [--shard-chunks 2] [--lease 3]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from check_resume import make_video
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(args):
+    """Coordinator (--role process) or shard worker (--role worker) with stand-in models."""
+    sys.path.insert(0, BACKEND_DIR)
+    import numpy as np
+
+    import indexing_video as iv
+    from frame_buffer import IMAGENET_MEAN_BGR
+
+    iv.ANOMALY_FOLDER = args.anomaly_folder
+    log = open(args.log, "a")
+
+    def note(line):
+        log.write(line + "\n")
+        log.flush()
+        os.fsync(log.fileno())
+
+    class FeatureExtractor:
+        def predict(self, batch):
+            if args.kill:
+                # Dies while holding the lease: no result, no more heartbeats
+                note(f"killed {args.role}")
+                os.kill(os.getpid(), signal.SIGKILL)
+            brightness = (batch + IMAGENET_MEAN_BGR).mean(axis=(1, 2, 3)) / 255.0
+            return np.repeat(brightness[:, None], 2048, axis=1).astype(np.float32)
+
+    class SVM:
+        classes_ = np.array([0, 1])
+
+        def decision_function(self, features):
+            return features[:, 0] - 0.5
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    class GeminiModel:
+        model_name = "fake-gemini"
+
+        def generate_content(self, content):
+            return Response(json.dumps({"overall_scene": {"critical_level": "High", "chunk_time_range": ""}}))
+
+    iv.models.set("feature_extractor", FeatureExtractor())
+    iv.models.set("svm", SVM())
+    iv.models.set("gemini", GeminiModel())
+    iv.models.set("gemini_flash", None)
+
+    if args.role == "process":
+        return iv.process_video_task(args.video)
+
+    import shard_worker
+    queue = iv.work_queue
+    lease, complete = queue.lease, queue.complete
+
+    def logged_lease(worker):
+        shard = lease(worker)
+        if shard is not None:
+            note(f"lease {shard['shard']} {worker}")
+        return shard
+
+    def logged_complete(shard, result):
+        stored = complete(shard, result)
+        note(f"{'complete' if stored else 'discarded'} {shard['shard']} {shard['worker']}")
+        return stored
+
+    queue.lease, queue.complete = logged_lease, logged_complete
+    shard_worker.run_worker(queue, args.role, poll_seconds=0.2, idle_exit=args.idle_exit)
+
+
+def start_child(role, video, anomaly_folder, log, kill=False, idle_exit=0):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--role", role, "--video", video,
+           "--anomaly-folder", anomaly_folder, "--log", log, "--idle-exit", str(idle_exit)]
+    if kill:
+        cmd.append("--kill")
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=os.environ.copy(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def read_log(log):
+    if not os.path.exists(log):
+        return []
+    with open(log, "r") as f:
+        return [line.split() for line in f.read().splitlines()]
+
+
+def anomalies(anomaly_folder, video):
+    name = os.path.splitext(os.path.basename(video))[0]
+    with open(os.path.join(anomaly_folder, name, f"analysis_{name}.json"), "r") as f:
+        data = json.load(f)
+    return data, [(c["chunk_metadata"]["chunk_index"], c["chunk_metadata"].get("events")) for c in data["anomalous_chunks"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--shard-chunks", type=int, default=2)
+    parser.add_argument("--lease", type=float, default=3.0, help="SHARD_LEASE_SECONDS")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--role", help=argparse.SUPPRESS)
+    parser.add_argument("--video", help=argparse.SUPPRESS)
+    parser.add_argument("--anomaly-folder", help=argparse.SUPPRESS)
+    parser.add_argument("--log", help=argparse.SUPPRESS)
+    parser.add_argument("--kill", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--idle-exit", type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    work = tempfile.mkdtemp(prefix="check_shards_")
+    os.environ.update(GEMINI_CACHE="0", GEMINI_REQUESTS_PER_MINUTE="0", MOTION_GATE="off", CHUNK_WORKERS="0",
+                      CHECKPOINTS="0", SAVE_EMBEDDINGS="0", TIMELINE="0", RENDITIONS="0")
+    anomalous = set(range(1, args.chunks, 2))
+    video = os.path.join(work, "shard_check.avi")
+    make_video(video, args.chunks, anomalous)
+
+    # Reference: one unsharded run
+    os.environ.pop("SHARD_QUEUE", None)
+    reference = start_child("process", video, os.path.join(work, "reference"), os.path.join(work, "reference.log"))
+    output = reference.communicate()[0]
+    if reference.returncode != 0:
+        sys.exit(f"Reference run failed:\n{output}")
+    _, expected = anomalies(os.path.join(work, "reference"), video)
+
+    os.environ.update(SHARD_QUEUE=os.path.join(work, "queue.sqlite"), SHARD_MIN_SECONDS="0", SHARD_CHUNKS=str(args.shard_chunks),
+                      SHARD_LEASE_SECONDS=str(args.lease), SHARD_POLL_SECONDS="0.2")
+    anomaly_folder = os.path.join(work, "anomaly")
+    log = os.path.join(work, "shards.log")
+    coordinator = start_child("process", video, anomaly_folder, log)
+    doomed = start_child("worker-1", video, anomaly_folder, log, kill=True)
+    # The second worker starts once the first one holds a lease, so the kill hits a leased shard
+    deadline = time.monotonic() + 60
+    while not any(entry[0] == "lease" for entry in read_log(log)):
+        if time.monotonic() > deadline or doomed.poll() is not None and not read_log(log):
+            sys.exit(f"worker-1 never leased a shard:\n{doomed.communicate()[0]}")
+        time.sleep(0.1)
+    survivor = start_child("worker-2", video, anomaly_folder, log, idle_exit=args.lease + 2)
+
+    output = coordinator.communicate(timeout=300)[0]
+    doomed.wait(timeout=60)
+    survivor.communicate(timeout=60)
+    if coordinator.returncode != 0:
+        sys.exit(f"Coordinator failed:\n{output}")
+    print(f"worker-1: exit code {doomed.returncode} ({'SIGKILL' if doomed.returncode == -signal.SIGKILL else 'not killed'})")
+
+    entries = read_log(log)
+    killed_shard = next(int(entry[1]) for entry in entries if entry[0] == "lease")
+    leases = Counter(int(entry[1]) for entry in entries if entry[0] == "lease")
+    completions = Counter(int(entry[1]) for entry in entries if entry[0] == "complete")
+    data, actual = anomalies(anomaly_folder, video)
+    stats = data["processing_stats"]["shards"]
+    shards = -(-args.chunks // args.shard_chunks)
+
+    print(f"leases per shard: {dict(sorted(leases.items()))}")
+    print(f"stored results per shard: {dict(sorted(completions.items()))}")
+    print(f"shard stats: count {stats['count']}, workers {stats['workers']}, attempts {stats['attempts']}, "
+          f"requeues {stats['requeues']}, {stats['wall_seconds']:.1f}s")
+    failures = []
+    if doomed.returncode != -signal.SIGKILL:
+        failures.append("worker-1 was not killed")
+    if leases[killed_shard] != 2 or stats["requeues"] != 1:
+        failures.append(f"shard {killed_shard} was not re-queued once after its worker died")
+    if sorted(completions) != list(range(shards)) or any(n != 1 for n in completions.values()):
+        failures.append("some shard result was not stored exactly once")
+    if not expected:
+        failures.append("the unsharded run found no anomalous chunk to compare")
+    if actual != expected:
+        failures.append(f"merged analysis differs from the unsharded run: {actual} != {expected}")
+    if os.path.exists(os.path.join(work, "shards")) and os.listdir(os.path.join(work, "shards")):
+        failures.append("shard outputs were not removed after merging")
+    print("FAIL: " + "; ".join(failures) if failures else "OK: the killed worker's shard was re-processed once, results match")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
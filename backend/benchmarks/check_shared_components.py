@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Shared components check: job worker processes use the server's batcher,
+Gemini pool and Gemini cache.
+
+Serves the app with uvicorn and the stand-in models of bench_scheduler.py
+(no weights or API key), with thresholds that make every chunk anomalous,
+and processes --videos copies of one synthetic video at once on two job
+worker processes, then one more copy. It checks that every frame the
+jobs scored went through the server's batcher, that every chunk analysis
+and summary ran on the server's Gemini pool, that every analysis was
+looked up in the server's cache (the last copy answered from it), that
+/inference/stats and /gemini_cache/stats report those numbers, and that
+the time of every request sent shows in the stage breakdowns of the jobs.
+
+Usage:
+    python benchmarks/check_shared_components.py [--videos 2] [--chunks 3]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+work = tempfile.mkdtemp(prefix="check_shared_components_")
+os.environ.setdefault("MODEL_LOADING", "lazy")
+os.environ.update(GEMINI_CACHE="1", GEMINI_CACHE_DIR=os.path.join(work, "gemini_cache"), GEMINI_REQUESTS_PER_MINUTE="0",
+                  RENDITIONS="0", CHECKPOINTS="0", INFERENCE_BATCH_SIZE="32", MOTION_GATE="off",
+                  ANOMALY_ENTER_THRESHOLD="-1e9", ANOMALY_EXIT_THRESHOLD="-1e9")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+
+import indexing_video as iv
+from bench_chunk_workers import make_video, stand_in_models
+from bench_scheduler import install_stand_ins, init_bench_worker, free_port, upload, wait_for, run_bench_job
+from job_registry import COMPLETE
+from job_scheduler import JobScheduler
+
+
+def analysis_of(job):
+    with open(os.path.join(iv.jobs.get(job["job_id"]).folder, f"analysis_{job['video_name']}.json"), "r") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=2)
+    parser.add_argument("--chunks", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["BENCH_SCHEDULER_WORK"] = work
+    stand_in_models(work)
+    install_stand_ins(work)
+    os.makedirs(iv.UPLOAD_FOLDER)
+    iv.upload_index = iv.UploadIndex(iv.UPLOAD_FOLDER)
+    make_video(os.path.join(work, "source.avi"), args.chunks)
+    paths = []
+    for i in range(args.videos + 1):
+        # Bytes past the end keep the copies apart, so none is served from an earlier upload's analysis
+        path = os.path.join(work, f"shared_{i}.avi")
+        shutil.copy(os.path.join(work, "source.avi"), path)
+        with open(path, "ab") as f:
+            f.write(bytes(i + 1))
+        paths.append(path)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(iv.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    iv.job_scheduler.shutdown()
+    iv.job_scheduler = JobScheduler(run_bench_job, iv.handle_job_event, concurrency=2, processes=True,
+                                    initializer=init_bench_worker, call_handler=iv.handle_job_call).start()
+
+    failures = []
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+        job_ids = [upload(client, path)["job_id"] for path in paths[:-1]]
+        jobs, _ = wait_for(client, job_ids)
+        cache_before = client.get("/gemini_cache/stats").json()
+        last_id = upload(client, paths[-1])["job_id"]
+        last, _ = wait_for(client, [last_id])
+        jobs.update(last)
+        inference = client.get("/inference/stats").json()
+        cache = client.get("/gemini_cache/stats").json()
+
+    scored_frames = 0
+    analyses = 0
+    gemini_requests = 0
+    for job in jobs.values():
+        if job["status"] != COMPLETE:
+            failures.append(f"job {job['job_id']} ended {job['status']}")
+            continue
+        analysis = analysis_of(job)
+        stats = analysis["processing_stats"]
+        scored_frames += stats["stages"]["decode"]["frames"]  # The motion gate is off
+        analyses += len(analysis["anomalous_chunks"])
+        gemini_requests += stats["stages"].get("gemini", {}).get("count", 0)
+        if len(analysis["anomalous_chunks"]) != args.chunks:
+            failures.append(f"{job['video_name']}: {len(analysis['anomalous_chunks'])} chunk analyses, expected {args.chunks}")
+        if not stats["inference"]["model_batches"]:
+            failures.append(f"{job['video_name']}: no model batches in its inference stats")
+
+    print(f"server batcher: {inference['frames']} frames in {inference['batches']} batches for {scored_frames} scored frames")
+    print(f"server Gemini pool: {iv.gemini_pool.completed} requests; cache {cache}")
+    if inference["frames"] != scored_frames:
+        failures.append(f"the server's batcher extracted {inference['frames']} frames, the jobs scored {scored_frames}")
+    # The stand-in flash model is None, so summaries never reach the cache
+    lookups = cache["hits"] + cache["misses"]
+    if lookups != analyses:
+        failures.append(f"the server's cache saw {lookups} lookups for {analyses} analyses")
+    if gemini_requests != cache["misses"]:
+        failures.append(f"the jobs' breakdowns show {gemini_requests} Gemini requests, the cache {cache['misses']} misses")
+    if iv.gemini_pool.completed != len(jobs) + analyses:
+        failures.append(f"the server's Gemini pool ran {iv.gemini_pool.completed} requests, expected {len(jobs) + analyses}")
+    if cache["hits"] - cache_before["hits"] < args.chunks:
+        failures.append(f"the last copy got {cache['hits'] - cache_before['hits']} cache hits, expected at least {args.chunks}")
+
+    iv.job_scheduler.shutdown()
+    server.should_exit = True
+    shutil.rmtree(work, ignore_errors=True)
+    print("FAIL: " + "; ".join(failures) if failures else "OK: job workers use the server's batcher, Gemini pool and cache")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
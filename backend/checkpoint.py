@@ -0,0 +1,107 @@
+"""
+Durable per-chunk checkpoints for process_video_task.
+
+Every finished chunk is written to anomaly/<video>/checkpoint/ as its own
+JSON record: the detection result (events, keyframe files, the smoothing
+state carried into the next chunk, the number of embedding rows flushed so
+far) and, once it returns, the chunk's Gemini analysis. Records are
+fsync'ed and renamed into place, so after a crash every record on disk is
+complete. A rerun of the same video with the same settings resumes at the
+first chunk without a record and reuses the stored results; a different
+file or different settings start from scratch.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+CHECKPOINT_DIR = "checkpoint"
+MANIFEST_FILE = "manifest.json"
+
+# Gemini analysis state of a chunk record
+ANALYSIS_NONE, ANALYSIS_PENDING, ANALYSIS_DONE, ANALYSIS_FAILED = "none", "pending", "done", "failed"
+
+
+def file_fingerprint(path: str, sample_bytes: int = 1 << 20) -> str:
+    """Size plus sha256 of the first and last MiB; cheap even for long videos."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode("utf-8"))
+    with open(path, "rb") as f:
+        digest.update(f.read(sample_bytes))
+        if size > sample_bytes:
+            f.seek(max(sample_bytes, size - sample_bytes))
+            digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+
+def _write_durable(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ChunkCheckpoint:
+    def __init__(self, video_folder: str, fingerprint: dict):
+        self.folder = os.path.join(video_folder, CHECKPOINT_DIR)
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()  # Analysis results arrive on Gemini pool threads
+        self.records = {}
+
+        manifest_path = os.path.join(self.folder, MANIFEST_FILE)
+        try:
+            with open(manifest_path, "r") as f:
+                matches = json.load(f) == fingerprint
+        except (OSError, ValueError):
+            matches = False
+        if not matches:
+            self.reset()
+            return
+
+        for name in os.listdir(self.folder):
+            if name.startswith("chunk_") and name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.folder, name), "r") as f:
+                        record = json.load(f)
+                    self.records[record["chunk_index"]] = record
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Ignoring unreadable checkpoint {name}: {e}")
+
+    def reset(self):
+        """Drop every record and start a new checkpoint for the current fingerprint."""
+        shutil.rmtree(self.folder, ignore_errors=True)
+        os.makedirs(self.folder, exist_ok=True)
+        _write_durable(os.path.join(self.folder, MANIFEST_FILE), self.fingerprint)
+        self.records = {}
+
+    def _path(self, chunk_index: int) -> str:
+        return os.path.join(self.folder, f"chunk_{chunk_index:06d}.json")
+
+    def resume_chunk(self) -> int:
+        """First chunk without a record; every chunk before it is done."""
+        chunk_index = 0
+        while chunk_index in self.records:
+            chunk_index += 1
+        return chunk_index
+
+    def save_chunk(self, chunk_index: int, record: dict):
+        record = dict(record, chunk_index=chunk_index)
+        with self._lock:
+            _write_durable(self._path(chunk_index), record)
+            self.records[chunk_index] = record
+
+    def save_analysis(self, chunk_index: int, analysis: dict):
+        """Attach a chunk's Gemini result (None when the request failed)."""
+        with self._lock:
+            record = dict(self.records[chunk_index])
+            record["analysis"] = analysis
+            record["analysis_state"] = ANALYSIS_DONE if analysis else ANALYSIS_FAILED
+            _write_durable(self._path(chunk_index), record)
+            self.records[chunk_index] = record
+
+    def clear(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        self.records = {}
@@ -0,0 +1,288 @@
+"""
+Chunk-parallel detection of one video across a pool of worker processes.
+
+Chunks are independent up to the motion gate and the smoothing state, so
+contiguous spans of chunks are handed to worker processes. Each worker has
+its own decoder, motion gate and CPU replica of the feature extractor and
+SVM, loaded once when the process starts, with its intra-op threads capped
+(and, when asked, pinned to cores of the pool's own range) so the replicas
+do not fight over the same cores. A worker seeks to a little before its
+span, warms the motion gate up on the sampled frames there, and returns,
+per chunk, the sampled frames, the motion mask and the features and scores
+of the active frames.
+
+Spans come back in chunk order, so the caller merges them as if one
+decoder had read the whole file: smoothing, keyframes, embeddings, timeline
+and checkpoints still run in the parent, one chunk after the other. Every
+chunk's features are computed in model batches of a fixed size counted from
+the chunk start. With the "diff" gate, which only looks at the previous
+sampled frame, results do not depend on the number of workers as long as
+the decoder seeks frame-accurately. The "mog2" background model is only
+warmed up on MOG2_WARMUP_FRAMES sampled frames before a span, not on the
+whole video before it, so its masks near span starts, and the frames they
+send to the model, can change with the number of workers. So can any
+result on a file where the decoder's seek lands off the requested frame.
+"""
+import collections
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from frame_buffer import FrameBatch, FEATURE_DIM
+from frame_source import open_frame_source
+from motion import MotionGate
+
+MOG2_WARMUP_FRAMES = 50  # Sampled frames a "mog2" gate learns the background from before a span
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def load_models(threads: int, backend: str, model_dir: str, svm_path: str, cache_dir: str = None):
+    """Default replica loader: (feature extractor, SVM), float32 on CPU."""
+    import joblib
+    from inference_backends import create_backend
+    return create_backend(backend, model_dir, threads=threads, mixed_float16=False, cache_dir=cache_dir), joblib.load(svm_path)
+
+
+def svm_scores(svm, features: np.ndarray) -> np.ndarray:
+    """Per-frame SVM decision scores; positive means anomalous."""
+    scores = svm.decision_function(features)
+    # decision_function is positive towards classes_[1]
+    if svm.classes_[0] == 1:
+        scores = -scores
+    return np.asarray(scores, dtype=np.float32)
+
+
+def core_share(index: int, parts: int) -> list:
+    """The index-th of parts disjoint slices of the CPUs this process may run on."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    size = max(1, len(cores) // max(1, parts))
+    share = cores[index * size:(index + 1) * size]
+    return share or cores[-size:]
+
+
+def _init_worker(threads: int, cores: multiprocessing.Queue, loader, loader_args: tuple):
+    # Before the runtimes are imported: they size their thread pools from these
+    os.environ.update({
+        "OMP_NUM_THREADS": str(threads),
+        "TF_NUM_INTRAOP_THREADS": str(threads),
+        "TF_NUM_INTEROP_THREADS": "1",
+        "CUDA_VISIBLE_DEVICES": "",  # Replicas run on CPU; the GPU, if any, stays with the server
+    })
+    cv2.setNumThreads(threads)
+    if cores is not None:
+        os.sched_setaffinity(0, cores.get())
+    started = time.perf_counter()
+    _worker["extractor"], _worker["svm"] = loader(threads, *loader_args)
+    _worker["extractor"].predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+    _worker["load_seconds"] = time.perf_counter() - started
+
+
+def _ping():
+    return os.getpid(), _worker["load_seconds"]
+
+
+def _prime_frame(start_frame: int, mode: str, frame_skip: int, frames_per_chunk: int) -> int:
+    """Last frame the source samples before start_frame (a chunk start)."""
+    if mode == "ffmpeg":
+        return max(0, start_frame - frame_skip)
+    previous_chunk = start_frame - frames_per_chunk
+    return previous_chunk + (frames_per_chunk - 1) // frame_skip * frame_skip
+
+
+def _finish_piece(batch: FrameBatch, gate: MotionGate, batch_size: int) -> dict:
+    n = batch.count
+    gate.apply(batch.frames[:n], batch.motion, batch.active)
+    inputs = batch.preprocess()
+    k = batch.active_count
+    features = np.empty((k, FEATURE_DIM), dtype=np.float32)
+    model_calls = []
+    for lo in range(0, k, batch_size):
+        started = time.perf_counter()
+        features[lo:lo + batch_size] = _worker["extractor"].predict(inputs[lo:lo + batch_size])
+        model_calls.append((min(batch_size, k - lo), time.perf_counter() - started))
+    started = time.perf_counter()
+    scores = svm_scores(_worker["svm"], features) if k else np.empty(0, dtype=np.float32)
+    svm_seconds = time.perf_counter() - started if k else 0.0
+    return {
+        "chunk_index": batch.chunk_index,
+        "chunk_end": False,
+        "frame_numbers": batch.frame_numbers[:n].copy(),
+        "frames": batch.frames[:n].copy(),
+        "motion": batch.motion[:n].copy(),
+        "active": batch.active[:n].copy(),
+        "features": features,
+        "scores": scores,
+        "model_batches": len(model_calls),
+        "model_calls": model_calls,  # (frames, seconds) per feature-extractor call, for the server's metrics
+        "svm_seconds": svm_seconds,
+    }
+
+
+def _process_span(video_path: str, mode: str, input_fps: float, frame_skip: int, frames_per_chunk: int, total_frames: int,
+                  first_chunk: int, last_chunk: int, motion_method: str, motion_threshold: float, batch_size: int) -> dict:
+    """Decode, gate and score chunks [first_chunk, last_chunk); runs in a worker process."""
+    started = time.perf_counter()
+    start_frame = first_chunk * frames_per_chunk
+    end_frame = min(last_chunk * frames_per_chunk, total_frames)
+    # The "diff" gate needs the one sampled frame before the span, "mog2" some history
+    warmup = MOG2_WARMUP_FRAMES if motion_method == "mog2" else 1
+    prime_frame = max(0, _prime_frame(start_frame, mode, frame_skip, frames_per_chunk) - (warmup - 1) * frame_skip) if start_frame else 0
+    gate = MotionGate(motion_method, motion_threshold)
+    # Room for every sampled frame of a chunk; a longer chunk is returned in pieces
+    batch = FrameBatch(0, int(np.ceil(frames_per_chunk / frame_skip)) + 2)
+    pieces = []
+
+    source = open_frame_source(video_path, mode, input_fps, frame_skip, frames_per_chunk, start_frame=prime_frame)
+    for frame_number, frame in source:
+        if frame_number >= end_frame:
+            break
+        if frame_number < start_frame:
+            # Warm-up: the gate sees the sampled frames before the span, as
+            # if this worker had read the previous chunk too
+            if gate.enabled:
+                gate.score(frame[None])
+            continue
+        chunk_index = frame_number // frames_per_chunk
+        if chunk_index != batch.chunk_index or batch.full:
+            if batch.count:
+                pieces.append(_finish_piece(batch, gate, batch_size))
+                pieces[-1]["chunk_end"] = chunk_index != batch.chunk_index
+            batch.reset(chunk_index)
+        batch.append(frame_number, frame_number / input_fps, frame)
+    if batch.count:
+        pieces.append(_finish_piece(batch, gate, batch_size))
+        pieces[-1]["chunk_end"] = True
+    return {"pieces": pieces, "pid": os.getpid(), "seconds": time.perf_counter() - started}
+
+
+class ChunkWorkerPool:
+    def __init__(self, processes: int, threads: int, loader, loader_args: tuple = (), span: int = 3, pin_cores: bool = False,
+                 cores: list = None):
+        """
+        loader(threads, *loader_args) -> (extractor, svm) runs once in every
+        worker and must be picklable (a module-level function). span is the
+        most chunks one task decodes after a single seek. cores are the CPUs
+        this pool may pin its workers to (default: all of this process's);
+        give pools that run side by side disjoint ranges.
+        """
+        self.processes = max(1, processes)
+        self.threads = max(1, threads)
+        self.loader = loader
+        self.loader_args = tuple(loader_args)
+        self.span = max(1, span)
+        self.pin_cores = pin_cores and hasattr(os, "sched_setaffinity")
+        self.cores = list(cores) if cores is not None else None
+        self.pinned = False
+        self._executor = None
+        self._pings = []
+        self.load_seconds = None
+        # Counters for stats()
+        self.spans = 0
+        self.chunks = 0
+        self.busy_seconds = 0.0
+
+    def use_cores(self, cores: list):
+        """Keep the pool to these cores, fewer threads per worker if needed; before start()."""
+        self.cores = sorted(cores)
+        if self.processes * self.threads > len(self.cores):
+            self.threads = max(1, len(self.cores) // self.processes)
+
+    def _core_sets(self, context):
+        """One set of threads cores per worker, when there are enough cores for all of them."""
+        cores = self.cores if self.cores is not None else sorted(os.sched_getaffinity(0))
+        if len(cores) < self.processes * self.threads:
+            return None
+        queue = context.Queue()
+        for i in range(self.processes):
+            queue.put(cores[i * self.threads:(i + 1) * self.threads])
+        return queue
+
+    def start(self, wait: bool = True):
+        """Spawn the workers and load their replicas."""
+        if self._executor is None:
+            # TensorFlow and ONNX Runtime are not fork-safe once the server has loaded them
+            context = multiprocessing.get_context("spawn")
+            cores = self._core_sets(context) if self.pin_cores else None
+            self.pinned = cores is not None
+            self._executor = ProcessPoolExecutor(
+                self.processes, mp_context=context, initializer=_init_worker,
+                initargs=(self.threads, cores, self.loader, self.loader_args)
+            )
+            # One task per worker; each submit spawns a process while none is idle yet
+            self._pings = [self._executor.submit(_ping) for _ in range(self.processes)]
+        if wait and self.load_seconds is None:
+            self.load_seconds = round(max(ping.result()[1] for ping in self._pings), 3)
+            print(f"Chunk workers: {self.processes} processes x {self.threads} threads, replicas loaded in {self.load_seconds:.2f}s")
+        return self
+
+    def process_video(self, video_path: str, mode: str, input_fps: float, frame_skip: int, frames_per_chunk: int,
+                      total_frames: int, first_chunk: int, total_chunks: int, motion_method: str, motion_threshold: float,
+                      batch_size: int, stats: dict = None):
+        """
+        Yield the pieces of chunks first_chunk..total_chunks-1 in chunk order
+        (see _finish_piece); the last piece of a chunk has chunk_end set.
+        stats, when given, receives spans, model_batches and worker_seconds.
+        """
+        self.start()
+        remaining = total_chunks - first_chunk
+        # Short videos still spread over every worker
+        span = max(1, min(self.span, -(-remaining // self.processes)))
+        spans = collections.deque((c, min(c + span, total_chunks)) for c in range(first_chunk, total_chunks, span))
+        in_flight = collections.deque()
+        if stats is not None:
+            stats.update(spans=len(spans), model_batches=0, worker_seconds=0.0)
+        try:
+            while spans or in_flight:
+                # Two spans per worker, so every worker has its next span queued
+                # while the parent merges the oldest one
+                while spans and len(in_flight) < 2 * self.processes:
+                    first, last = spans.popleft()
+                    in_flight.append(self._executor.submit(
+                        _process_span, video_path, mode, input_fps, frame_skip, frames_per_chunk, total_frames,
+                        first, last, motion_method, motion_threshold, batch_size
+                    ))
+                result = in_flight.popleft().result()
+                self.spans += 1
+                self.busy_seconds += result["seconds"]
+                if stats is not None:
+                    stats["model_batches"] += sum(piece["model_batches"] for piece in result["pieces"])
+                    stats["worker_seconds"] += result["seconds"]
+                for piece in result["pieces"]:
+                    self.chunks += piece["chunk_end"]
+                    yield piece
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); the next video gets a fresh pool
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.load_seconds = None
+            raise
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "threads_per_worker": self.threads,
+            "pinned": self.pinned,
+            "cores": self.cores,
+            "span_chunks": self.span,
+            "running": self._executor is not None,
+            "load_seconds": self.load_seconds,
+            "spans": self.spans,
+            "chunks": self.chunks,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self.load_seconds = None
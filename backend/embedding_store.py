@@ -0,0 +1,145 @@
+"""
+On-disk store of the ResNet50 pooled features of every sampled frame.
+
+Layout inside a video's anomaly folder:
+    embeddings.f16          raw float16 matrix, one row of `dim` values per frame
+    embeddings_frames.i64   raw int64 frame numbers, one per row
+    embeddings_sampled.i64  raw int64 numbers of every sampled frame, static ones included
+    embeddings.json         dim, count, sampled and the video/chunk parameters
+
+Frames the motion gate found static have no row; the sampled frame numbers
+tell where they were, so a re-score sees the same frame sequence as ingest.
+The raw files are read back with np.memmap, so re-scoring a video with a
+new classifier never has to decode the video or run the CNN again.
+"""
+import json
+import os
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.f16"
+FRAME_INDEX_FILE = "embeddings_frames.i64"
+SAMPLED_FILE = "embeddings_sampled.i64"
+META_FILE = "embeddings.json"
+FEATURE_DIM = 2048
+
+
+class EmbeddingStoreWriter:
+    def __init__(self, folder: str, dim: int = FEATURE_DIM, metadata: dict = None, resume_count: int = None, resume_sampled: int = None):
+        self.folder = folder
+        self.dim = dim
+        self.metadata = metadata or {}
+        self.count = 0
+        self.sampled = 0
+        # Written under .tmp names and renamed on close, so a crashed run
+        # never leaves a half-written store behind
+        self._features_path = os.path.join(folder, EMBEDDINGS_FILE)
+        self._frames_path = os.path.join(folder, FRAME_INDEX_FILE)
+        self._sampled_path = os.path.join(folder, SAMPLED_FILE)
+        if resume_count is None:
+            self._features_file = open(self._features_path + ".tmp", "wb")
+            self._frames_file = open(self._frames_path + ".tmp", "wb")
+            self._sampled_file = open(self._sampled_path + ".tmp", "wb")
+        else:
+            self._resume(resume_count, resume_sampled)
+
+    @property
+    def _files(self):
+        return (self._features_file, self._frames_file, self._sampled_file)
+
+    def _resume(self, count: int, sampled: int):
+        """Continue the .tmp files of an interrupted run, dropping rows written after its last flush()."""
+        if sampled is None:
+            raise FileNotFoundError("Cannot resume embeddings: the checkpoint has no count of sampled frames")
+        row_bytes = self.dim * np.dtype(np.float16).itemsize
+        sizes = {
+            self._features_path + ".tmp": count * row_bytes,
+            self._frames_path + ".tmp": count * np.dtype(np.int64).itemsize,
+            self._sampled_path + ".tmp": sampled * np.dtype(np.int64).itemsize,
+        }
+        for path, size in sizes.items():
+            if not os.path.exists(path) or os.path.getsize(path) < size:
+                raise FileNotFoundError(f"Cannot resume embeddings: {path} is missing or shorter than expected ({size} bytes)")
+        self._features_file = open(self._features_path + ".tmp", "r+b")
+        self._frames_file = open(self._frames_path + ".tmp", "r+b")
+        self._sampled_file = open(self._sampled_path + ".tmp", "r+b")
+        for f, size in zip(self._files, sizes.values()):
+            f.truncate(size)
+            f.seek(size)
+        self.count = count
+        self.sampled = sampled
+
+    def append(self, frame_numbers: np.ndarray, features: np.ndarray, sampled: np.ndarray = None):
+        """Rows for the embedded frames; sampled, every sampled frame number of the same frames, static ones included."""
+        if sampled is not None and len(sampled):
+            np.asarray(sampled, dtype=np.int64).tofile(self._sampled_file)
+            self.sampled += len(sampled)
+        if len(frame_numbers) == 0:
+            return
+        features = np.asarray(features)
+        if features.ndim != 2 or features.shape[1] != self.dim:
+            raise ValueError(f"Expected features of shape (n, {self.dim}), got {features.shape}")
+        features.astype(np.float16, copy=False).tofile(self._features_file)
+        np.asarray(frame_numbers, dtype=np.int64).tofile(self._frames_file)
+        self.count += len(frame_numbers)
+
+    def flush(self):
+        """Make the rows appended so far durable (used at chunk checkpoints)."""
+        for f in self._files:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def detach(self):
+        """Close the files but keep the .tmp data, so a later run can resume it."""
+        for f in self._files:
+            f.close()
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        os.replace(self._features_path + ".tmp", self._features_path)
+        os.replace(self._frames_path + ".tmp", self._frames_path)
+        os.replace(self._sampled_path + ".tmp", self._sampled_path)
+
+        meta = dict(self.metadata, dim=self.dim, count=self.count, sampled=self.sampled, dtype="float16")
+        meta_path = os.path.join(self.folder, META_FILE)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def abort(self):
+        for f in self._files:
+            f.close()
+        for path in (self._features_path + ".tmp", self._frames_path + ".tmp", self._sampled_path + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class EmbeddingStore:
+    def __init__(self, folder: str):
+        with open(os.path.join(folder, META_FILE), "r") as f:
+            self.metadata = json.load(f)
+        self.dim = self.metadata["dim"]
+        self.count = self.metadata["count"]
+        if self.count:
+            self.features = np.memmap(os.path.join(folder, EMBEDDINGS_FILE), dtype=np.float16, mode="r", shape=(self.count, self.dim))
+            self.frame_numbers = np.memmap(os.path.join(folder, FRAME_INDEX_FILE), dtype=np.int64, mode="r", shape=(self.count,))
+        else:
+            self.features = np.empty((0, self.dim), dtype=np.float16)
+            self.frame_numbers = np.empty(0, dtype=np.int64)
+        # Stores written before the sampled frames were recorded have None
+        self.sampled_frames = None
+        sampled = self.metadata.get("sampled")
+        if sampled:
+            self.sampled_frames = np.memmap(os.path.join(folder, SAMPLED_FILE), dtype=np.int64, mode="r", shape=(sampled,))
+        elif sampled == 0:
+            self.sampled_frames = np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, META_FILE))
+
+    def iter_blocks(self, block_size: int = 4096):
+        """Yield (frame_numbers, float32 features) blocks in frame order."""
+        for start in range(0, self.count, block_size):
+            end = min(start + block_size, self.count)
+            yield np.asarray(self.frame_numbers[start:end]), np.asarray(self.features[start:end], dtype=np.float32)
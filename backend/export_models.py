@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Export the ResNet50 feature extractor for the ONNX Runtime and TFLite backends.
+
+    --onnx     weights/resnet50.onnx (float32, via tf2onnx)
+    --tflite   weights/resnet50_int8.tflite (int8 weights and activations,
+               float32 input/output), calibrated on frames sampled from
+               the given videos
+
+Calibration frames go through the same resize + caffe preprocessing as the
+indexing pipeline, so the quantization ranges match what the model sees in
+production. Use footage from the cameras the system will run on.
+
+Usage:
+    python export_models.py --onnx --tflite --calibration-videos uploaded_videos/*.mp4 [--calibration-frames 200]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from frame_buffer import IMAGENET_MEAN_BGR
+from frame_source import probe_video, open_frame_source
+from inference_backends import FRAME_SIZE, ONNX_MODEL_FILE, TFLITE_MODEL_FILE, build_keras_resnet50
+
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights")
+
+
+def calibration_frames(video_paths, count):
+    """Up to count preprocessed frames, spread evenly over all the videos."""
+    per_video = max(1, count // max(1, len(video_paths)))
+    frames = []
+    for path in video_paths:
+        input_fps, total_frames = probe_video(path)
+        frame_skip = max(1, total_frames // per_video)
+        taken = 0
+        for _, frame in open_frame_source(path, "opencv", input_fps, frame_skip, total_frames):
+            if taken >= per_video:
+                break
+            frames.append(frame[:, :, ::-1].astype(np.float32) - IMAGENET_MEAN_BGR)
+            taken += 1
+    return frames[:count]
+
+
+def export_onnx(model, output_path):
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None, FRAME_SIZE, FRAME_SIZE, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=output_path)
+
+
+def export_tflite_int8(model, output_path, frames):
+    import tensorflow as tf
+
+    def representative_dataset():
+        for frame in frames:
+            yield [frame[None]]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--onnx", action="store_true")
+    parser.add_argument("--tflite", action="store_true")
+    parser.add_argument("--calibration-videos", nargs="*", default=[])
+    parser.add_argument("--calibration-frames", type=int, default=200)
+    parser.add_argument("--output-dir", default=WEIGHTS_DIR)
+    args = parser.parse_args()
+
+    if not (args.onnx or args.tflite):
+        parser.error("nothing to do, pass --onnx and/or --tflite")
+    if args.tflite and not args.calibration_videos:
+        parser.error("--tflite needs --calibration-videos for int8 calibration")
+
+    from tensorflow.keras import mixed_precision
+    mixed_precision.set_global_policy('float32')  # Export the float32 graph
+    model = build_keras_resnet50()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.onnx:
+        path = os.path.join(args.output_dir, ONNX_MODEL_FILE)
+        export_onnx(model, path)
+        print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+    if args.tflite:
+        frames = calibration_frames(args.calibration_videos, args.calibration_frames)
+        if not frames:
+            sys.exit("No calibration frames could be decoded")
+        print(f"Calibrating int8 quantization on {len(frames)} frames...")
+        path = os.path.join(args.output_dir, TFLITE_MODEL_FILE)
+        export_tflite_int8(model, path, frames)
+        print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Preallocated frame batch buffers for the indexing pipeline.
+
+A FrameBatchRing owns a fixed number of FrameBatch slots. Each slot holds
+a uint8 frame array, a float32 model-input array of the same shape, the
+ResNet50 features and parallel frame-number / timestamp arrays. Slots are
+reused for the whole video, so memory use depends only on the number of
+slots and BATCH_SIZE, not on video length or on how many chunks turn out
+to be anomalous.
+"""
+import queue
+import numpy as np
+
+FRAME_SIZE = 224
+FEATURE_DIM = 2048
+
+# ResNet50 "caffe" preprocessing: flip channel order, subtract ImageNet mean
+IMAGENET_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+class FrameBatch:
+    def __init__(self, slot: int, batch_size: int, frame_size: int = FRAME_SIZE, feature_dim: int = FEATURE_DIM):
+        self.slot = slot
+        self.batch_size = batch_size
+        self.frames = np.empty((batch_size, frame_size, frame_size, 3), dtype=np.uint8)
+        self.inputs = np.empty((batch_size, frame_size, frame_size, 3), dtype=np.float32)
+        self.frame_numbers = np.empty(batch_size, dtype=np.int64)
+        self.timestamps = np.empty(batch_size, dtype=np.float64)  # Seconds from the start of the video
+        self.features = np.empty((batch_size, feature_dim), dtype=np.float32)  # Rows follow active_indices
+        self.scores = np.empty(batch_size, dtype=np.float32)  # SVM decision score per frame, -inf when static
+        self.motion = np.empty(batch_size, dtype=np.float32)
+        self.active = np.empty(batch_size, dtype=bool)  # False for static frames that skip the CNN
+        self.reset(-1)
+
+    def reset(self, chunk_index: int):
+        self.chunk_index = chunk_index
+        self.count = 0
+        self.chunk_end = False  # Last batch of its chunk (may be empty)
+        self.active_indices = np.empty(0, dtype=np.int64)
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.batch_size
+
+    def append(self, frame_number: int, timestamp: float, frame: np.ndarray):
+        i = self.count
+        self.frames[i] = frame
+        self.frame_numbers[i] = frame_number
+        self.timestamps[i] = timestamp
+        self.active[i] = True
+        self.count = i + 1
+
+    @property
+    def active_count(self) -> int:
+        return len(self.active_indices)
+
+    def preprocess(self) -> np.ndarray:
+        """
+        Fill the model-input array in place for the active frames and return
+        the used part. Row i of the result belongs to frame active_indices[i].
+        """
+        n = self.count
+        self.active_indices = np.flatnonzero(self.active[:n])
+        k = len(self.active_indices)
+        inputs = self.inputs[:k]
+        frames = self.frames[:n] if k == n else self.frames[self.active_indices]
+        # Same result as resnet50.preprocess_input on each frame, but done
+        # as two vectorized passes over the whole batch
+        np.copyto(inputs, frames[:, :, :, ::-1])
+        inputs -= IMAGENET_MEAN_BGR
+        return inputs
+
+    @property
+    def nbytes(self) -> int:
+        return (self.frames.nbytes + self.inputs.nbytes + self.features.nbytes
+                + self.frame_numbers.nbytes + self.timestamps.nbytes)
+
+
+class FrameBatchRing:
+    def __init__(self, slots: int, batch_size: int, frame_size: int = FRAME_SIZE):
+        self.batches = [FrameBatch(i, batch_size, frame_size) for i in range(max(1, slots))]
+        self._free = queue.Queue()
+        for batch in self.batches:
+            self._free.put(batch)
+
+    def acquire(self, chunk_index: int, timeout: float = None):
+        """Take a free slot, waiting up to timeout seconds. Returns None on timeout."""
+        try:
+            batch = self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        batch.reset(chunk_index)
+        return batch
+
+    def release(self, batch: FrameBatch):
+        self._free.put(batch)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(batch.nbytes for batch in self.batches)
+
+
+class ChunkBuffer:
+    """
+    Collects the frames, scores and features of one chunk while its batches
+    go back to the ring, so anomaly intervals and keyframes can be decided on
+    the whole chunk. It is allocated once per video with room for every
+    sampled frame of a chunk.
+    """
+
+    def __init__(self, capacity: int, frame_size: int = FRAME_SIZE, feature_dim: int = FEATURE_DIM):
+        self.capacity = capacity
+        self.frames = np.empty((capacity, frame_size, frame_size, 3), dtype=np.uint8)
+        self.frame_numbers = np.empty(capacity, dtype=np.int64)
+        self.scores = np.empty(capacity, dtype=np.float32)
+        self.features = np.empty((capacity, feature_dim), dtype=np.float32)  # Row i belongs to frame i
+        self.has_features = np.empty(capacity, dtype=bool)  # False for static frames
+        self.reset(-1)
+
+    def reset(self, chunk_index: int):
+        self.chunk_index = chunk_index
+        self.count = 0
+
+    def add(self, batch: FrameBatch):
+        n = min(batch.count, self.capacity - self.count)
+        i = self.count
+        self.frames[i:i + n] = batch.frames[:n]
+        self.frame_numbers[i:i + n] = batch.frame_numbers[:n]
+        self.scores[i:i + n] = batch.scores[:n]
+        self.has_features[i:i + n] = False
+        rows = batch.active_indices < n
+        self.features[i + batch.active_indices[rows]] = batch.features[:batch.active_count][rows]
+        self.has_features[i + batch.active_indices[rows]] = True
+        self.count = i + n
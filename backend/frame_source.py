@@ -0,0 +1,226 @@
+"""
+Frame sources for the video indexing pipeline.
+
+A frame source reads a video file in a single forward pass and yields
+(frame_number, frame) tuples, where frame is a 224x224 BGR uint8 array.
+Only the sampled frames (roughly one in every frame_skip) are produced,
+so callers never have to seek or resize.
+"""
+import queue
+import re
+import subprocess
+import threading
+import cv2
+import numpy as np
+
+FRAME_SIZE = 224
+FRAME_SOURCE_MODES = ("opencv", "ffmpeg")
+LOG_TIMEOUT_SECONDS = 10  # How long a frame waits for its timestamp in ffmpeg's log
+_PTS_TIME = re.compile(r"pts_time:\s*(-?[0-9.]+)")
+
+
+def probe_video(video_path: str):
+    """Return (input_fps, total_frames) for a video file."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Error opening video: {video_path}")
+    try:
+        input_fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+    return input_fps, total_frames
+
+
+def probe_frame_size(video_path: str):
+    """Return (width, height) of a video file, (0, 0) when unknown."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        cap.release()
+
+
+def probe_codec(video_path: str) -> str:
+    """FourCC of the video stream as text (e.g. "h264", "XVID"), "" when unknown."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        cap.release()
+    return "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\x00 ") if fourcc > 0 else ""
+
+
+class OpenCVFrameSource:
+    """
+    Decodes with cv2.VideoCapture in one forward pass.
+    Skipped frames are only grab()bed; retrieve() and the resize run
+    for the frames that are actually kept.
+    """
+
+    def __init__(self, video_path: str, frame_skip: int, frames_per_chunk: int, start_frame: int = 0):
+        self.video_path = video_path
+        self.frame_skip = max(1, frame_skip)
+        self.frames_per_chunk = max(1, frames_per_chunk)
+        self.start_frame = start_frame
+        self._cap = None
+
+    def __iter__(self):
+        self._cap = cv2.VideoCapture(self.video_path)
+        if not self._cap.isOpened():
+            raise IOError(f"Error opening video: {self.video_path}")
+        try:
+            frame_number = 0
+            if self.start_frame:
+                # One seek when resuming, then the same forward pass
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+                # Where the decoder says it landed, which need not be start_frame on every file
+                frame_number = int(self._cap.get(cv2.CAP_PROP_POS_FRAMES))
+            while self._cap.grab():
+                # Keep the same sampling as the per-chunk loop: every
+                # frame_skip-th frame counted from the start of its chunk
+                if (frame_number % self.frames_per_chunk) % self.frame_skip == 0:
+                    ret, frame = self._cap.retrieve()
+                    if not ret:
+                        break
+                    yield frame_number, cv2.resize(frame, (FRAME_SIZE, FRAME_SIZE))
+                frame_number += 1
+        finally:
+            self.close()
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+class FFmpegFrameSource:
+    """
+    Decodes through an ffmpeg pipe. Frame selection and scaling run inside
+    the decoder, so Python only receives the sampled raw 224x224 frames.
+
+    Every frame_skip-th decoded frame is kept (select on the frame index,
+    passthrough timing, so nothing is duplicated or dropped to hit a
+    rate), and its frame number is read back from ffmpeg: the showinfo
+    filter logs each kept frame's original timestamp (-copyts), and the
+    number is its distance from the first frame's timestamp times
+    input_fps, as OpenCV counts after a seek. A seek that lands off
+    start_frame therefore does not shift the numbers. For variable frame
+    rate input they are the frame a constant input_fps would have at that
+    time, which is how the rest of the pipeline turns frame numbers into
+    seconds.
+    """
+
+    def __init__(self, video_path: str, input_fps: float, frame_skip: int, start_frame: int = 0):
+        self.video_path = video_path
+        self.input_fps = input_fps
+        self.frame_skip = max(1, frame_skip)
+        self.start_frame = start_frame
+        self._process = None
+        self._timestamps = None
+        self._first_timestamp = None
+
+    def _command(self, seek: bool = True, frames: int = 0):
+        # Half a frame early, so rounding cannot skip the start frame
+        seek = ["-ss", f"{max(0.0, (self.start_frame - 0.5) / self.input_fps):.6f}"] if seek and self.start_frame else []
+        return [
+            "ffmpeg",
+            "-hide_banner",
+            "-v", "info",  # showinfo logs at info level
+            *seek,
+            "-copyts",
+            "-i", self.video_path,
+            "-an", "-sn",
+            "-vf", f"select=not(mod(n\\,{self.frame_skip})),showinfo,scale={FRAME_SIZE}:{FRAME_SIZE}:flags=bilinear",
+            "-vsync", "passthrough",
+            *(["-frames:v", str(frames)] if frames else []),
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "pipe:1",
+        ]
+
+    def _probe_first_timestamp(self):
+        """Timestamp of the video's first frame, the origin of the frame numbers."""
+        result = subprocess.run(self._command(seek=False, frames=1), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        pts_time = _PTS_TIME.search(result.stderr.decode("utf-8", "replace"))
+        return float(pts_time.group(1)) if pts_time else 0.0
+
+    def _read_log(self, stderr):
+        """Stderr thread: the timestamp of every kept frame, in order."""
+        try:
+            for line in iter(stderr.readline, b""):
+                if b"Parsed_showinfo" in line:
+                    pts_time = _PTS_TIME.search(line.decode("utf-8", "replace"))
+                    if pts_time:
+                        self._timestamps.put(float(pts_time.group(1)))
+        finally:
+            self._timestamps.put(None)
+
+    def _frame_number(self, previous: int) -> int:
+        try:
+            timestamp = self._timestamps.get(timeout=LOG_TIMEOUT_SECONDS)
+        except queue.Empty:
+            timestamp = None
+        if timestamp is None:
+            # No timestamp from ffmpeg: fall back to counting
+            self._timestamps.put(None)
+            return previous + self.frame_skip if previous is not None else self.start_frame
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+        number = int(round((timestamp - self._first_timestamp) * self.input_fps))
+        # Duplicate timestamps (VFR) must not repeat a frame number
+        return max(number, previous + 1) if previous is not None else number
+
+    def __iter__(self):
+        frame_bytes = FRAME_SIZE * FRAME_SIZE * 3
+        self._timestamps = queue.Queue()
+        self._first_timestamp = self._probe_first_timestamp() if self.start_frame else None
+        self._process = subprocess.Popen(
+            self._command(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=frame_bytes * 4,
+        )
+        log_reader = threading.Thread(target=self._read_log, args=(self._process.stderr,), name="ffmpeg-log", daemon=True)
+        log_reader.start()
+        try:
+            frame_number = None
+            while True:
+                frame = np.empty((FRAME_SIZE, FRAME_SIZE, 3), dtype=np.uint8)
+                if not self._read_into(frame, frame_bytes):
+                    break
+                frame_number = self._frame_number(frame_number)
+                yield frame_number, frame
+        finally:
+            self.close()
+            log_reader.join(timeout=1.0)
+
+    def _read_into(self, frame: np.ndarray, frame_bytes: int) -> bool:
+        view = memoryview(frame).cast("B")
+        filled = 0
+        while filled < frame_bytes:
+            n = self._process.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def close(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.stdout.close()
+            self._process.wait()
+            self._process = None
+
+
+def open_frame_source(video_path: str, mode: str, input_fps: float, frame_skip: int, frames_per_chunk: int, start_frame: int = 0):
+    """
+    Create the frame source for the given mode ("opencv" or "ffmpeg").
+    start_frame (a chunk boundary) skips the beginning of the video.
+    """
+    if mode == "ffmpeg":
+        return FFmpegFrameSource(video_path, input_fps, frame_skip, start_frame)
+    if mode == "opencv":
+        return OpenCVFrameSource(video_path, frame_skip, frames_per_chunk, start_frame)
+    raise ValueError(f"Unknown frame source mode: {mode} (expected one of {FRAME_SOURCE_MODES})")
@@ -0,0 +1,127 @@
+"""
+Content-addressed on-disk cache for Gemini results.
+
+Chunk analyses are keyed by the prompt template version, the model name
+and the perceptual hashes (pHash) of the keyframes that are sent, so the
+same footage re-uploaded, reprocessed or seen by two near-identical
+cameras is answered from disk. Entries are JSON files evicted in LRU
+order once the cache grows beyond max_bytes.
+
+Several instances (job worker processes) may share a folder: a key
+missing from this instance's index is still looked up on disk, so an
+entry another process wrote is a hit. Each instance's size accounting
+and LRU order only cover the entries it has seen.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+def phash(frame: np.ndarray) -> str:
+    """64-bit DCT perceptual hash of a BGR frame, as 16 hex digits."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()[1:]  # Drop the DC term
+    bits = low > np.median(low)
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):016x}"
+
+
+def make_key(*parts) -> str:
+    """sha256 over the given parts (strings or lists of strings)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (list, tuple)):
+            part = ",".join(part)
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class GeminiCache:
+    def __init__(self, folder: str, max_bytes: int = 256 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(folder, exist_ok=True)
+        files = []
+        for name in os.listdir(folder):
+            if name.endswith(".json"):
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            # Not only indexed keys: another instance may have written it since this one started
+            with open(path, "r") as f:
+                data = f.read()
+            value = json.loads(data)
+            os.utime(path)  # Keep the LRU order across restarts
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self._bytes += len(data)
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value):
+        data = json.dumps(value)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                self.evictions += 1
+                try:
+                    os.remove(self._path(oldest))
+                except OSError:
+                    pass
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,136 @@
+"""
+Concurrent, rate-limited execution of Gemini requests.
+
+GeminiPool runs calls on a thread pool with a cap on concurrent requests,
+a token-bucket rate limit shared by every video, and a bound on how many
+requests may be queued. Each video submits its chunk analyses through its
+own GeminiBatch, which hands the results back in submission (chunk) order.
+A process without the pool (a job worker) batches through a ForwardingPool,
+which hands each request to the process that has it.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one token is available, then take it."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeminiPool:
+    def __init__(self, max_concurrency: int = 4, requests_per_minute: float = 60, max_pending: int = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0, self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini")
+        # Bounds the frames held by queued requests when detection runs far ahead
+        self._pending = threading.BoundedSemaphore(max_pending or self.max_concurrency * 4)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); blocks while too many requests are pending."""
+        self._pending.acquire()
+        try:
+            return self._executor.submit(self._call, fn, args, kwargs, self._pending)
+        except BaseException:
+            self._pending.release()
+            raise
+
+    def submit_nowait(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) without waiting for room; for requests their sender already bounds."""
+        return self._executor.submit(self._call, fn, args, kwargs, None)
+
+    def _call(self, fn, args, kwargs, pending):
+        try:
+            self.rate_limiter.acquire()
+            with self._lock:
+                self.in_flight += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    self.completed += 1
+        finally:
+            if pending is not None:
+                pending.release()
+
+    def batch(self):
+        return GeminiBatch(self)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class ForwardingPool:
+    """
+    Stands in for a GeminiPool in another process: send(fn, args, kwargs)
+    hands one request over and returns a future of its result. At most
+    max_pending requests are out at once, so their frames stay bounded here.
+    """
+
+    def __init__(self, send, max_pending: int):
+        self._send = send
+        self._pending = threading.BoundedSemaphore(max(1, max_pending))
+
+    def submit(self, fn, *args, **kwargs):
+        self._pending.acquire()
+        try:
+            future = self._send(fn, args, kwargs)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def batch(self):
+        return GeminiBatch(self)
+
+
+class GeminiBatch:
+    """The requests of one video; results come back in submission order."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._futures = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = self._pool.submit(fn, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for f in self._futures if not f.done())
+
+    def results(self) -> list:
+        """Wait for every request; failed requests yield None."""
+        results = []
+        for future in self._futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Gemini request failed: {e}")
+                results.append(None)
+        return results
@@ -0,0 +1,130 @@
+"""
+Interchangeable runtimes for the ResNet50 feature extractor.
+
+Every backend takes a batch of caffe-preprocessed frames (see
+FrameBatch.preprocess), float32 (n, 224, 224, 3), and returns the pooled
+(n, 2048) float32 features the SVM was trained on:
+
+    keras   the tf.keras ResNet50 with ImageNet weights (mixed_float16 only
+            when a GPU is present; it is slower than float32 on CPU). The
+            built model is cached as <cache_dir>/resnet50_<policy>.keras
+            and loaded from there on later starts
+    onnx    ONNX Runtime on CPU, from weights/resnet50.onnx
+    tflite  int8-quantized TFLite, from weights/resnet50_int8.tflite
+
+The ONNX and TFLite files are produced from the Keras weights by
+export_models.py.
+"""
+import os
+import numpy as np
+
+FRAME_SIZE = 224
+FEATURE_DIM = 2048
+INFERENCE_BACKENDS = ("keras", "onnx", "tflite")
+ONNX_MODEL_FILE = "resnet50.onnx"
+TFLITE_MODEL_FILE = "resnet50_int8.tflite"
+
+
+def build_keras_resnet50():
+    from tensorflow.keras.applications import ResNet50
+    return ResNet50(weights='imagenet', include_top=False, pooling='avg', input_shape=(FRAME_SIZE, FRAME_SIZE, 3))
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, mixed_float16: bool = None, threads: int = 0, cache_dir: str = None):
+        import tensorflow as tf
+        from tensorflow.keras import mixed_precision
+
+        if threads:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+        if mixed_float16 is None:
+            mixed_float16 = bool(tf.config.list_physical_devices('GPU'))
+        policy = 'mixed_float16' if mixed_float16 else 'float32'
+        mixed_precision.set_global_policy(policy)
+        self.mixed_float16 = mixed_float16
+        self.cache_path = os.path.join(cache_dir, f"resnet50_{policy}.keras") if cache_dir else None
+        self.model = self._load_cached()
+        if self.model is None:
+            self.model = build_keras_resnet50()
+            if self.cache_path:
+                self._save_cached()
+
+    def _load_cached(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        from tensorflow import keras
+        try:
+            return keras.models.load_model(self.cache_path, compile=False)
+        except Exception as e:
+            print(f"Ignoring unreadable model cache {self.cache_path}: {e}")
+            return None
+
+    def _save_cached(self):
+        tmp_path = self.cache_path[:-len(".keras")] + ".tmp.keras"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            self.model.save(tmp_path)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Could not cache the built model at {self.cache_path}: {e}")
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        # One forward pass for the whole batch; predict() would split it into 32s
+        return np.asarray(self.model.predict(batch, batch_size=max(1, len(batch)), verbose=0), dtype=np.float32)
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_path: str, threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return np.asarray(self.session.run(None, {self.input_name: batch})[0], dtype=np.float32)
+
+
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, model_path: str, threads: int = 0):
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=threads or None)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self._batch_size = None
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        # The interpreter is resized only when the batch size changes
+        if len(batch) != self._batch_size:
+            self.interpreter.resize_input_tensor(self.input_index, [len(batch), FRAME_SIZE, FRAME_SIZE, 3])
+            self.interpreter.allocate_tensors()
+            self._batch_size = len(batch)
+        self.interpreter.set_tensor(self.input_index, np.ascontiguousarray(batch, dtype=np.float32))
+        self.interpreter.invoke()
+        return np.array(self.interpreter.get_tensor(self.output_index), dtype=np.float32)
+
+
+def create_backend(name: str, model_dir: str, threads: int = 0, mixed_float16: bool = None, cache_dir: str = None):
+    if name not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name} (expected one of {INFERENCE_BACKENDS})")
+    if name == "keras":
+        return KerasBackend(mixed_float16=mixed_float16, threads=threads, cache_dir=cache_dir)
+
+    model_file = ONNX_MODEL_FILE if name == "onnx" else TFLITE_MODEL_FILE
+    model_path = os.path.join(model_dir, model_file)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"{model_path} not found; create it with: python export_models.py --{name}")
+    if name == "onnx":
+        return OnnxBackend(model_path, threads=threads)
+    return TFLiteBackend(model_path, threads=threads)
@@ -0,0 +1,213 @@
+"""
+Shared batching of feature-extraction requests, independent of chunks.
+
+Callers (the inference stage of every video being processed, live streams)
+submit the preprocessed active frames of a FrameBatch and get a future for
+their features. One worker thread packs whatever is queued into model
+batches of batch_size frames, no matter which chunk or video the frames
+came from, and copies the features back to each request. When fewer
+frames are queued it waits up to max_wait for more before running a
+partial batch. Urgent requests (live streams) go ahead of queued bulk work.
+
+tune_batch_size() picks batch_size from a throughput / latency sweep of
+the loaded model on the current host.
+"""
+import collections
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("inputs", "out", "future", "offset", "remaining")
+
+    def __init__(self, inputs: np.ndarray, out: np.ndarray, future: Future):
+        self.inputs = inputs
+        self.out = out
+        self.future = future
+        self.offset = 0  # First row not yet handed to the model
+        self.remaining = len(inputs)  # Rows whose features are still missing
+
+
+class InferenceBatcher:
+    def __init__(self, predict, batch_size: int = 32, max_wait: float = 0.01, on_batch=None):
+        """
+        predict(inputs) -> features is only ever called from the worker
+        thread; on_batch(rows, seconds), when given, after every model batch.
+        """
+        self.predict = predict
+        self.on_batch = on_batch
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self._queues = (collections.deque(), collections.deque())  # urgent, bulk
+        self._queued_rows = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        self._buffer = None
+        # Counters for stats()
+        self.batches = 0
+        self.frames = 0
+        self.requests = 0
+        self.busy_seconds = 0.0
+
+    def submit(self, inputs: np.ndarray, out: np.ndarray = None, urgent: bool = False) -> Future:
+        """
+        Queue inputs (n, H, W, C); the future resolves to their (n, dim)
+        features, written into out when given. inputs must stay unchanged
+        until then.
+        """
+        future = Future()
+        if len(inputs) == 0:
+            future.set_result(out if out is not None else np.empty((0, 0), dtype=np.float32))
+            return future
+        with self._cond:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+                self._worker.start()
+            self._queues[0 if urgent else 1].append(_Request(inputs, out, future))
+            self._queued_rows += len(inputs)
+            self.requests += 1
+            self._cond.notify()
+        return future
+
+    def run(self, inputs: np.ndarray, out: np.ndarray = None, urgent: bool = False) -> np.ndarray:
+        return self.submit(inputs, out, urgent).result()
+
+    def _take(self):
+        """Up to batch_size rows from the head of the queues, as (request, lo, hi) pieces."""
+        pieces = []
+        rows = 0
+        for queue in self._queues:
+            while queue and rows < self.batch_size:
+                request = queue[0]
+                n = min(len(request.inputs) - request.offset, self.batch_size - rows)
+                pieces.append((request, request.offset, request.offset + n))
+                request.offset += n
+                rows += n
+                if request.offset == len(request.inputs):
+                    queue.popleft()
+        self._queued_rows -= rows
+        return pieces, rows
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queued_rows:
+                    self._cond.wait()
+                # A partial batch waits briefly for more frames; urgent work does not
+                deadline = time.monotonic() + self.max_wait
+                while self._queued_rows < self.batch_size and not self._queues[0]:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                pieces, rows = self._take()
+
+            # Any error from here on fails this batch's requests, not the worker
+            try:
+                self._run_batch(pieces, rows)
+            except BaseException as e:
+                self._fail(pieces, e)
+
+    def _run_batch(self, pieces, rows):
+        if len(pieces) == 1:
+            request, lo, hi = pieces[0]
+            inputs = request.inputs[lo:hi]
+        else:
+            # Frames of several chunks / videos packed into one batch
+            first = pieces[0][0].inputs
+            if self._buffer is None or len(self._buffer) < rows or self._buffer.shape[1:] != first.shape[1:]:
+                self._buffer = np.empty((max(rows, self.batch_size),) + first.shape[1:], dtype=first.dtype)
+            pos = 0
+            for request, lo, hi in pieces:
+                self._buffer[pos:pos + hi - lo] = request.inputs[lo:hi]
+                pos += hi - lo
+            inputs = self._buffer[:rows]
+
+        started = time.perf_counter()
+        features = np.asarray(self.predict(inputs))
+        seconds = time.perf_counter() - started
+        self.busy_seconds += seconds
+        self.batches += 1
+        self.frames += rows
+        if self.on_batch is not None:
+            self.on_batch(rows, seconds)
+
+        pos = 0
+        for request, lo, hi in pieces:
+            if request.out is None:
+                request.out = np.empty((len(request.inputs), features.shape[1]), dtype=features.dtype)
+            request.out[lo:hi] = features[pos:pos + hi - lo]
+            pos += hi - lo
+            request.remaining -= hi - lo
+            if request.remaining == 0 and not request.future.done():
+                request.future.set_result(request.out)
+
+    def _fail(self, pieces, error):
+        with self._cond:
+            for request, _, _ in pieces:
+                # Rows of a failed request that are still queued are dropped
+                for queue in self._queues:
+                    if request in queue:
+                        queue.remove(request)
+                        self._queued_rows -= len(request.inputs) - request.offset
+                if not request.future.done():
+                    request.future.set_exception(error)
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "frames": self.frames,
+            "mean_batch_fill": round(self.frames / self.batches / self.batch_size, 3) if self.batches else None,
+            "images_per_second": round(self.frames / self.busy_seconds, 1) if self.busy_seconds else None,
+            "queued_frames": self._queued_rows,
+        }
+
+
+def tune_batch_size(predict, candidates: list, input_shape: tuple = (224, 224, 3), baseline: int = None,
+                    max_batch_ms: float = 0, tolerance: float = 0.05, repeats: int = 3, min_seconds: float = 0.5) -> dict:
+    """
+    Time predict on each candidate batch size (plus baseline, the size to
+    compare against) and pick the smallest size within tolerance of the
+    best throughput, among those that take at most max_batch_ms (0: no limit).
+    Each size is timed at least repeats times and for min_seconds, keeping
+    the fastest call. The sweep stops early once throughput falls well
+    below its peak.
+    """
+    sizes = sorted(set(candidates) | ({baseline} if baseline else set()))
+    sweep = []
+    best = 0.0
+    for size in sizes:
+        inputs = np.zeros((size,) + tuple(input_shape), dtype=np.float32)
+        predict(inputs)  # Warm-up: graph tracing, allocations
+        seconds = float("inf")
+        timed, spent = 0, 0.0
+        while timed < repeats or spent < min_seconds:
+            started = time.perf_counter()
+            predict(inputs)
+            elapsed = time.perf_counter() - started
+            seconds = min(seconds, elapsed)
+            spent += elapsed
+            timed += 1
+        sweep.append({"batch_size": size, "images_per_second": round(size / seconds, 1), "batch_ms": round(seconds * 1000.0, 1)})
+        best = max(best, size / seconds)
+        if size / seconds < best * (1 - 3 * tolerance) and size > (baseline or 0):
+            break
+
+    allowed = [row for row in sweep if row["batch_size"] in candidates and (not max_batch_ms or row["batch_ms"] <= max_batch_ms)]
+    if not allowed:
+        allowed = [min((row for row in sweep if row["batch_size"] in candidates), key=lambda row: row["batch_size"])]
+    peak = max(row["images_per_second"] for row in allowed)
+    chosen = min((row for row in allowed if row["images_per_second"] >= peak * (1 - tolerance)), key=lambda row: row["batch_size"])
+    result = {"batch_size": chosen["batch_size"], "images_per_second": chosen["images_per_second"], "sweep": sweep}
+    reference = next((row for row in sweep if row["batch_size"] == baseline), None)
+    if reference is not None:
+        result["baseline_batch_size"] = baseline
+        result["baseline_images_per_second"] = reference["images_per_second"]
+        result["speedup"] = round(chosen["images_per_second"] / reference["images_per_second"], 2)
+    return result
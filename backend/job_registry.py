@@ -0,0 +1,215 @@
+"""
+In-memory registry of video processing jobs.
+
+Every upload gets a Job with an id, a state machine, progress and the
+time spent in each state. Progress updates only touch memory and wake
+the subscribers of the job (the SSE endpoint), so clients following a
+job cause no filesystem I/O. The job is written to
+anomaly/<video>/processing_status.json at checkpoints only: on state
+changes, not on every chunk. The file keeps the old status/message/
+progress/timestamp keys, so the file-based endpoints and a restarted
+service still see it.
+
+A job can be given a cancel event (bind_cancel). Once it is set, the
+next update from the processing code moves the job to cancelled and
+raises JobCancelled, so every progress report is a cancellation point.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+QUEUED, STARTING, PROCESSING, ANALYZING, FINALIZING, COMPLETE, ERROR, CANCELLED = (
+    "queued", "starting", "processing", "analyzing", "finalizing", "complete", "error", "cancelled"
+)
+TERMINAL_STATES = (COMPLETE, ERROR, CANCELLED)
+
+# Allowed state changes; any unfinished job may also fail or be cancelled
+TRANSITIONS = {
+    QUEUED: {STARTING},
+    STARTING: {PROCESSING},
+    PROCESSING: {ANALYZING, FINALIZING},
+    ANALYZING: {PROCESSING, FINALIZING},
+    FINALIZING: {COMPLETE},
+    COMPLETE: set(),
+    ERROR: set(),
+    CANCELLED: set(),
+}
+
+STATUS_FILE = "processing_status.json"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, video_name: str, filename: str, folder: str, priority: int = None):
+        self.id = job_id
+        self.video_name = video_name
+        self.filename = filename
+        self.folder = folder
+        self.state = QUEUED
+        self.message = "Queued for processing"
+        self.progress = 0.0
+        self.error = None
+        self.priority = priority
+        self.queue_position = None  # 1-based while queued, when a scheduler reports it
+        self.cancel = None  # Event set to cancel the job; see bind_cancel
+        self.created = datetime.now().isoformat()
+        self.updated = self.created
+        self.version = 0  # Incremented on every update; used as the SSE event id
+        self.stage_timings = {}  # Seconds spent in each state, plus pipeline stage busy times
+        self._state_started = time.monotonic()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "video_name": self.video_name,
+            "filename": self.filename,
+            "status": self.state,
+            "message": self.message,
+            "progress": round(self.progress, 1),
+            "error": self.error,
+            "priority": self.priority,
+            "queue_position": self.queue_position,
+            "created": self.created,
+            "timestamp": self.updated,
+            "version": self.version,
+            "stage_timings": dict(self.stage_timings),
+        }
+
+
+class JobRegistry:
+    def __init__(self, max_finished: int = 200):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._by_video = {}  # video_name -> id of its latest job
+        self._subscribers = {}  # job id -> [(loop, asyncio.Queue)]
+        self._listeners = []  # Called with every snapshot, e.g. to forward it to another process
+        self._lock = threading.Lock()
+
+    def create(self, video_name: str, filename: str, folder: str, job_id: str = None, priority: int = None) -> Job:
+        job = Job(job_id or uuid.uuid4().hex[:12], video_name, filename, folder, priority)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._by_video[video_name] = job.id
+            self._evict_finished()
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def latest_for_video(self, video_name: str):
+        job_id = self._by_video.get(video_name)
+        return self._jobs.get(job_id) if job_id else None
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def update(self, job_id: str, state: str = None, message: str = None, progress: float = None, error: str = None,
+               queue_position: int = None):
+        """
+        Apply an update in memory and notify subscribers; state changes are
+        persisted. Raises JobCancelled, after moving the job to cancelled,
+        when its cancel event is set.
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            cancelled = job.cancel is not None and job.cancel.is_set() and not job.finished and state not in TERMINAL_STATES
+            if cancelled:
+                state, message, error = CANCELLED, "Cancelled", None
+            changed = state is not None and state != job.state
+            if changed:
+                if job.finished or (state not in (ERROR, CANCELLED) and state not in TRANSITIONS[job.state]):
+                    raise ValueError(f"Job {job_id}: invalid transition {job.state} -> {state}")
+                now = time.monotonic()
+                job.stage_timings[job.state] = round(job.stage_timings.get(job.state, 0.0) + now - job._state_started, 3)
+                job._state_started = now
+                job.state = state
+                if state != QUEUED:
+                    job.queue_position = None
+            if queue_position is not None and job.state == QUEUED:
+                job.queue_position = queue_position
+            if message is not None:
+                job.message = message
+            if progress is not None:
+                job.progress = float(progress)
+            if error is not None:
+                job.error = error
+            if job.state == COMPLETE:
+                job.progress = 100.0
+            job.updated = datetime.now().isoformat()
+            job.version += 1
+            snapshot = job.to_dict()
+            subscribers = list(self._subscribers.get(job_id, ()))
+            if job.finished:
+                self._evict_finished()
+
+        if changed:
+            self.checkpoint(job_id)
+        for loop, q in subscribers:
+            loop.call_soon_threadsafe(q.put_nowait, snapshot)
+        for listener in self._listeners:
+            listener(snapshot)
+        if cancelled:
+            raise JobCancelled(job_id)
+        return snapshot
+
+    def bind_cancel(self, job_id: str, event):
+        """Cancel the job at its next update once event (threading or multiprocessing Event) is set."""
+        with self._lock:
+            self._jobs[job_id].cancel = event
+
+    def listen(self, listener):
+        """Call listener(snapshot) after every update of any job."""
+        self._listeners.append(listener)
+
+    def add_timings(self, job_id: str, timings: dict):
+        with self._lock:
+            self._jobs[job_id].stage_timings.update(timings)
+
+    def checkpoint(self, job_id: str):
+        """Write the job to its status file (atomically)."""
+        job = self._jobs.get(job_id)
+        if job is None or not job.folder:
+            return
+        path = os.path.join(job.folder, STATUS_FILE)
+        try:
+            os.makedirs(job.folder, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(job.to_dict(), f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Could not persist job {job_id}: {e}")
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """Queue of job snapshots for the calling event loop, starting with the current one."""
+        q = asyncio.Queue()
+        with self._lock:
+            q.put_nowait(self._jobs[job_id].to_dict())
+            self._subscribers.setdefault(job_id, []).append((asyncio.get_running_loop(), q))
+        return q
+
+    def unsubscribe(self, job_id: str, q: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id, [])
+            subscribers[:] = [s for s in subscribers if s[1] is not q]
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            job = self._jobs.pop(job_id)
+            if self._by_video.get(job.video_name) == job_id:
+                del self._by_video[job.video_name]
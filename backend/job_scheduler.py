@@ -0,0 +1,482 @@
+"""
+Bounded, prioritized scheduling of video processing jobs.
+
+Jobs wait in a priority queue of at most max_queued entries (lower
+priority value first, then in submission order) and run at most
+concurrency at a time. With processes=True every running job has a
+worker process of its own, spawned once and reused for later jobs, so a
+busy job neither slows down the API's event loop nor shares its memory;
+otherwise jobs run on threads of the calling process.
+
+runner(job_id, args, cancel, emit) runs one job. It must be a
+module-level function (it is pickled into the workers), should return
+once cancel is set, and reports back through emit(kind, payload), which
+calls handler(job_id, kind, payload) in the parent. The scheduler itself
+calls the handler with:
+
+    "position"   payload: 1-based queue position, whenever it changes
+    "cancelled"  payload: None; the job was cancelled while queued, or its
+                 worker was stopped after ignoring a cancel for cancel_grace
+    "finished"   payload: None, or the error the runner raised
+    "lost"       payload: reason; the worker process died during the job
+
+signal(job_id, message) hands message to signal_handler(job_id, message,
+emit) in the process running the job, on a thread of its own in a worker
+process, so a running job can be asked for something besides cancelling.
+The handler must be module-level too and should return quickly.
+
+call_parent(name, payload), in a worker process, goes the other way: it
+runs call_handler(job_id, name, payload) in the parent, for components
+that only the parent holds, and returns a Future of the result. The
+handler runs on the thread that relays events, so it must not block; it
+returns the result or a concurrent Future of it. Calls of a job still
+waiting when it ends fail.
+"""
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# In a job worker process: the index of the slot it serves, set before the initializer runs
+_worker_index = None
+# In a job worker process: the event queue, the running job and its calls waiting for the parent's reply
+_events = None
+_job_id = None
+_calls = {}
+_call_ids = itertools.count()
+_calls_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def current_worker_index():
+    """Slot index of this job worker process (0..concurrency-1), None outside one."""
+    return _worker_index
+
+
+def call_parent(name: str, payload=None) -> Future:
+    """In a job worker process: call_handler(job_id, name, payload) of the parent, for the running job."""
+    if _events is None:
+        raise RuntimeError("Not in a job worker process")
+    future = Future()
+    with _calls_lock:
+        call_id = next(_call_ids)
+        _calls[call_id] = future
+    _events.put((_job_id, "call", (call_id, name, payload)))
+    return future
+
+
+def _reply(call_id, ok: bool, value):
+    with _calls_lock:
+        future = _calls.pop(call_id, None)
+    if future is None or future.done():
+        return  # The job ended before the reply came
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(RuntimeError(value))
+
+
+def _fail_calls(reason: str):
+    with _calls_lock:
+        waiting = list(_calls)
+    for call_id in waiting:
+        _reply(call_id, False, reason)
+
+
+def _control_loop(control, events, signal_handler):
+    """Job worker process thread: pass the messages sent by signal() to signal_handler, and replies to calls."""
+    while True:
+        try:
+            message = control.get()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        if message[0] == "reply":
+            _reply(*message[1:])
+            continue
+        _, job_id, payload = message
+        if signal_handler is None:
+            continue
+
+        def emit(kind, event, job_id=job_id):
+            events.put((job_id, kind, event))
+
+        try:
+            signal_handler(job_id, payload, emit)
+        except Exception as e:
+            print(f"Job worker: handling a signal for job {job_id} failed: {e}")
+
+
+def _worker_main(index, runner, initializer, tasks, events, cancel, control=None, signal_handler=None):
+    """Job worker process: run the jobs sent on tasks, one at a time."""
+    global _worker_index, _events, _job_id
+    _worker_index = index
+    _events = events
+    threading.Thread(target=_control_loop, args=(control, events, signal_handler), name="job-control", daemon=True).start()
+    if initializer is not None:
+        initializer()
+    while True:
+        try:
+            task = tasks.get(timeout=1.0)
+        except queue.Empty:
+            if not multiprocessing.parent_process().is_alive():
+                return  # The server is gone
+            continue
+        if task is None:
+            return
+        job_id, args = task
+        _job_id = job_id
+
+        def emit(kind, payload, job_id=job_id):
+            events.put((job_id, kind, payload))
+
+        try:
+            runner(job_id, args, cancel, emit)
+            error = None
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+        _fail_calls(f"Job {job_id} ended")
+        events.put((job_id, "finished", error))
+
+
+class _Slot:
+    """A place for one running job: a worker process, or a thread started per job."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.tasks = None
+        self.control = None
+        self.cancel = None
+        self.job_id = None
+        self.started = None
+        self.cancel_deadline = None
+        self.jobs_run = 0
+
+
+class JobScheduler:
+    def __init__(self, runner, handler, concurrency: int = 2, max_queued: int = 50, processes: bool = True,
+                 initializer=None, cancel_grace: float = 30.0, signal_handler=None, call_handler=None):
+        self.runner = runner
+        self.handler = handler
+        self.signal_handler = signal_handler
+        self.call_handler = call_handler
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max_queued
+        self.processes = processes
+        self.initializer = initializer
+        self.cancel_grace = cancel_grace
+        self._slots = [_Slot(i) for i in range(self.concurrency)]
+        self._queue = []  # heap of (priority, seq, job_id)
+        self._args = {}  # queued job id -> (args, priority, submitted)
+        self._positions = {}  # queued job id -> position last reported
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        self._context = multiprocessing.get_context("spawn")  # Fork is unsafe once TF / ONNX Runtime are loaded
+        self._events = None
+        self._collector = None
+        self._closed = False
+        # Counters for stats()
+        self.submitted = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.respawns = 0
+        self.wait_seconds = 0.0
+        # Workers are not daemons, so stop them before multiprocessing joins them at exit
+        atexit.register(self.shutdown)
+
+    @property
+    def full(self) -> bool:
+        return len(self._queue) >= self.max_queued
+
+    def has_room(self) -> bool:
+        """Whether submit() would accept a job now; a no counts as a rejection."""
+        with self._lock:
+            if self.full:
+                self.rejected += 1
+                return False
+            return True
+
+    def start(self):
+        """Spawn the worker processes now rather than on the first job."""
+        with self._lock:
+            if self.processes:
+                for slot in self._slots:
+                    self._ensure_process(slot)
+        return self
+
+    def submit(self, job_id: str, args: tuple = (), priority: int = 1) -> int:
+        """Queue a job; returns its queue position (0 when it started at once). Raises QueueFull."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            if self.full:
+                self.rejected += 1
+                raise QueueFull(f"{len(self._queue)} jobs are already waiting")
+            heapq.heappush(self._queue, (priority, next(self._seq), job_id))
+            self._args[job_id] = (args, priority, time.monotonic())
+            self.submitted += 1
+            self._dispatch()
+        self._report_positions()
+        return self.position(job_id) or 0
+
+    def position(self, job_id: str):
+        """1-based position among the queued jobs, None when not queued."""
+        with self._lock:
+            for i, (_, _, queued_id) in enumerate(sorted(self._queue)):
+                if queued_id == job_id:
+                    return i + 1
+        return None
+
+    def cancel(self, job_id: str):
+        """Cancel a queued or running job. Returns "queued", "running" or None (unknown / finished)."""
+        with self._lock:
+            if job_id in self._args:
+                self._queue = [entry for entry in self._queue if entry[2] != job_id]
+                heapq.heapify(self._queue)
+                del self._args[job_id]
+                self.cancelled += 1
+                notify = True
+                state = "queued"
+            else:
+                slot = next((slot for slot in self._slots if slot.job_id == job_id), None)
+                if slot is None:
+                    return None
+                slot.cancel.set()
+                if slot.process is not None and slot.cancel_deadline is None:
+                    slot.cancel_deadline = time.monotonic() + self.cancel_grace
+                notify = False
+                state = "running"
+        if notify:
+            self._notify(job_id, "cancelled", None)
+            self._report_positions()
+        return state
+
+    def signal(self, job_id: str, message) -> bool:
+        """Send message to the signal_handler of a running job; False when the job is not running."""
+        with self._lock:
+            slot = next((slot for slot in self._slots if slot.job_id == job_id), None)
+            if slot is None or self.signal_handler is None:
+                return False
+            if self.processes:
+                slot.control.put(("signal", job_id, message))
+                return True
+
+        def emit(kind, payload):
+            self._notify(job_id, kind, payload)
+
+        self.signal_handler(job_id, message, emit)
+        return True
+
+    def _ensure_process(self, slot: _Slot):
+        if slot.process is not None and slot.process.is_alive():
+            return
+        if self._events is None:
+            self._events = self._context.Queue()
+            self._collector = threading.Thread(target=self._collect, name="job-scheduler", daemon=True)
+            self._collector.start()
+        if slot.process is not None:
+            self.respawns += 1
+        slot.tasks = self._context.Queue()
+        slot.control = self._context.Queue()
+        slot.cancel = self._context.Event()
+        slot.process = self._context.Process(
+            target=_worker_main,
+            args=(slot.index, self.runner, self.initializer, slot.tasks, self._events, slot.cancel, slot.control, self.signal_handler),
+            # Not a daemon: a job may start its own chunk worker processes
+            name=f"job-worker-{slot.index}", daemon=False
+        )
+        slot.process.start()
+
+    def _dispatch(self):
+        """Start queued jobs on free slots; the caller holds the lock."""
+        for slot in self._slots:
+            if not self._queue:
+                break
+            if slot.job_id is not None:
+                continue
+            _, _, job_id = heapq.heappop(self._queue)
+            args, _, submitted = self._args.pop(job_id)
+            self.wait_seconds += time.monotonic() - submitted
+            self.dispatched += 1
+            slot.job_id = job_id
+            slot.started = time.monotonic()
+            slot.cancel_deadline = None
+            slot.jobs_run += 1
+            if self.processes:
+                self._ensure_process(slot)
+                slot.cancel.clear()
+                slot.tasks.put((job_id, args))
+            else:
+                slot.cancel = threading.Event()
+                threading.Thread(target=self._run_thread, args=(slot, job_id, args), name=f"job-{job_id}", daemon=True).start()
+
+    def _notify(self, job_id: str, kind: str, payload):
+        try:
+            self.handler(job_id, kind, payload)
+        except Exception as e:
+            print(f"Job scheduler: handling {kind} of job {job_id} failed: {e}")
+
+    def _answer(self, slot: _Slot, job_id: str, call: tuple):
+        """Run a job worker's call_parent() on call_handler and send the result back to it."""
+        call_id, name, payload = call
+        control = slot.control
+
+        def reply(ok, value):
+            try:
+                control.put(("reply", call_id, ok, value))
+            except (ValueError, OSError):
+                pass  # The worker is gone
+
+        try:
+            if self.call_handler is None:
+                raise RuntimeError("The scheduler has no call handler")
+            result = self.call_handler(job_id, name, payload)
+        except Exception as e:
+            reply(False, f"{type(e).__name__}: {e}")
+            return
+        if not isinstance(result, Future):
+            reply(True, result)
+            return
+
+        def done(future):
+            if future.cancelled():
+                reply(False, f"Call {name} was cancelled")
+            elif future.exception() is not None:
+                reply(False, f"{type(future.exception()).__name__}: {future.exception()}")
+            else:
+                reply(True, future.result())
+
+        result.add_done_callback(done)
+
+    def _report_positions(self):
+        with self._lock:
+            queued = [job_id for _, _, job_id in sorted(self._queue)]
+            changed = [(job_id, i + 1) for i, job_id in enumerate(queued) if self._positions.get(job_id) != i + 1]
+            self._positions = {job_id: i + 1 for i, job_id in enumerate(queued)}
+        for job_id, position in changed:
+            self._notify(job_id, "position", position)
+
+    def _run_thread(self, slot: _Slot, job_id: str, args: tuple):
+        def emit(kind, payload):
+            self._notify(job_id, kind, payload)
+
+        try:
+            self.runner(job_id, args, slot.cancel, emit)
+            error = None
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+        self._finish(slot, job_id, "finished", error)
+
+    def _finish(self, slot: _Slot, job_id: str, kind: str, payload):
+        with self._lock:
+            if slot.job_id != job_id:
+                return
+            if kind == "lost" and slot.cancel.is_set():
+                kind, payload = "cancelled", None
+            if kind == "cancelled" or slot.cancel.is_set():
+                self.cancelled += 1
+            elif kind == "finished" and payload is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+            slot.job_id = None
+            slot.cancel_deadline = None
+        self._notify(job_id, kind, payload)
+        with self._lock:
+            if self._closed:
+                return
+            self._dispatch()
+        self._report_positions()
+
+    def _collect(self):
+        """Relay worker events to the handler; notice dead workers and overdue cancels."""
+        while not self._closed:
+            try:
+                job_id, kind, payload = self._events.get(timeout=0.5)
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+            else:
+                slot = next((slot for slot in self._slots if slot.job_id == job_id), None)
+                if kind == "finished" and slot is not None:
+                    self._finish(slot, job_id, kind, payload)
+                elif kind == "call" and slot is not None:
+                    self._answer(slot, job_id, payload)
+                elif slot is not None:
+                    self._notify(job_id, kind, payload)
+
+            now = time.monotonic()
+            for slot in self._slots:
+                with self._lock:
+                    job_id = slot.job_id
+                    overdue = slot.cancel_deadline is not None and now > slot.cancel_deadline
+                    dead = job_id is not None and slot.process is not None and not slot.process.is_alive()
+                if job_id is None:
+                    continue
+                if overdue and not dead:
+                    print(f"Job {job_id} ignored its cancel for {self.cancel_grace:.0f}s; stopping worker {slot.index}")
+                    slot.process.terminate()
+                    slot.process.join(5)
+                    if slot.process.is_alive():
+                        slot.process.kill()
+                        slot.process.join()
+                    self._finish(slot, job_id, "cancelled", None)
+                elif dead and self._events.empty():
+                    # Events the worker sent before dying have all been relayed
+                    self._finish(slot, job_id, "lost", f"Worker process exited with code {slot.process.exitcode}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "mode": "processes" if self.processes else "threads",
+                "concurrency": self.concurrency,
+                "max_queued": self.max_queued,
+                "queued": len(self._queue),
+                "running": [
+                    {"job_id": slot.job_id, "worker": slot.index, "seconds": round(now - slot.started, 1),
+                     "cancelling": slot.cancel.is_set()}
+                    for slot in self._slots if slot.job_id is not None
+                ],
+                "workers_alive": sum(slot.process is not None and slot.process.is_alive() for slot in self._slots),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+                "respawns": self.respawns,
+                "mean_wait_seconds": round(self.wait_seconds / self.dispatched, 3) if self.dispatched else None,
+            }
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop the workers; queued jobs are dropped and running ones are cut short."""
+        with self._lock:
+            self._closed = True
+            self._queue.clear()
+            self._args.clear()
+            for slot in self._slots:
+                if slot.cancel is not None:
+                    slot.cancel.set()
+        for slot in self._slots:
+            if slot.process is not None:
+                slot.tasks.put(None)
+                slot.control.put(None)
+                slot.process.join(timeout)
+                if slot.process.is_alive():
+                    slot.process.terminate()
+                    slot.process.join()
+                slot.process = None
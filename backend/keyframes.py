@@ -0,0 +1,81 @@
+"""
+Keyframe selection for VLM requests.
+
+Instead of a fixed stride over the anomalous frames, pick at most K frames
+that are both anomalous and different from each other: farthest-point
+sampling over frame descriptors, seeded with the highest-scoring frame.
+Descriptors are the ResNet50 embeddings the pipeline already computed, or
+small color histograms when some candidates have no embedding. Frames
+closer than min_distance to an already picked one are treated as
+near-duplicates and never sent.
+"""
+import cv2
+import numpy as np
+
+KEYFRAME_METHODS = ("diverse", "even")
+
+
+def histogram_descriptors(frames: np.ndarray, bins: int = 8) -> np.ndarray:
+    """3D BGR color histograms on a subsampled frame, one row per frame."""
+    rows = []
+    for frame in frames:
+        hist = cv2.calcHist([np.ascontiguousarray(frame[::4, ::4])], [0, 1, 2], None, [bins] * 3, [0, 256] * 3)
+        rows.append(hist.flatten())
+    return np.array(rows, dtype=np.float32)
+
+
+def _cosine_distances(descriptors: np.ndarray, index: int) -> np.ndarray:
+    return 1.0 - descriptors @ descriptors[index]
+
+
+def select_diverse(descriptors: np.ndarray, scores: np.ndarray, k: int, min_distance: float = 0.02) -> np.ndarray:
+    """Indices (sorted by position) of up to k diverse, high-scoring rows."""
+    n = len(descriptors)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    norms = np.linalg.norm(descriptors, axis=1, keepdims=True)
+    unit = descriptors / np.maximum(norms, 1e-12)
+    # Static frames score -inf; rank them just below the lowest real score
+    scores = np.asarray(scores, dtype=np.float32)
+    finite = np.isfinite(scores)
+    floor = float(scores[finite].min()) - 1.0 if finite.any() else 0.0
+    finite_scores = np.where(finite, scores, floor)
+
+    first = int(np.argmax(finite_scores))
+    picks = [first]
+    nearest = _cosine_distances(unit, first)
+    while len(picks) < min(k, n):
+        # Farthest from everything picked so far; ties go to the higher score
+        candidate = int(np.lexsort((-finite_scores, -nearest))[0])
+        if nearest[candidate] < min_distance:
+            break
+        picks.append(candidate)
+        nearest = np.minimum(nearest, _cosine_distances(unit, candidate))
+    return np.sort(np.array(picks, dtype=np.int64))
+
+
+def select_even(count: int, k: int) -> np.ndarray:
+    """k indices spread evenly over range(count) (the previous behaviour)."""
+    if count == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.linspace(0, count - 1, min(k, count)).round().astype(np.int64))
+
+
+def select_keyframes(frames: np.ndarray, scores: np.ndarray, k: int, method: str = "diverse",
+                     features: np.ndarray = None, has_features: np.ndarray = None, min_distance: float = 0.02) -> np.ndarray:
+    """
+    Pick up to k of the candidate frames. features/has_features are the
+    ResNet50 embeddings of the candidates and which rows are valid; they
+    are used when every candidate has one, color histograms otherwise.
+    """
+    if method not in KEYFRAME_METHODS:
+        raise ValueError(f"Unknown keyframe method: {method} (expected one of {KEYFRAME_METHODS})")
+    if method == "even":
+        return select_even(len(frames), k)
+
+    if features is not None and has_features is not None and len(has_features) and has_features.all():
+        descriptors = features
+    else:
+        descriptors = histogram_descriptors(frames)
+    return select_diverse(descriptors, scores, k, min_distance)
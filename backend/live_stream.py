@@ -0,0 +1,407 @@
+"""
+Continuous anomaly detection on live camera streams.
+
+A LiveStream attaches to anything cv2.VideoCapture opens (RTSP, MJPEG or
+HTTP camera URLs) or to a local file replayed at its own frame rate, which
+stands in for a camera. A reader thread decodes at the source rate, keeps
+one frame every 1/sample_fps seconds and hands it over through a small
+buffer that drops the oldest frame when detection falls behind, so memory
+stays fixed, and frames that waited longer than max_delay are skipped, so
+latency does not build up. A detector thread scores
+whatever is buffered as one micro-batch and runs the scores through the
+same AnomalyIntervalDetector as uploaded videos. An anomaly_start event is
+published as soon as an interval reaches its minimum length and an
+anomaly_end event when it closes; only a sliding window of recent scores
+and events is kept.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from frame_buffer import FrameBatch, FRAME_SIZE
+
+CONNECTING, RUNNING, RECONNECTING, ENDED, STOPPED, ERROR = (
+    "connecting", "running", "reconnecting", "ended", "stopped", "error"
+)
+FINISHED_STATES = (ENDED, STOPPED, ERROR)
+
+
+def is_file_source(source: str) -> bool:
+    return "://" not in source and os.path.isfile(source)
+
+
+class LatencyStats:
+    """Recent latencies in milliseconds (bounded) with percentiles."""
+
+    def __init__(self, maxlen: int = 1000):
+        self._values = deque(maxlen=maxlen)
+        self.count = 0
+
+    def add(self, milliseconds: float):
+        self._values.append(milliseconds)
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        if not self._values:
+            return {"count": 0, "last": None, "p50": None, "p95": None, "max": None}
+        values = np.fromiter(self._values, dtype=np.float64)
+        return {
+            "count": self.count,
+            "last": round(values[-1], 1),
+            "p50": round(float(np.percentile(values, 50)), 1),
+            "p95": round(float(np.percentile(values, 95)), 1),
+            "max": round(float(values.max()), 1),
+        }
+
+
+class LiveStream:
+    def __init__(self, stream_id: str, source: str, score_batch, detector, motion_gate, sample_fps: float = 5.0,
+                 realtime: bool = True, loop: bool = False, batch_size: int = 16, buffer_frames: int = 32,
+                 max_delay: float = 1.0, window_seconds: float = 60.0, reconnect_attempts: int = 5,
+                 events_path: str = None):
+        """
+        score_batch(batch) fills batch.scores[:batch.count] from the frames
+        whose batch.active flag survived motion_gate. realtime paces a file
+        source at its native fps; loop replays it from the start at EOF.
+        Buffered frames older than max_delay seconds are dropped unscored.
+        """
+        self.id = stream_id
+        self.source = source
+        self.is_file = is_file_source(source)
+        self.score_batch = score_batch
+        self.detector = detector
+        self.motion_gate = motion_gate
+        self.sample_fps = sample_fps
+        self.realtime = realtime
+        self.loop = loop
+        self.reconnect_attempts = reconnect_attempts
+        self.events_path = events_path
+
+        self.state = CONNECTING
+        self.error = None
+        self.started = datetime.now().isoformat()
+        self.source_fps = None
+
+        self._batch = FrameBatch(0, max(1, batch_size))
+        self._captured_at = np.empty(self._batch.batch_size, dtype=np.float64)  # time.monotonic() per frame
+        self._buffer = deque()
+        self._buffer_frames = max(1, buffer_frames)
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._stop_requested = False
+        self._reader_done = False
+        self._threads = []
+
+        # Sliding window of (stream seconds, raw score, smoothed score)
+        self._window = deque(maxlen=max(1, int(window_seconds * sample_fps)))
+        self._last_time = 0.0
+        self._active = None  # Published event that has not ended yet
+        self._event_count = 0
+        self.events = deque(maxlen=200)
+        self._subscribers = []  # [(loop, asyncio.Queue)]
+        self._lock = threading.Lock()
+
+        self.frames_decoded = 0
+        self.frames_sampled = 0
+        self.frames_dropped = 0
+        self.frames_scored = 0
+        self.batches = 0
+        self.reconnects = 0
+        self.capture_to_score = LatencyStats()
+        self.event_latency = LatencyStats()
+        self._rate = deque(maxlen=50)  # monotonic times of recently scored batches with their frame counts
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def start(self):
+        for name, target in (("reader", self._read_loop), ("detector", self._detect_loop)):
+            thread = threading.Thread(target=target, name=f"live-{self.id}-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_requested = True
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    # Reader
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            raise IOError(f"Cannot open stream: {self.source}")
+        if not self.is_file:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Keep the driver from queueing stale frames
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.source_fps = fps if fps and 0 < fps < 1000 else None
+        return cap
+
+    def _read_loop(self):
+        step = 1.0 / self.sample_fps
+        cap = None
+        try:
+            cap = self._open()
+            self.state = RUNNING
+            origin = time.monotonic()
+            offset = 0.0  # Stream time at which the current pass over a file started
+            file_index = 0
+            next_sample = 0.0
+            failures = 0
+            while not self._stop.is_set():
+                if cap is None or not cap.grab():
+                    if cap is not None:
+                        cap.release()
+                        cap = None
+                    if self.is_file:
+                        if not self.loop:
+                            break
+                        offset += file_index / (self.source_fps or 25.0)
+                        file_index = 0
+                        cap = self._open()
+                        continue
+                    # Live source dropped: retry with backoff, keeping the stream clock
+                    failures += 1
+                    if failures > self.reconnect_attempts:
+                        raise IOError(f"Stream lost after {self.reconnect_attempts} reconnect attempts: {self.source}")
+                    self.state = RECONNECTING
+                    self.reconnects += 1
+                    if self._stop.wait(min(2.0 ** failures, 30.0)):
+                        break
+                    try:
+                        cap = self._open()
+                        self.state = RUNNING
+                    except IOError as e:
+                        print(f"Live stream {self.id}: {e}")
+                    continue
+
+                failures = 0
+                self.frames_decoded += 1
+                if self.is_file:
+                    stream_time = offset + file_index / (self.source_fps or 25.0)
+                    file_index += 1
+                    if self.realtime:
+                        # A file stands in for a camera: frame i is "captured" at origin + its timestamp
+                        delay = origin + stream_time - time.monotonic()
+                        if delay > 0 and self._stop.wait(delay):
+                            break
+                else:
+                    stream_time = time.monotonic() - origin
+                if stream_time + 1e-6 < next_sample:
+                    continue
+                next_sample = next_sample + step if next_sample + step > stream_time else stream_time + step
+
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+                captured_at = time.monotonic()
+                frame = cv2.resize(frame, (FRAME_SIZE, FRAME_SIZE))
+                with self._cond:
+                    self._buffer.append((self.frames_sampled, stream_time, captured_at, frame))
+                    self.frames_sampled += 1
+                    if len(self._buffer) > self._buffer_frames:
+                        # Detection is behind: drop the oldest frame rather than add latency
+                        self._buffer.popleft()
+                        self.frames_dropped += 1
+                    self._cond.notify()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Live stream {self.id} reader failed: {e}")
+        finally:
+            if cap is not None:
+                cap.release()
+            with self._cond:
+                self._reader_done = True
+                self._cond.notify_all()
+
+    # Detector
+
+    def _detect_loop(self):
+        batch = self._batch
+        try:
+            while True:
+                with self._cond:
+                    while not self._buffer and not self._reader_done and not self._stop.is_set():
+                        self._cond.wait(0.5)
+                    if self._stop.is_set() or (not self._buffer and self._reader_done):
+                        break
+                    if self.max_delay:
+                        # Frames that waited too long are stale for alerting; keep the newest
+                        cutoff = time.monotonic() - self.max_delay
+                        while len(self._buffer) > 1 and self._buffer[0][2] < cutoff:
+                            self._buffer.popleft()
+                            self.frames_dropped += 1
+                    items = [self._buffer.popleft() for _ in range(min(len(self._buffer), batch.batch_size))]
+
+                batch.reset(0)
+                for i, (index, stream_time, captured_at, frame) in enumerate(items):
+                    batch.append(index, stream_time, frame)
+                    self._captured_at[i] = captured_at
+                self._score(batch)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Live stream {self.id} detector failed: {e}")
+        finally:
+            self._stop.set()
+            if self._active is not None:
+                self._end_event(self._last_time + 1.0 / self.sample_fps)
+            self.state = ERROR if self.error else STOPPED if self._stop_requested else ENDED
+            self._publish({"type": "stream_" + self.state, "stream_id": self.id, "error": self.error})
+
+    def _score(self, batch: FrameBatch):
+        n = batch.count
+        self.motion_gate.apply(batch.frames[:n], batch.motion, batch.active)
+        self.score_batch(batch)
+        scored_at = time.monotonic()
+        for captured_at in self._captured_at[:n]:
+            self.capture_to_score.add((scored_at - captured_at) * 1000.0)
+        self.frames_scored += n
+        self.batches += 1
+        self._rate.append((scored_at, n))
+
+        scores = batch.scores[:n]
+        times = batch.timestamps[:n]
+        open_run = self.detector.open_run
+        smoothed, intervals = self.detector.process(scores)
+        previous_time = self._last_time
+        with self._lock:
+            for t, score, value in zip(times, scores, smoothed):
+                self._window.append((float(t), float(score), float(value)))
+        self._last_time = float(times[-1])
+
+        step = 1.0 / self.sample_fps
+        for lo, hi in intervals:
+            continues = lo == 0 and open_run > 0
+            if self._active is None:
+                if continues:
+                    # The run began open_run frames before this batch
+                    start_time = (self._window[-(n + open_run)][0] if len(self._window) >= n + open_run
+                                  else previous_time - (open_run - 1) * step)
+                    trigger = max(0, self.detector.min_run - open_run - 1)
+                else:
+                    start_time = float(times[lo])
+                    trigger = lo + self.detector.min_run - 1
+                trigger = min(trigger, n - 1)
+                self._event_count += 1
+                self._active = {
+                    "event_id": self._event_count,
+                    "start_time": round(max(0.0, start_time), 3),
+                    "peak_score": float("-inf"),
+                }
+                latency = (time.monotonic() - self._captured_at[trigger]) * 1000.0
+                self.event_latency.add(latency)
+                if hi > lo:
+                    self._active["peak_score"] = float(scores[lo:hi].max())
+                self._publish(self._event("anomaly_start", latency_ms=round(latency, 1)))
+            elif hi > lo:
+                self._active["peak_score"] = max(self._active["peak_score"], float(scores[lo:hi].max()))
+            if hi < n:
+                self._end_event(float(times[hi - 1]) + step if hi > 0 else previous_time + step)
+
+    def _end_event(self, end_time: float):
+        self._publish(self._event("anomaly_end", end_time=round(end_time, 3)))
+        self._active = None
+
+    def _event(self, kind: str, **fields) -> dict:
+        event = {
+            "type": kind,
+            "stream_id": self.id,
+            "event_id": self._active["event_id"],
+            "start_time": self._active["start_time"],
+            "end_time": None,
+            "peak_score": round(self._active["peak_score"], 4) if np.isfinite(self._active["peak_score"]) else None,
+            "detected_at": datetime.now().isoformat(),
+        }
+        event.update(fields)
+        return event
+
+    def _publish(self, event: dict):
+        with self._lock:
+            if event["type"].startswith("anomaly_"):
+                self.events.append(event)
+            subscribers = list(self._subscribers)
+        if event["type"].startswith("anomaly_"):
+            at = event["end_time"] if event["end_time"] is not None else event["start_time"]
+            print(f"Live stream {self.id}: {event['type']} #{event['event_id']} at {at:.1f}s")
+            if self.events_path:
+                try:
+                    with open(self.events_path, "a") as f:
+                        f.write(json.dumps(event) + "\n")
+                except OSError as e:
+                    print(f"Could not log live event for {self.id}: {e}")
+        for loop, q in subscribers:
+            loop.call_soon_threadsafe(q.put_nowait, event)
+
+    # Readers of the stream state
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of events for the calling event loop."""
+        q = asyncio.Queue()
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), q))
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s[1] is not q]
+
+    def window(self) -> list:
+        """Recent (time, score, smoothed) samples; static frames have score None."""
+        with self._lock:
+            return [
+                {"time": round(t, 3), "score": round(s, 4) if np.isfinite(s) else None,
+                 "smoothed": round(v, 4) if np.isfinite(v) else None}
+                for t, s, v in self._window
+            ]
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            oldest = self._buffer[0][2] if self._buffer else None
+        rate = list(self._rate)
+        scored_fps = None
+        if len(rate) > 1 and rate[-1][0] > rate[0][0]:
+            scored_fps = round(sum(count for _, count in rate[1:]) / (rate[-1][0] - rate[0][0]), 2)
+        return {
+            "frames_decoded": self.frames_decoded,
+            "frames_sampled": self.frames_sampled,
+            "frames_scored": self.frames_scored,
+            "frames_dropped": self.frames_dropped,
+            "batches": self.batches,
+            "buffered_frames": len(self._buffer),
+            "scored_fps": scored_fps,
+            # How long the oldest frame not yet scored has been waiting
+            "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "capture_to_score_ms": self.capture_to_score.to_dict(),
+            "capture_to_event_ms": self.event_latency.to_dict(),
+            "reconnects": self.reconnects,
+            "motion_gate": self.motion_gate.stats(),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "stream_id": self.id,
+            "source": self.source,
+            "kind": "file" if self.is_file else "live",
+            "status": self.state,
+            "error": self.error,
+            "started": self.started,
+            "source_fps": self.source_fps,
+            "sample_fps": self.sample_fps,
+            "in_anomaly": self._active is not None,
+            "events": len(self.events),
+            "metrics": self.metrics(),
+        }
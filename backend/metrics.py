@@ -0,0 +1,338 @@
+"""
+Prometheus metrics without the prometheus_client dependency.
+
+Counters, gauges and histograms with labels, kept in a MetricsRegistry and
+rendered in the Prometheus text exposition format (version 0.0.4) for a
+/metrics endpoint. Gauges, and counters kept elsewhere, can read their
+values from a function at scrape time. A job worker process records into
+its own registry and sends drain() deltas to the server, which merge()s
+them, so one scrape of the server covers every process.
+
+StageBreakdown sums the per-stage timings of a single job for its
+analysis JSON.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+JOB_SECONDS_BUCKETS = (5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0, 7200.0)
+FPS_BUCKETS = (5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Child:
+    """A metric with its label values bound, from metric.labels(...)."""
+
+    def __init__(self, metric, key: tuple):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0):
+        self._metric._inc(self._key, amount)
+
+    def dec(self, amount: float = 1.0):
+        self._metric._inc(self._key, -amount)
+
+    def set(self, value: float):
+        self._metric._set(self._key, value)
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> value
+        self._function = None
+        self._lock = threading.Lock()
+        self._unlabelled = _Child(self, ())
+
+    def labels(self, **labels) -> _Child:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return _Child(self, tuple(str(labels[name]) for name in self.labelnames))
+
+    def set_function(self, fn):
+        """Read the values at scrape time: fn() returns a number, or {label values tuple: number} when labelled."""
+        self._function = fn
+        return self
+
+    # The unlabelled shortcuts: metric.inc(), metric.observe(v), ...
+    def inc(self, amount: float = 1.0):
+        self._unlabelled.inc(amount)
+
+    def set(self, value: float):
+        self._unlabelled.set(value)
+
+    def observe(self, value: float):
+        self._unlabelled.observe(value)
+
+    def time(self):
+        return self._unlabelled.time()
+
+    def _inc(self, key: tuple, amount: float):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _set(self, key: tuple, value: float):
+        raise TypeError(f"{self.kind} {self.name} cannot be set")
+
+    def _observe(self, key: tuple, value: float):
+        raise TypeError(f"{self.kind} {self.name} has no observations")
+
+    def _samples(self):
+        """(suffix, label values, extra label text, value) rows for render()."""
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception as e:
+                print(f"Metrics: reading {self.name} failed: {e}")
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+            values = {key if isinstance(key, tuple) else (key,): value for key, value in values.items()}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [("", tuple(str(v) for v in key), "", float(value)) for key, value in sorted(values.items()) if value is not None]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_label_text(self.labelnames, key, extra)} {_format(value)}")
+        return lines
+
+    def drain(self) -> dict:
+        """Values recorded since the last drain(), reset to zero here."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _inc(self, key: tuple, amount: float):
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} cannot decrease")
+        super()._inc(key, amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _set(self, key: tuple, value: float):
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = SECONDS_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _observe(self, key: tuple, value: float):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            # Counts per bucket, made cumulative in render()
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        rows = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                rows.append(("_bucket", key, f'le="{_format(bound)}"', cumulative))
+            rows.append(("_sum", key, "", total))
+            rows.append(("_count", key, "", count))
+        return rows
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = SECONDS_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> dict:
+        """Counter and histogram values recorded since the last drain(); gauges stay per process."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        delta = {}
+        for metric in metrics:
+            if metric.kind != "gauge" and metric._function is None:
+                values = metric.drain()
+                if values:
+                    delta[metric.name] = values
+        return delta
+
+    def merge(self, delta: dict):
+        """Add a drain() of another process's registry with the same metrics."""
+        for name, values in delta.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+
+def instrument_app(app, registry: MetricsRegistry, prefix: str):
+    """Count and time the HTTP requests of a FastAPI app, labelled by route and status code."""
+    requests = registry.counter(f"{prefix}_http_requests_total", "HTTP requests by route and status code", ("route", "method", "status"))
+    latency = registry.histogram(f"{prefix}_http_request_seconds", "Time until the response headers are sent", ("route", "method"))
+
+    @app.middleware("http")
+    async def record_request(request, call_next):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # The route template, not the path, so the labels stay few
+            route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+            latency.labels(route=route, method=request.method).observe(time.perf_counter() - started)
+            requests.labels(route=route, method=request.method, status=status).inc()
+
+
+class StageBreakdown:
+    """Per-stage call counts, seconds and frames of one job."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, frames: int = 0, metric=None):
+        """Record one call of stage; metric, a histogram (child), observes the same seconds."""
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "frames": 0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["frames"] += frames
+        if metric is not None:
+            metric.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str, metric=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started, metric=metric)
+
+    def seconds(self, stage: str) -> float:
+        entry = self._stages.get(stage)
+        return entry["seconds"] if entry else 0.0
+
+    def merge(self, breakdown: dict):
+        """Add the to_dict() of another breakdown (a shard's)."""
+        with self._lock:
+            for stage, other in breakdown.items():
+                entry = self._stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "frames": 0})
+                entry["count"] += other["count"]
+                entry["seconds"] += other["seconds"]
+                entry["max_seconds"] = max(entry["max_seconds"], other["max_ms"] / 1000.0)
+                entry["frames"] += other.get("frames", 0)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = {stage: dict(entry) for stage, entry in self._stages.items()}
+        result = {}
+        for stage, entry in stages.items():
+            row = {
+                "count": entry["count"],
+                "seconds": round(entry["seconds"], 4),
+                "mean_ms": round(entry["seconds"] / entry["count"] * 1000.0, 2) if entry["count"] else None,
+                "max_ms": round(entry["max_seconds"] * 1000.0, 2),
+            }
+            if entry["frames"]:
+                row["frames"] = entry["frames"]
+                row["frames_per_second"] = round(entry["frames"] / entry["seconds"], 1) if entry["seconds"] else None
+            result[stage] = row
+        return result
@@ -0,0 +1,126 @@
+"""
+Lazily loaded models with an optional background warm-up.
+
+Each model is registered with a loader function and built on first use,
+or ahead of time by warm_up() on a background thread, so importing the
+service (and every uvicorn reload or worker spawn) no longer waits for
+ResNet50. A failed load is recorded and reported by status() instead of
+leaving the module half-initialized; get() raises it to the caller.
+"""
+import threading
+import time
+import traceback
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class ModelLoadError(RuntimeError):
+    pass
+
+
+class _Entry:
+    def __init__(self, loader, required):
+        self.loader = loader
+        self.required = required
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.lock = threading.Lock()  # Held while loading, so concurrent get() calls wait
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._warmup_thread = None
+        self.created = time.monotonic()
+        self.ready_after = None  # Seconds from creation until every required model was loaded
+
+    def register(self, name: str, loader, required: bool = True):
+        """loader() builds the model; optional models do not gate readiness."""
+        self._entries[name] = _Entry(loader, required)
+
+    def get(self, name: str):
+        entry = self._entries[name]
+        if entry.state != READY:
+            self._load(name, entry)
+            if entry.state == FAILED:
+                raise ModelLoadError(f"Model '{name}' failed to load: {entry.error}")
+        return entry.value
+
+    def set(self, name: str, value):
+        """Replace a model, e.g. with a retrained one, without running its loader."""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.value = value
+            entry.state = READY
+            entry.error = None
+        self._check_ready()
+
+    def _load(self, name: str, entry: _Entry):
+        with entry.lock:
+            if entry.state in (READY, FAILED):
+                return
+            entry.state = LOADING
+            start = time.perf_counter()
+            try:
+                entry.value = entry.loader()
+                entry.state = READY
+            except Exception as e:
+                entry.error = f"{type(e).__name__}: {e}"
+                entry.state = FAILED
+                print(f"Error loading model '{name}':")
+                traceback.print_exc()
+            entry.seconds = round(time.perf_counter() - start, 3)
+        if entry.state == READY:
+            print(f"Model '{name}' loaded in {entry.seconds:.2f}s")
+            self._check_ready()
+
+    def _check_ready(self):
+        if self.ready_after is None and self.ready:
+            self.ready_after = round(time.monotonic() - self.created, 3)
+
+    def warm_up(self, background: bool = True, names: tuple = None):
+        """Load every registered model (or only names), on a daemon thread unless background is False."""
+        def load_all():
+            for name, entry in list(self._entries.items()):
+                if names is None or name in names:
+                    self._load(name, entry)
+
+        if not background:
+            load_all()
+            return None
+        if self._warmup_thread is None:
+            self._warmup_thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the warm-up thread is done. Returns readiness."""
+        if self._warmup_thread is not None:
+            self._warmup_thread.join(timeout)
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        return all(entry.state == READY for entry in self._entries.values() if entry.required)
+
+    @property
+    def failed(self) -> bool:
+        return any(entry.state == FAILED for entry in self._entries.values() if entry.required)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.monotonic() - self.created, 3),
+            "ready_after_seconds": self.ready_after,
+            "models": {
+                name: {
+                    "state": entry.state,
+                    "required": entry.required,
+                    "load_seconds": entry.seconds,
+                    "error": entry.error,
+                }
+                for name, entry in self._entries.items()
+            },
+        }
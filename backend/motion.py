@@ -0,0 +1,87 @@
+"""
+Cheap motion scoring used to skip ResNet50 on static frames.
+
+Frames are scored on a small grayscale copy, either by the mean absolute
+difference to the previous sampled frame ("diff", plain numpy) or by the
+foreground fraction of an OpenCV MOG2 background subtractor ("mog2").
+Frames scoring below the threshold are treated as static.
+"""
+import cv2
+import numpy as np
+
+MOTION_METHODS = ("off", "diff", "mog2")
+
+# BT.601 luma weights in BGR order
+_GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+
+class MotionGate:
+    def __init__(self, method: str = "diff", threshold: float = 0.01, stride: int = 4):
+        if method not in MOTION_METHODS:
+            raise ValueError(f"Unknown motion gate method: {method} (expected one of {MOTION_METHODS})")
+        self.method = method
+        self.threshold = threshold
+        self.stride = stride  # 224x224 frames are scored at 56x56
+        self._previous = None
+        self._subtractor = None
+        if method == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(history=200, varThreshold=16, detectShadows=False)
+
+        self.frames_seen = 0
+        self.frames_static = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.method != "off"
+
+    def _small_gray(self, frames: np.ndarray) -> np.ndarray:
+        small = frames[:, ::self.stride, ::self.stride].astype(np.float32)
+        return small @ _GRAY_WEIGHTS / 255.0
+
+    def score(self, frames: np.ndarray) -> np.ndarray:
+        """Motion score per frame, in order; the very first frame scores inf."""
+        if len(frames) == 0:
+            return np.empty(0, dtype=np.float32)
+
+        if self.method == "mog2":
+            scores = np.empty(len(frames), dtype=np.float32)
+            for i, frame in enumerate(frames[:, ::self.stride, ::self.stride]):
+                mask = self._subtractor.apply(np.ascontiguousarray(frame))
+                scores[i] = np.count_nonzero(mask) / mask.size
+            if self.frames_seen == 0:
+                scores[0] = np.inf
+            return scores
+
+        gray = self._small_gray(frames)
+        previous = gray[:-1]
+        if self._previous is not None:
+            previous = np.concatenate([self._previous[None], previous])
+        scores = np.abs(gray[len(gray) - len(previous):] - previous).mean(axis=(1, 2))
+        if self._previous is None:
+            scores = np.concatenate([[np.inf], scores])
+        self._previous = gray[-1]
+        return scores.astype(np.float32)
+
+    def apply(self, frames: np.ndarray, motion: np.ndarray, active: np.ndarray) -> int:
+        """Fill motion scores and the active mask for a batch. Returns the static count."""
+        n = len(frames)
+        if not self.enabled:
+            motion[:n] = np.inf
+            active[:n] = True
+            return 0
+
+        motion[:n] = self.score(frames)
+        np.greater_equal(motion[:n], self.threshold, out=active[:n])
+        static = n - int(np.count_nonzero(active[:n]))
+        self.frames_seen += n
+        self.frames_static += static
+        return static
+
+    def stats(self) -> dict:
+        return {
+            "method": self.method,
+            "threshold": self.threshold,
+            "frames_seen": self.frames_seen,
+            "frames_static": self.frames_static,
+            "static_ratio": round(self.frames_static / self.frames_seen, 3) if self.frames_seen else 0.0,
+        }
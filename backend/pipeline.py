@@ -0,0 +1,275 @@
+"""
+Staged producer/consumer pipeline with bounded queues.
+
+Each stage is a function that takes an iterator of items from the previous
+stage and yields items for the next one (the first stage takes no input).
+Stages run on their own threads, connected by bounded queues, so decode,
+preprocessing, inference and artifact writing overlap instead of waiting
+on each other. The same stages can also be chained on the calling thread
+(threaded=False) to get a sequential baseline with identical accounting.
+
+on_item(stage, busy_seconds, item) is called for every item a stage
+produces, with the time the stage spent on it (input waits excluded), and
+on_queue(queue, depth) for every depth sample of a queue, so callers can
+feed per-item latency metrics. A name, when given, goes into the names of
+the stage threads (pipeline-<name>-<stage>) so they can be told apart from
+another pipeline's, e.g. by a profiler.
+"""
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when another stage failed or the consumer quit."""
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.total_seconds = 0.0
+        self.wait_input_seconds = 0.0
+        self.wait_output_seconds = 0.0
+
+    @property
+    def busy_seconds(self):
+        return max(0.0, self.total_seconds - self.wait_input_seconds - self.wait_output_seconds)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "wait_input_seconds": round(self.wait_input_seconds, 4),
+            "wait_output_seconds": round(self.wait_output_seconds, 4),
+            "utilization": round(self.busy_seconds / self.total_seconds, 3) if self.total_seconds > 0 else 0.0,
+        }
+
+
+class QueueStats:
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.samples = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+
+    def sample(self, depth: int):
+        self.samples += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "max_depth": self.max_depth,
+            "mean_depth": round(self.depth_sum / self.samples, 2) if self.samples else 0.0,
+        }
+
+
+class Pipeline:
+    def __init__(self, queue_size: int = 4, threaded: bool = True, on_item=None, on_queue=None, name: str = None):
+        self.queue_size = max(1, queue_size)
+        self.name = name
+        self.threaded = threaded
+        self.on_item = on_item
+        self.on_queue = on_queue
+        self._stages = []
+        self._queues = []
+        self._stop = threading.Event()
+        self._error = None
+        self._wall_seconds = 0.0
+
+    def add_stage(self, name: str, fn):
+        """Append a stage. The first stage is called with no arguments."""
+        self._stages.append((name, fn, StageStats(name)))
+        return self
+
+    @property
+    def stopping(self) -> bool:
+        """True once a stage failed or the consumer stopped reading."""
+        return self._stop.is_set()
+
+    def queue_depths(self) -> dict:
+        """Current number of items waiting in each queue."""
+        return {stats.name: q.qsize() for q, stats in self._queues}
+
+    def run(self):
+        """Run the pipeline, yielding the last stage's output on the calling thread."""
+        if not self._stages:
+            return
+        start = time.perf_counter()
+        try:
+            if self.threaded:
+                yield from self._run_threaded()
+            else:
+                yield from self._run_sequential()
+        finally:
+            self._wall_seconds = time.perf_counter() - start
+
+    def _run_sequential(self):
+        upstream = None
+        upstream_stats = None
+        for name, fn, stats in self._stages:
+            outputs = fn() if upstream is None else fn(upstream)
+            upstream = self._timed_iter(outputs, stats, upstream_stats)
+            upstream_stats = stats
+        yield from upstream
+
+    def _timed_iter(self, outputs, stats: StageStats, upstream_stats):
+        # Time spent in next() includes pulling from upstream, which is
+        # accounted as input wait so that busy time is the stage's own work
+        iterator = iter(outputs)
+        while True:
+            upstream_before = upstream_stats.total_seconds if upstream_stats is not None else 0.0
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+                done = False
+            except StopIteration:
+                done = True
+            elapsed = time.perf_counter() - t0
+            upstream_seconds = upstream_stats.total_seconds - upstream_before if upstream_stats is not None else 0.0
+            stats.total_seconds += elapsed
+            stats.wait_input_seconds += upstream_seconds
+            if done:
+                return
+            stats.items += 1
+            if self.on_item is not None:
+                self.on_item(stats.name, max(0.0, elapsed - upstream_seconds), item)
+            yield item
+
+    def _run_threaded(self):
+        self._queues = []
+        for i, (name, _, _) in enumerate(self._stages):
+            next_name = self._stages[i + 1][0] if i + 1 < len(self._stages) else "consumer"
+            self._queues.append((queue.Queue(maxsize=self.queue_size), QueueStats(f"{name}->{next_name}", self.queue_size)))
+
+        threads = []
+        for i, (name, fn, stats) in enumerate(self._stages):
+            in_q = self._queues[i - 1][0] if i > 0 else None
+            out_q, out_stats = self._queues[i]
+            t = threading.Thread(
+                target=self._stage_worker,
+                args=(fn, stats, in_q, out_q, out_stats),
+                name=f"pipeline-{self.name}-{name}" if self.name else f"pipeline-{name}",
+                daemon=True,
+            )
+            threads.append(t)
+            t.start()
+
+        last_q = self._queues[-1][0]
+        try:
+            while True:
+                try:
+                    item = self._get(last_q)
+                except PipelineStopped:
+                    break
+                if item is _END:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for q, _ in self._queues:
+                self._drain(q)
+            for t in threads:
+                t.join()
+        if self._error is not None:
+            raise self._error
+
+    def _stage_worker(self, fn, stats: StageStats, in_q, out_q, out_stats: QueueStats):
+        start = time.perf_counter()
+        outputs = None
+        try:
+            outputs = fn() if in_q is None else fn(self._iter_queue(in_q, stats))
+            # Busy time of one item: since the previous put, minus the input waits in between
+            last, waited = start, 0.0
+            for item in outputs:
+                stats.items += 1
+                if self.on_item is not None:
+                    self.on_item(stats.name, max(0.0, time.perf_counter() - last - (stats.wait_input_seconds - waited)), item)
+                t0 = time.perf_counter()
+                self._put(out_q, item)
+                last = time.perf_counter()
+                stats.wait_output_seconds += last - t0
+                waited = stats.wait_input_seconds
+                depth = out_q.qsize()
+                out_stats.sample(depth)
+                if self.on_queue is not None:
+                    self.on_queue(out_stats.name, depth)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+        finally:
+            if hasattr(outputs, "close"):
+                outputs.close()
+            stats.total_seconds = time.perf_counter() - start
+            try:
+                self._put(out_q, _END)
+            except PipelineStopped:
+                pass
+
+    def _iter_queue(self, in_q, stats: StageStats):
+        while True:
+            t0 = time.perf_counter()
+            item = self._get(in_q)
+            stats.wait_input_seconds += time.perf_counter() - t0
+            if item is _END:
+                return
+            yield item
+
+    def _put(self, q, item):
+        while True:
+            if self._stop.is_set():
+                raise PipelineStopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise PipelineStopped()
+
+    @staticmethod
+    def _drain(q):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+
+    def report(self) -> dict:
+        """Per-stage timings and per-queue depth statistics of the last run."""
+        return {
+            "mode": "threaded" if self.threaded else "sequential",
+            "wall_seconds": round(self._wall_seconds, 4),
+            "stages": [stats.to_dict() for _, _, stats in self._stages],
+            "queues": [stats.to_dict() for _, stats in self._queues],
+        }
+
+
+def format_report(report: dict) -> str:
+    """Render a pipeline report as a small text table."""
+    lines = [f"Pipeline ({report['mode']}) wall time: {report['wall_seconds']:.2f}s"]
+    lines.append(f"  {'stage':<12} {'items':>6} {'busy s':>8} {'wait in':>8} {'wait out':>9} {'util':>6}")
+    for s in report["stages"]:
+        lines.append(
+            f"  {s['name']:<12} {s['items']:>6} {s['busy_seconds']:>8.2f} {s['wait_input_seconds']:>8.2f} "
+            f"{s['wait_output_seconds']:>9.2f} {s['utilization']:>6.0%}"
+        )
+    for q in report["queues"]:
+        lines.append(f"  queue {q['name']:<24} max {q['max_depth']}/{q['capacity']}  mean {q['mean_depth']}")
+    return "\n".join(lines)
@@ -0,0 +1,173 @@
+"""
+Sampling profiler for a running job or for the whole process.
+
+A StackSampler thread wakes every interval, reads the stack of every
+selected thread with sys._current_frames() and counts each distinct
+stack. Nothing is installed in the profiled threads (unlike cProfile,
+which also only sees the thread that enabled it), so it costs nothing
+until started and only the sampler's own work while it runs. Samples are
+wall clock: a thread blocked on a queue or a lock is counted where it
+waits.
+
+write() produces:
+    <prefix>.collapsed   "thread;outer;...;inner count" per distinct stack, the
+                         input format of flamegraph.pl, speedscope and inferno
+    <prefix>.txt         the top functions by own and total samples
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+
+def _frame_label(code) -> str:
+    # No ";" in labels: it separates the frames of a collapsed stack
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    def __init__(self, interval: float = 0.005, thread_filter=None, duration: float = None, on_done=None):
+        """
+        thread_filter(thread_name) -> bool selects the threads to sample (all
+        by default). The sampler stops by itself after duration seconds, if
+        given, and then calls on_done(sampler) on its own thread.
+        """
+        self.interval = max(0.001, interval)
+        self.thread_filter = thread_filter
+        self.duration = duration
+        self.on_done = on_done
+        self.stacks = collections.Counter()  # (thread, frame labels outer -> inner) -> samples
+        self.sweeps = 0
+        self.started = None
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0  # The sampler thread's own CPU time
+        self._labels = {}  # code object -> label
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling; on_done has run when this returns."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self
+
+    def run(self, seconds: float):
+        """Sample for seconds on a background thread and wait for it."""
+        self.duration = max(self.interval, seconds)
+        self.start()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        began = time.perf_counter()
+        cpu_began = time.thread_time()
+        deadline = began + self.duration if self.duration else None
+        try:
+            while not self._stop.wait(self.interval):
+                self._sample()
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+        finally:
+            self.seconds = time.perf_counter() - began
+            self.cpu_seconds = time.thread_time() - cpu_began
+            if self.on_done is not None:
+                try:
+                    self.on_done(self)
+                except Exception as e:
+                    print(f"Profiler: finishing the profile failed: {e}")
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            name = names.get(ident, f"thread-{ident}")
+            if self.thread_filter is not None and not self.thread_filter(name):
+                continue
+            labels = []
+            while frame is not None:
+                code = frame.f_code
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = _frame_label(code)
+                labels.append(label)
+                frame = frame.f_back
+            labels.reverse()
+            self.stacks[(name.replace(";", ":"),) + tuple(labels)] += 1
+        self.sweeps += 1
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 30) -> list:
+        """Functions by own samples (innermost frame) and total samples (anywhere on the stack)."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        samples = max(1, self.samples)
+        return [
+            {"function": label, "own": own[label], "total": total[label],
+             "own_percent": round(own[label] * 100.0 / samples, 1), "total_percent": round(total[label] * 100.0 / samples, 1)}
+            for label, _ in own.most_common(limit)
+        ]
+
+    def summary(self, limit: int = 30) -> dict:
+        threads = collections.Counter()
+        for stack, count in self.stacks.items():
+            threads[stack[0]] += count
+        return {
+            "started": self.started,
+            "seconds": round(self.seconds, 3),
+            "interval_ms": round(self.interval * 1000.0, 2),
+            "sweeps": self.sweeps,
+            "samples": self.samples,
+            "threads": dict(threads.most_common()),
+            # Share of one core the sampler itself used
+            "overhead_percent": round(self.cpu_seconds * 100.0 / self.seconds, 2) if self.seconds else None,
+            "top": self.top(limit),
+        }
+
+    def write(self, folder: str, prefix: str, limit: int = 40) -> dict:
+        """Write <prefix>.collapsed and <prefix>.txt into folder; returns their paths."""
+        os.makedirs(folder, exist_ok=True)
+        collapsed_path = os.path.join(folder, prefix + ".collapsed")
+        with open(collapsed_path, "w") as f:
+            f.write(self.collapsed())
+
+        summary = self.summary(limit)
+        lines = [
+            f"{summary['samples']} samples of {len(summary['threads'])} threads over {summary['seconds']:.1f}s, "
+            f"every {summary['interval_ms']:g} ms (wall clock: waits count); sampler overhead {summary['overhead_percent']}% of one core",
+            "",
+            "samples per thread:",
+        ]
+        lines += [f"  {count:>8}  {name}" for name, count in summary["threads"].items()]
+        lines += ["", f"  {'own %':>7} {'total %':>8} {'own':>8}  function"]
+        lines += [f"  {row['own_percent']:>7.1f} {row['total_percent']:>8.1f} {row['own']:>8}  {row['function']}" for row in summary["top"]]
+        summary_path = os.path.join(folder, prefix + ".txt")
+        with open(summary_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return {"collapsed": collapsed_path, "summary": summary_path}
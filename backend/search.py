@@ -3,6 +3,8 @@ import re
 from typing import List, Dict, Any, Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from metrics import MetricsRegistry, instrument_app, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -15,6 +17,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics, served on /metrics
+metrics = MetricsRegistry()
+instrument_app(app, metrics, "search")
+QUERY_SECONDS = metrics.histogram("search_query_seconds", "Time to match a query against the loaded segments")
+RESULTS = metrics.histogram("search_results", "Matching segments per query", buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+RELOAD_SECONDS = metrics.histogram("search_reload_seconds", "Time to reload the segments from temp.txt")
+
 # Constants
 ANOMALY_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "anomaly")
 TEMP_TXT_FILE = os.path.join(ANOMALY_FOLDER, "temp.txt")
@@ -158,6 +167,7 @@ class SimpleTextSearchEngine:
 
 # Initialize search engine
 search_engine = SimpleTextSearchEngine()
+metrics.gauge("search_segments", "Segments loaded for search").set_function(lambda: len(search_engine.segments))
 
 @app.get("/")
 async def root():
@@ -167,7 +177,8 @@ async def root():
 async def rebuild_index():
     """Reloads the data from temp.txt"""
     try:
-        search_engine.load_data()
+        with RELOAD_SECONDS.time():
+            search_engine.load_data()
         return {"message": "Data reloaded successfully", "total_segments": len(search_engine.segments)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to reload data: {str(e)}")
@@ -179,7 +190,9 @@ async def search(query: str, top_k: int = 5):
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
     try:
-        results = search_engine.search(query)
+        with QUERY_SECONDS.time():
+            results = search_engine.search(query)
+        RESULTS.observe(len(results))
         
         # Limit results if needed, though simple search usually returns everything
         # We'll respect top_k just in case
@@ -202,6 +215,11 @@ async def get_index_stats():
         "source_file": TEMP_TXT_FILE
     }
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics of the search service"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,394 @@
+"""
+Clip extraction for /video_segment.
+
+Clips are cut with as little re-encoding as possible. The keyframe times
+of a source are read once (ffprobe, packet headers only) and a requested
+range is split at the first and last keyframe inside it: the keyframe-
+aligned middle is stream-copied and only the partial GOPs at the two
+edges are re-encoded, then the parts are concatenated. Sources that are
+not H.264, and ranges without a whole GOP inside, are re-encoded in full
+as before. ffmpeg runs as an asyncio subprocess under a concurrency
+limit, a request for a clip that is already being cut waits for that job
+instead of starting another (a longer clip that covers it only with
+coalesce_slack, since its bounds differ from the request), and finished
+clips are kept in a size-bounded LRU cache on disk.
+
+prepare() cuts a clip before anyone asks for it: ingest uses it to write
+fragmented-MP4 renditions of anomalous chunks in the background, on
+their own concurrency slot and at low CPU priority, so /video_segment
+serves them from the cache on first view.
+"""
+import asyncio
+import bisect
+import contextlib
+import json
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from subprocess import PIPE
+
+FAST_PATH_CODECS = ("h264",)
+
+
+class SegmentError(RuntimeError):
+    pass
+
+
+def segment_name(video_name: str, start: float, end: float) -> str:
+    return f"{video_name}_{start:.1f}_{end:.1f}.mp4"
+
+
+def parse_segment_name(name: str):
+    """(video_name, start, end) of a cached clip, or None for other files."""
+    if not name.endswith(".mp4"):
+        return None
+    try:
+        video_name, start, end = name[:-4].rsplit("_", 2)
+        return video_name, float(start), float(end)
+    except ValueError:
+        return None
+
+
+def plan_cut(keyframes: list, start: float, end: float, frame_time: float):
+    """
+    Parts of [start, end) as ("encode" | "copy", from, to), or None when
+    there is no whole GOP inside the range and the clip is encoded in full.
+    """
+    lo = bisect.bisect_left(keyframes, start)
+    hi = bisect.bisect_right(keyframes, end)
+    if hi - lo < 2:
+        return None
+    first, last = keyframes[lo], keyframes[hi - 1]
+    parts = []
+    if first - start > frame_time / 2:
+        parts.append(("encode", start, first))
+    parts.append(("copy", first, last))
+    if end - last > frame_time / 2:
+        parts.append(("encode", last, end))
+    return parts
+
+
+async def run(command: list, niceness: int = 0) -> str:
+    """Run a command as an asyncio subprocess; returns stdout, raises SegmentError on failure."""
+    try:
+        process = await asyncio.create_subprocess_exec(*command, stdout=PIPE, stderr=PIPE)
+    except OSError as e:
+        raise SegmentError(f"Cannot run {command[0]}: {e}")
+    if niceness and hasattr(os, "setpriority"):
+        # Set from here rather than in the child, which keeps the spawn free of Python code
+        with contextlib.suppress(OSError):
+            os.setpriority(os.PRIO_PROCESS, process.pid, niceness)
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise SegmentError(f"{command[0]} exited with {process.returncode}: {stderr.decode(errors='replace')[-500:]}")
+    return stdout.decode(errors="replace")
+
+
+class SegmentCache:
+    """Finished clips in one folder, evicted least recently used first beyond max_bytes."""
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        files = []
+        for entry in os.scandir(folder):
+            if entry.is_file() and parse_segment_name(entry.name):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+        self._evict()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def find(self, video_name: str, start: float, end: float, slack: float = 0.0, count: bool = True):
+        """
+        The cached clip for exactly this range, else the shortest one that
+        covers it and is at most slack seconds longer. Returns (name, start, end)
+        or None; count=False leaves the hit / miss counters alone.
+        """
+        name = segment_name(video_name, start, end)
+        if name in self._entries:
+            match = (name, start, end)
+        else:
+            match = None
+            for candidate in self._entries:
+                parsed = parse_segment_name(candidate)
+                if parsed and parsed[0] == video_name and parsed[1] <= start and parsed[2] >= end \
+                        and (parsed[2] - parsed[1]) - (end - start) <= slack \
+                        and (match is None or parsed[2] - parsed[1] < match[2] - match[1]):
+                    match = (candidate, parsed[1], parsed[2])
+        if match is None or not os.path.exists(self.path(match[0])):
+            if match is not None:
+                self._entries.pop(match[0], None)
+            self.misses += count
+            return None
+        self.hits += count
+        self._entries.move_to_end(match[0])
+        try:
+            os.utime(self.path(match[0]))  # Keeps the LRU order across restarts
+        except OSError:
+            pass
+        return match
+
+    def add(self, name: str, source_path: str) -> str:
+        path = self.path(name)
+        os.replace(source_path, path)
+        self._entries[name] = os.path.getsize(path)
+        self._entries.move_to_end(name)
+        self._evict()
+        return path
+
+    def _evict(self):
+        # The newest clip always stays, even if it alone exceeds the limit.
+        # Removing a clip that is being served is fine: open files stay readable
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            total -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": sum(self._entries.values()),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SegmentExtractor:
+    def __init__(self, cache: SegmentCache, concurrency: int = 2, fast_path: bool = True, coalesce_slack: float = 0.0,
+                 background_concurrency: int = 1, background_niceness: int = 10,
+                 ffmpeg: str = "ffmpeg", ffprobe: str = "ffprobe"):
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+        self.background_concurrency = max(1, background_concurrency)
+        self.background_niceness = background_niceness
+        self.fast_path = fast_path
+        self.coalesce_slack = coalesce_slack
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self._semaphore = None  # Created on first use, inside the event loop
+        self._background = None  # Same, for prepare()
+        self._inflight = {}  # clip name -> (video_name, start, end, task)
+        self._probes = {}  # (path, mtime_ns, size) -> (stream info, video packet times, keyframe times)
+        self.counts = {"requests": 0, "cache": 0, "coalesced": 0, "fast": 0, "full": 0, "failed": 0,
+                       "prepared": 0, "prepare_skipped": 0}
+
+    async def get(self, video_path: str, video_name: str, start: float, end: float):
+        """Clip for [start, end] as (path, clip_start, clip_end, source); source is cache, coalesced, fast or full."""
+        start, end = round(start, 1), round(end, 1)
+        self.counts["requests"] += 1
+
+        hit = self.cache.find(video_name, start, end, self.coalesce_slack)
+        if hit is not None:
+            self.counts["cache"] += 1
+            return self.cache.path(hit[0]), hit[1], hit[2], "cache"
+
+        # A clip covering this whole range is already being cut: wait for it.
+        # One that only overlaps it is not used; the range gets a clip of its own
+        covering = [
+            (e - s, s, e, task) for v, s, e, task in self._inflight.values()
+            if v == video_name and s <= start and e >= end and (e - s) - (end - start) <= self.coalesce_slack
+        ]
+        if covering:
+            _, s, e, task = min(covering, key=lambda c: c[0])
+            self.counts["coalesced"] += 1
+            path, _ = await asyncio.shield(task)
+            return path, s, e, "coalesced"
+
+        # Shielded: a client that goes away does not cancel a job others may be waiting for
+        path, method = await asyncio.shield(self._start(video_path, video_name, start, end))
+        return path, start, end, method
+
+    async def prepare(self, video_path: str, video_name: str, start: float, end: float) -> str:
+        """
+        Cut the clip for [start, end] ahead of any request, as a fragmented
+        MP4 at low CPU priority, at most background_concurrency at a time.
+        Returns the path of the clip that will serve the range.
+        """
+        start, end = round(start, 1), round(end, 1)
+        if self._background is None:
+            self._background = asyncio.Semaphore(self.background_concurrency)
+        async with self._background:
+            # Checked once a slot is free: a request may have cut the clip meanwhile
+            hit = self.cache.find(video_name, start, end, self.coalesce_slack, count=False)
+            if hit is not None:
+                self.counts["prepare_skipped"] += 1
+                return self.cache.path(hit[0])
+            name = segment_name(video_name, start, end)
+            if name in self._inflight:
+                self.counts["prepare_skipped"] += 1
+                path, _ = await asyncio.shield(self._inflight[name][3])
+                return path
+            path, _ = await asyncio.shield(self._start(video_path, video_name, start, end, background=True))
+            self.counts["prepared"] += 1
+            return path
+
+    def _start(self, video_path: str, video_name: str, start: float, end: float, background: bool = False) -> asyncio.Task:
+        name = segment_name(video_name, start, end)
+        task = asyncio.ensure_future(self._build(video_path, name, start, end, background))
+        self._inflight[name] = (video_name, start, end, task)
+        task.add_done_callback(lambda t: self._finished(name, t))
+        return task
+
+    def _finished(self, name: str, task: asyncio.Task):
+        self._inflight.pop(name, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.counts["failed"] += 1
+
+    async def _probe(self, video_path: str):
+        stat = os.stat(video_path)
+        key = (os.path.abspath(video_path), stat.st_mtime_ns, stat.st_size)
+        if key not in self._probes:
+            streams = json.loads(await run([
+                self.ffprobe, "-v", "error",
+                "-show_entries", "stream=codec_type,codec_name,profile,pix_fmt,r_frame_rate,sample_rate,channels",
+                "-of", "json", video_path,
+            ])).get("streams", [])
+            video = next((s for s in streams if s.get("codec_type") == "video"), None)
+            if video is None:
+                raise SegmentError(f"No video stream in {video_path}")
+            audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+            num, _, den = video.get("r_frame_rate", "25/1").partition("/")
+            fps = float(num) / float(den or 1) if float(num) > 0 else 25.0
+            info = {"codec": video.get("codec_name"), "pix_fmt": video.get("pix_fmt") or "yuv420p", "fps": fps, "audio": audio}
+
+            packets, keyframes = [], []
+            if info["codec"] in FAST_PATH_CODECS:
+                # Packet headers only: nothing is decoded
+                listing = await run([
+                    self.ffprobe, "-v", "error", "-select_streams", "v:0",
+                    "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path,
+                ])
+                for line in listing.splitlines():
+                    pts, _, flags = line.partition(",")
+                    if pts not in ("", "N/A"):
+                        packets.append(float(pts))
+                        if "K" in flags:
+                            keyframes.append(float(pts))
+                packets.sort()
+                keyframes.sort()
+            self._probes[key] = (info, packets, keyframes)
+        return self._probes[key]
+
+    async def _build(self, video_path: str, name: str, start: float, end: float, background: bool = False):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        # Background jobs already hold a background slot
+        async with (contextlib.nullcontext() if background else self._semaphore):
+            niceness = self.background_niceness if background else 0
+            # Fragmented MP4 plays while it downloads without rewriting the
+            # file to move the index to the front, as +faststart does
+            movflags = "+frag_keyframe+empty_moov+default_base_moof" if background else "+faststart"
+            work = os.path.join(self.cache.folder, f".work_{uuid.uuid4().hex}")
+            os.makedirs(work)
+            try:
+                output = os.path.join(work, name)
+                parts = None
+                if self.fast_path:
+                    try:
+                        info, packets, keyframes = await self._probe(video_path)
+                        if keyframes:
+                            parts = plan_cut(keyframes, start, end, 1.0 / info["fps"])
+                    except SegmentError as e:
+                        print(f"Segment fast path unavailable for {video_path}: {e}")
+                method = "full"
+                if parts is not None:
+                    try:
+                        await self._cut_parts(video_path, info, packets, parts, work, output, movflags, niceness)
+                        # Guard against a bad concat: the clip must be as long as requested
+                        clip_seconds = float((await run([
+                            self.ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", output,
+                        ])).strip() or 0)
+                        if abs(clip_seconds - (end - start)) > max(0.25, 2.0 / info["fps"]):
+                            raise SegmentError(f"clip is {clip_seconds:.2f}s long, expected {end - start:.2f}s")
+                        method = "fast"
+                    except SegmentError as e:
+                        print(f"Segment fast path failed for {name}, re-encoding: {e}")
+                if method == "full":
+                    await run([
+                        self.ffmpeg, "-y",
+                        "-ss", str(start), "-to", str(end),
+                        "-i", video_path,
+                        "-c:v", "libx264",  # Re-encode to ensure compatibility and correct timestamps
+                        "-c:a", "aac",
+                        "-strict", "experimental",
+                        "-movflags", movflags,
+                        output,
+                    ], niceness)
+                self.counts[method] += 1
+                return self.cache.add(name, output), method
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+
+    async def _cut_parts(self, video_path: str, info: dict, packets: list, parts: list, work: str, output: str,
+                         movflags: str = "+faststart", niceness: int = 0):
+        audio = info["audio"]
+        part_paths = []
+        for i, (kind, a, b) in enumerate(parts):
+            part_path = os.path.join(work, f"part{i}.ts")
+            if kind == "copy":
+                # Input seeking lands on the keyframe at a; the margin keeps
+                # timestamp rounding from selecting the keyframe before it
+                seek, duration = a + 0.001, b - a - 0.001
+            else:
+                seek, duration = a, b - a
+            command = [self.ffmpeg, "-v", "error", "-y", "-ss", f"{seek:.6f}", "-i", video_path,
+                       "-t", f"{duration:.6f}", "-map", "0:v:0"]
+            if kind == "copy":
+                # Exactly the frames of the copied GOPs: -t alone works in decode
+                # order and would let the next keyframe and its B-frames through
+                frames = bisect.bisect_left(packets, b - 0.0005) - bisect.bisect_left(packets, a - 0.0005)
+                command += ["-frames:v", str(frames), "-c:v", "copy", "-bsf:v", "h264_mp4toannexb"]
+            else:
+                command += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", info["pix_fmt"]]
+            if audio is not None:
+                # Audio is re-encoded in every part so all parts share one format
+                command += ["-map", "0:a:0", "-c:a", "aac"]
+                if audio.get("sample_rate"):
+                    command += ["-ar", str(audio["sample_rate"])]
+                if audio.get("channels"):
+                    command += ["-ac", str(audio["channels"])]
+            command += ["-f", "mpegts", part_path]
+            await run(command, niceness)
+            part_paths.append(part_path)
+
+        list_path = os.path.join(work, "parts.txt")
+        with open(list_path, "w") as f:
+            # Entries are resolved relative to the list file
+            f.write("".join(f"file '{os.path.basename(path)}'\n" for path in part_paths))
+        command = [self.ffmpeg, "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy"]
+        if audio is not None:
+            command += ["-bsf:a", "aac_adtstoasc"]
+        await run(command + ["-movflags", movflags, output], niceness)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "background_concurrency": self.background_concurrency,
+            "fast_path": self.fast_path,
+            "in_flight": len(self._inflight),
+            "requests": dict(self.counts),
+            "cache": self.cache.stats(),
+        }
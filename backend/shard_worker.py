@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Shard worker: processes shards of long videos from the shard work queue.
+
+Run one per node (or several per node, each with its own cores) next to
+the server. Every worker needs the same SHARD_QUEUE, SHARD_DIR and upload
+folder paths as the server, on shared storage, plus the same models and
+settings. It leases a shard, runs detection and Gemini analysis on its
+chunk range, heartbeats the lease from a background thread meanwhile and
+stores the result on the queue, where the server's coordinator merges it.
+
+Usage:
+    SHARD_QUEUE=/shared/shards.sqlite python shard_worker.py [--worker-id node-1] [--idle-exit 0]
+"""
+import argparse
+import os
+import platform
+import threading
+import time
+import traceback
+
+import indexing_video as iv
+
+
+def heartbeat(queue, shard: dict, stop: threading.Event):
+    """Extend the lease every lease_seconds / 3 until stop is set or the lease is lost."""
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.heartbeat(shard):
+            print(f"Lost the lease on shard {shard['shard'] + 1} of job {shard['job_id']}; its result will be discarded")
+            return
+
+
+def run_shard(queue, shard: dict) -> bool:
+    """Process one leased shard and store its result. False if the shard failed or the lease was lost."""
+    first, last = shard["first_chunk"], shard["last_chunk"]
+    # A fresh folder per lease: a worker whose lease expired may still be writing into its own
+    folder = os.path.join(shard["payload"]["folder"], f"shard_{shard['shard']}_{shard['token'][:8]}")
+    print(f"Shard {shard['shard'] + 1} of job {shard['job_id']}: chunks {first + 1}-{last} of {shard['video_path']} "
+          f"(attempt {shard['attempts']})")
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(queue, shard, stop), name="shard-heartbeat", daemon=True)
+    beat.start()
+    try:
+        result = iv.process_video_task(shard["video_path"], chunk_range=(first, last), output_folder=folder)
+        if result is None:
+            raise RuntimeError(f"Could not open {shard['video_path']}")
+    except Exception as e:
+        traceback.print_exc()
+        stop.set()
+        queue.fail(shard, f"{type(e).__name__}: {e}")
+        return False
+    finally:
+        stop.set()
+        beat.join()
+    return queue.complete(shard, result)
+
+
+def run_worker(queue, worker_id: str, poll_seconds: float = 2.0, idle_exit: float = 0):
+    """Lease and process shards until idle for idle_exit seconds (0: forever)."""
+    idle_since = time.monotonic()
+    while True:
+        shard = queue.lease(worker_id)
+        if shard is None:
+            if idle_exit and time.monotonic() - idle_since >= idle_exit:
+                return
+            time.sleep(poll_seconds)
+            continue
+        run_shard(queue, shard)
+        idle_since = time.monotonic()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-id", default=f"{platform.node()}:{os.getpid()}")
+    parser.add_argument("--idle-exit", type=float, default=0, help="Exit after this many seconds without work (0: never)")
+    args = parser.parse_args()
+    if iv.work_queue is None:
+        parser.error("SHARD_QUEUE is not set")
+
+    iv.models.warm_up(background=False)
+    if iv.chunk_pool is not None:
+        iv.chunk_pool.start()
+    print(f"Shard worker {args.worker_id} polling {iv.work_queue.path}")
+    try:
+        run_worker(iv.work_queue, args.worker_id, iv.SHARD_POLL_SECONDS, args.idle_exit)
+    finally:
+        if iv.chunk_pool is not None:
+            iv.chunk_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
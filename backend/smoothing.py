@@ -0,0 +1,97 @@
+"""
+Temporal smoothing of per-frame anomaly scores.
+
+The SVM decision score of every sampled frame is smoothed with a rolling
+median and turned into anomaly intervals with hysteresis: an event starts
+when the smoothed score reaches enter_threshold, continues while it stays
+at or above exit_threshold, and only counts if it lasts min_run frames.
+A single noisy frame therefore no longer flags a whole chunk.
+"""
+import numpy as np
+
+
+def rolling_median(scores: np.ndarray, window: int, left_context: np.ndarray = None) -> np.ndarray:
+    """
+    Centered rolling median. left_context (the tail of the previous chunk)
+    is used before the first frame; the right edge repeats the last score.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    if window <= 1 or len(scores) == 0:
+        return scores.copy()
+
+    half = window // 2
+    if left_context is None or len(left_context) == 0:
+        left = np.repeat(scores[:1], half)
+    else:
+        left = np.asarray(left_context, dtype=np.float32)[-half:]
+        if len(left) < half:
+            left = np.concatenate([np.repeat(left[:1], half - len(left)), left])
+    right = np.repeat(scores[-1:], window - 1 - half)
+    padded = np.concatenate([left, scores, right])
+    return np.median(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1).astype(np.float32)
+
+
+class AnomalyIntervalDetector:
+    """
+    Streaming hysteresis over consecutive chunks of scores. The smoothing
+    context and an event that is still open carry over to the next chunk.
+    """
+
+    def __init__(self, window: int = 5, enter_threshold: float = 0.0, exit_threshold: float = -0.25, min_run: int = 3):
+        self.window = max(1, window)
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = min(exit_threshold, enter_threshold)
+        self.min_run = max(1, min_run)
+        self._context = np.empty(0, dtype=np.float32)
+        self._open_run = 0  # Length of an event still open at the end of the last chunk
+
+    @property
+    def open_run(self) -> int:
+        """Length of a run still open at the end of the last chunk, 0 if none."""
+        return self._open_run
+
+    def state(self) -> dict:
+        """What carries over to the next chunk, as plain JSON types."""
+        return {"context": [float(x) for x in self._context], "open_run": self._open_run}
+
+    def restore(self, state: dict):
+        self._context = np.asarray(state["context"], dtype=np.float32)
+        self._open_run = int(state["open_run"])
+
+    def process(self, scores: np.ndarray):
+        """
+        Returns (smoothed_scores, intervals) for one chunk, where intervals
+        is a list of (start_index, end_index_exclusive) into this chunk.
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        smoothed = rolling_median(scores, self.window, self._context)
+        if len(scores):
+            self._context = np.concatenate([self._context, scores])[-(self.window // 2 or 1):]
+
+        intervals = []
+        in_event = self._open_run > 0
+        run = self._open_run
+        start = 0
+        for i, value in enumerate(smoothed):
+            if in_event:
+                if value >= self.exit_threshold:
+                    run += 1
+                    continue
+                # A carried-over event that ends on this chunk's first frame has no part here
+                if run >= self.min_run and i > start:
+                    intervals.append((start, i))
+                in_event = False
+                run = 0
+            if value >= self.enter_threshold:
+                in_event = True
+                run = 1
+                start = i
+
+        if in_event:
+            # Report the part inside this chunk once the whole event is long enough
+            if run >= self.min_run:
+                intervals.append((start, len(smoothed)))
+            self._open_run = run
+        else:
+            self._open_run = 0
+        return smoothed, intervals
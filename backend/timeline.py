@@ -0,0 +1,245 @@
+"""
+Scrubbing thumbnails and the anomaly-score timeline of a processed video,
+written from the frames and scores the ingest pass already has in hand.
+
+Layout inside a video's anomaly folder:
+    timeline_scores.f16       raw float16 SVM score per sampled frame, NaN for static frames
+    timeline_frames.i32       raw int32 frame numbers, one per score
+    timeline_sprites_{k}.jpg  sprite sheets of columns x rows thumbnails, row-major
+    timeline.json             thumbnail grid, sheet names, counts and video parameters
+
+One thumbnail is kept every `interval` seconds: the first sampled frame at
+or after k * interval. While the video is processed the thumbnails are
+appended raw to timeline_thumbs.u8.tmp, so an interrupted run can resume
+like the embedding store does; the sheets are only encoded on close.
+"""
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+SCORES_FILE = "timeline_scores.f16"
+FRAMES_FILE = "timeline_frames.i32"
+THUMBS_FILE = "timeline_thumbs.u8"
+SHEET_FILE = "timeline_sprites_{}.jpg"
+META_FILE = "timeline.json"
+
+
+def thumbnail_size(frame_width: int, frame_height: int, tile_width: int):
+    """(width, height) of a thumbnail with the source aspect ratio, height rounded to even."""
+    if frame_width <= 0 or frame_height <= 0:
+        return tile_width, tile_width * 9 // 16 // 2 * 2
+    return tile_width, max(2, int(round(tile_width * frame_height / frame_width / 2)) * 2)
+
+
+class TimelineWriter:
+    def __init__(self, folder: str, tile_size: tuple, interval: float = 2.0, columns: int = 10, rows: int = 10,
+                 metadata: dict = None, resume: tuple = None):
+        self.folder = folder
+        self.tile_width, self.tile_height = tile_size
+        self.interval = interval
+        self.columns = columns
+        self.rows = rows
+        self.metadata = metadata or {}
+        self.count = 0
+        self.thumbnails = 0
+        self.sheet_seconds = []  # JPEG encode + write time of each sprite sheet, filled by close()
+        self._paths = {name: os.path.join(folder, name) for name in (SCORES_FILE, FRAMES_FILE, THUMBS_FILE)}
+        if resume is None:
+            self._files = {name: open(path + ".tmp", "wb") for name, path in self._paths.items()}
+        else:
+            self._resume(*resume)
+
+    @property
+    def _tile_bytes(self) -> int:
+        return self.tile_width * self.tile_height * 3
+
+    def _resume(self, count: int, thumbnails: int):
+        """Continue the .tmp files of an interrupted run, dropping what was written after its last flush()."""
+        sizes = {
+            SCORES_FILE: count * np.dtype(np.float16).itemsize,
+            FRAMES_FILE: count * np.dtype(np.int32).itemsize,
+            THUMBS_FILE: thumbnails * self._tile_bytes,
+        }
+        for name, size in sizes.items():
+            path = self._paths[name] + ".tmp"
+            if not os.path.exists(path) or os.path.getsize(path) < size:
+                raise FileNotFoundError(f"Cannot resume timeline: {path} is missing or too short")
+        self._files = {}
+        for name, size in sizes.items():
+            f = open(self._paths[name] + ".tmp", "r+b")
+            f.truncate(size)
+            f.seek(size)
+            self._files[name] = f
+        self.count = count
+        self.thumbnails = thumbnails
+
+    def state(self) -> dict:
+        """What a resumed run passes back as resume=(count, thumbnails)."""
+        return {"count": self.count, "thumbnails": self.thumbnails}
+
+    def append(self, frame_numbers: np.ndarray, timestamps: np.ndarray, scores: np.ndarray, frames: np.ndarray):
+        n = len(frame_numbers)
+        if n == 0:
+            return
+        # Static frames are scored -inf; stored as NaN, "not scored"
+        scores = np.where(np.isfinite(scores), scores, np.nan).astype(np.float16)
+        scores.tofile(self._files[SCORES_FILE])
+        np.asarray(frame_numbers, dtype=np.int32).tofile(self._files[FRAMES_FILE])
+        self.count += n
+
+        for i in range(n):
+            tile = None
+            # Thumbnail k always belongs to k * interval: a gap in the
+            # sampled frames repeats the next frame instead of shifting the rest
+            while timestamps[i] >= self.thumbnails * self.interval:
+                if tile is None:
+                    tile = cv2.resize(frames[i], (self.tile_width, self.tile_height), interpolation=cv2.INTER_AREA).tobytes()
+                self._files[THUMBS_FILE].write(tile)
+                self.thumbnails += 1
+
+    def flush(self):
+        """Make everything appended so far durable (used at chunk checkpoints)."""
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+    def detach(self):
+        """Close the files but keep the .tmp data, so a later run can resume it."""
+        for f in self._files.values():
+            f.close()
+
+    def close(self, jpeg_quality: int = 80):
+        for f in self._files.values():
+            f.close()
+        thumbs_path = self._paths[THUMBS_FILE] + ".tmp"
+        tiles = np.fromfile(thumbs_path, dtype=np.uint8)[:self.thumbnails * self._tile_bytes]
+        tiles = tiles.reshape(self.thumbnails, self.tile_height, self.tile_width, 3)
+
+        per_sheet = self.columns * self.rows
+        sheets = []
+        for k, first in enumerate(range(0, self.thumbnails, per_sheet)):
+            batch = tiles[first:first + per_sheet]
+            used_rows = (len(batch) + self.columns - 1) // self.columns
+            sheet = np.zeros((used_rows * self.tile_height, self.columns * self.tile_width, 3), dtype=np.uint8)
+            for i, tile in enumerate(batch):
+                y, x = divmod(i, self.columns)
+                sheet[y * self.tile_height:(y + 1) * self.tile_height, x * self.tile_width:(x + 1) * self.tile_width] = tile
+            name = SHEET_FILE.format(k)
+            started = time.perf_counter()
+            cv2.imwrite(os.path.join(self.folder, name), sheet, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            self.sheet_seconds.append(time.perf_counter() - started)
+            sheets.append(name)
+        os.remove(thumbs_path)
+        os.replace(self._paths[SCORES_FILE] + ".tmp", self._paths[SCORES_FILE])
+        os.replace(self._paths[FRAMES_FILE] + ".tmp", self._paths[FRAMES_FILE])
+
+        meta = dict(
+            self.metadata,
+            count=self.count,
+            thumbnails=self.thumbnails,
+            interval=self.interval,
+            tile_width=self.tile_width,
+            tile_height=self.tile_height,
+            columns=self.columns,
+            rows=self.rows,
+            sheets=sheets,
+        )
+        meta_path = os.path.join(self.folder, META_FILE)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def abort(self):
+        for f in self._files.values():
+            f.close()
+        for path in self._paths.values():
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+
+
+class Timeline:
+    def __init__(self, folder: str):
+        self.folder = folder
+        with open(os.path.join(folder, META_FILE), "r") as f:
+            self.metadata = json.load(f)
+        self.count = self.metadata["count"]
+        if self.count:
+            self.scores = np.memmap(os.path.join(folder, SCORES_FILE), dtype=np.float16, mode="r", shape=(self.count,))
+            self.frame_numbers = np.memmap(os.path.join(folder, FRAMES_FILE), dtype=np.int32, mode="r", shape=(self.count,))
+        else:
+            self.scores = np.empty(0, dtype=np.float16)
+            self.frame_numbers = np.empty(0, dtype=np.int32)
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, META_FILE))
+
+    @property
+    def version(self) -> int:
+        """Changes whenever the video is processed again."""
+        return os.stat(os.path.join(self.folder, META_FILE)).st_mtime_ns
+
+    @property
+    def duration(self) -> float:
+        return self.metadata["total_frames"] / self.metadata["input_fps"]
+
+    def thumbnail_position(self, index: int):
+        """(sheet name, x, y) of thumbnail index inside its sprite sheet."""
+        per_sheet = self.metadata["columns"] * self.metadata["rows"]
+        sheet, i = divmod(index, per_sheet)
+        y, x = divmod(i, self.metadata["columns"])
+        return self.metadata["sheets"][sheet], x * self.metadata["tile_width"], y * self.metadata["tile_height"]
+
+    def downsample(self, width: int, start: float = 0.0, end: float = None):
+        """
+        Scores of [start, end) reduced to width buckets, one per pixel:
+        (max, mean) float32 arrays, NaN for buckets without a scored frame.
+        The max keeps short anomaly peaks visible at any width.
+        Raises ValueError for an empty range.
+        """
+        end = self.duration if end is None else end
+        if not end > start:
+            raise ValueError(f"Empty time range [{start}, {end})")
+        times = np.asarray(self.frame_numbers, dtype=np.float64) / self.metadata["input_fps"]
+        scores = np.asarray(self.scores, dtype=np.float32)
+        keep = (times >= start) & (times < end) & ~np.isnan(scores)
+        buckets = ((times[keep] - start) / (end - start) * width).astype(np.int64).clip(0, width - 1)
+        scores = scores[keep]
+
+        peak = np.full(width, -np.inf, dtype=np.float32)
+        np.maximum.at(peak, buckets, scores)
+        total = np.bincount(buckets, weights=scores, minlength=width)
+        counts = np.bincount(buckets, minlength=width)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (total / counts).astype(np.float32)
+        peak[counts == 0] = np.nan
+        return peak, mean
+
+    def strip(self, width: int, tile_width: int):
+        """
+        One row of evenly spaced thumbnails, width pixels wide: the tile
+        nearest the middle of each of width // tile_width equal time slots.
+        Returns (BGR image, number of tiles); a video without thumbnails
+        gets a black strip and 0 tiles.
+        """
+        meta = self.metadata
+        tile_height = max(2, int(round(tile_width * meta["tile_height"] / meta["tile_width"])))
+        if not meta["thumbnails"]:
+            return np.zeros((tile_height, width, 3), dtype=np.uint8), 0
+        n = max(1, min(width // max(1, tile_width), meta["thumbnails"]))
+        out = np.zeros((tile_height, n * tile_width, 3), dtype=np.uint8)
+        sheets = {}
+        slot = self.duration / n
+        for i in range(n):
+            index = min(meta["thumbnails"] - 1, int((i + 0.5) * slot / meta["interval"]))
+            name, x, y = self.thumbnail_position(index)
+            if name not in sheets:
+                sheets[name] = cv2.imread(os.path.join(self.folder, name))
+            tile = sheets[name][y:y + meta["tile_height"], x:x + meta["tile_width"]]
+            out[:, i * tile_width:(i + 1) * tile_width] = cv2.resize(tile, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+        if out.shape[1] != width:
+            out = cv2.resize(out, (width, tile_height), interpolation=cv2.INTER_AREA)
+        return out, n
@@ -0,0 +1,106 @@
+"""
+Streaming video uploads with content-hash deduplication.
+
+save_upload() copies an upload to a temporary file in the upload folder
+chunk by chunk. Each chunk is written and fed to SHA-256 on a worker
+thread while the next one is read, so a multi-GB upload never blocks the
+event loop and the hash is known as soon as the copy finishes.
+UploadIndex maps content hashes to the stored video, so an identical
+file uploaded again, under any name, resolves to the existing video
+instead of being processed a second time.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+INDEX_FILE = "content_index.json"
+PARTIAL_PREFIX = ".upload_"
+
+
+def safe_filename(filename: str) -> str:
+    """Client file name reduced to a plain basename of safe characters."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name).lstrip(".")
+    return name or "upload"
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    f.write(chunk)
+    digest.update(chunk)  # hashlib releases the GIL on large buffers
+
+
+def hash_file(path: str, chunk_bytes: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def save_upload(upload, folder: str, chunk_bytes: int = 1 << 20) -> dict:
+    """
+    Stream an UploadFile (anything with an async read(n)) to a temporary
+    file in folder. Returns path, sha256, size and seconds; the caller
+    renames or removes the file.
+    """
+    path = os.path.join(folder, f"{PARTIAL_PREFIX}{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    started = time.perf_counter()
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        pending = None
+        while True:
+            chunk = await upload.read(chunk_bytes)
+            # Chunk i is written and hashed while chunk i + 1 is read
+            if pending is not None:
+                await pending
+            if not chunk:
+                break
+            size += len(chunk)
+            pending = asyncio.ensure_future(asyncio.to_thread(_write_chunk, f, digest, chunk))
+    except BaseException:
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        await asyncio.to_thread(f.close)
+        os.remove(path)
+        raise
+    await asyncio.to_thread(f.close)
+    return {"path": path, "sha256": digest.hexdigest(), "size": size, "seconds": time.perf_counter() - started}
+
+
+class UploadIndex:
+    """content hash -> {"filename", "video_name", "size"} for the upload folder, kept in INDEX_FILE."""
+
+    def __init__(self, folder: str):
+        self.path = os.path.join(folder, INDEX_FILE)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, sha256: str):
+        return self._entries.get(sha256)
+
+    def hash_of(self, filename: str):
+        for sha256, entry in self._entries.items():
+            if entry["filename"] == filename:
+                return sha256
+        return None
+
+    def put(self, sha256: str, filename: str, video_name: str, size: int):
+        with self._lock:
+            # A file name holds one content at a time
+            for stale in [h for h, entry in self._entries.items() if entry["filename"] == filename and h != sha256]:
+                del self._entries[stale]
+            self._entries[sha256] = {"filename": filename, "video_name": video_name, "size": size}
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self._entries, f)
+            os.replace(self.path + ".tmp", self.path)
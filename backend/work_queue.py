@@ -0,0 +1,193 @@
+"""
+Durable queue of video shards for multi-node processing, backed by SQLite.
+
+A coordinator splits a long video into shards (contiguous chunk ranges)
+and submits them under its job id. Workers, on other hosts or just other
+processes, lease one shard at a time: the lease has a random token and
+expires lease_seconds after the last heartbeat. A worker that dies or
+stalls stops heartbeating, and the next lease() or requeue_expired() call
+puts its shard back on the queue; after max_attempts leases the shard is
+marked failed. Only the holder of the current token can heartbeat,
+complete or fail a shard, so a late result from a worker whose lease was
+taken over is discarded.
+
+The database file stands in for a broker: every node must reach it on a
+filesystem with working POSIX locks, and lease expiry compares the clocks
+of different hosts, so they should be NTP-synced.
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    job_id TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    video_path TEXT NOT NULL,
+    first_chunk INTEGER NOT NULL,
+    last_chunk INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    token TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    requeues INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (job_id, shard)
+);
+CREATE INDEX IF NOT EXISTS shards_by_state ON shards (state, lease_expires);
+"""
+
+
+class WorkQueue:
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    def _connect(self):
+        # One short-lived connection per call: the queue is shared by threads
+        # and processes, and SQLite serializes the writers through its file lock
+        db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return _Transaction(db)
+
+    def submit(self, job_id: str, video_path: str, shards: list, payload: dict = None):
+        """Queue shards [(first_chunk, last_chunk), ...] of a video under job_id."""
+        now = time.time()
+        with self._connect() as db:
+            db.executemany(
+                "INSERT INTO shards (job_id, shard, video_path, first_chunk, last_chunk, payload, state, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job_id, i, video_path, first, last, json.dumps(payload or {}), QUEUED, now) for i, (first, last) in enumerate(shards)]
+            )
+
+    def _requeue_expired(self, db) -> int:
+        now = time.time()
+        # Out of attempts: failed, otherwise back on the queue
+        db.execute(
+            "UPDATE shards SET state = ?, worker = NULL, token = NULL, error = 'lease expired ' || attempts || ' times', updated = ? "
+            "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+            (FAILED, now, LEASED, now, self.max_attempts)
+        )
+        return db.execute(
+            "UPDATE shards SET state = ?, worker = NULL, token = NULL, requeues = requeues + 1, updated = ? "
+            "WHERE state = ? AND lease_expires < ?",
+            (QUEUED, now, LEASED, now)
+        ).rowcount
+
+    def requeue_expired(self) -> int:
+        """Put shards whose lease expired back on the queue. Returns how many."""
+        with self._connect() as db:
+            return self._requeue_expired(db)
+
+    def lease(self, worker: str):
+        """Lease the oldest queued shard; None when the queue is empty."""
+        with self._connect() as db:
+            self._requeue_expired(db)
+            row = db.execute("SELECT * FROM shards WHERE state = ? ORDER BY rowid LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            now = time.time()
+            db.execute(
+                "UPDATE shards SET state = ?, worker = ?, token = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE job_id = ? AND shard = ?",
+                (LEASED, worker, token, now + self.lease_seconds, now, row["job_id"], row["shard"])
+            )
+        shard = _shard(row)
+        shard.update(token=token, worker=worker, attempts=row["attempts"] + 1)
+        return shard
+
+    def _update_leased(self, shard: dict, sets: str, args: tuple) -> bool:
+        with self._connect() as db:
+            return db.execute(
+                f"UPDATE shards SET {sets}, updated = ? WHERE job_id = ? AND shard = ? AND state = ? AND token = ?",
+                args + (time.time(), shard["job_id"], shard["shard"], LEASED, shard["token"])
+            ).rowcount == 1
+
+    def heartbeat(self, shard: dict) -> bool:
+        """Extend the lease. False once the lease was lost (expired and re-queued)."""
+        return self._update_leased(shard, "lease_expires = ?", (time.time() + self.lease_seconds,))
+
+    def complete(self, shard: dict, result: dict) -> bool:
+        """Store the shard result. False (result discarded) if the lease was lost."""
+        return self._update_leased(shard, "state = ?, result = ?, token = NULL, error = NULL", (DONE, json.dumps(result)))
+
+    def fail(self, shard: dict, error: str) -> bool:
+        """Give the shard back after an error; it fails for good after max_attempts."""
+        state = FAILED if shard["attempts"] >= self.max_attempts else QUEUED
+        return self._update_leased(shard, "state = ?, worker = NULL, token = NULL, error = ?", (state, error))
+
+    def job(self, job_id: str) -> dict:
+        """Shard counts per state and every shard of a job, in order."""
+        with self._connect() as db:
+            rows = db.execute("SELECT * FROM shards WHERE job_id = ? ORDER BY shard", (job_id,)).fetchall()
+        counts = {state: 0 for state in (QUEUED, LEASED, DONE, FAILED)}
+        for row in rows:
+            counts[row["state"]] += 1
+        return {"job_id": job_id, "total": len(rows), **counts, "shards": [_shard(row) for row in rows]}
+
+    def delete(self, job_id: str):
+        with self._connect() as db:
+            db.execute("DELETE FROM shards WHERE job_id = ?", (job_id,))
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            rows = db.execute("SELECT state, COUNT(*) AS n FROM shards GROUP BY state").fetchall()
+            jobs = db.execute("SELECT COUNT(DISTINCT job_id) FROM shards WHERE state IN (?, ?)", (QUEUED, LEASED)).fetchone()[0]
+            workers = [row["worker"] for row in db.execute("SELECT DISTINCT worker FROM shards WHERE state = ? ORDER BY worker", (LEASED,))]
+        return {
+            "path": self.path,
+            "lease_seconds": self.lease_seconds,
+            "max_attempts": self.max_attempts,
+            "shards": {row["state"]: row["n"] for row in rows},
+            "jobs": jobs,  # With queued or leased shards
+            "active_workers": workers,
+        }
+
+
+def _shard(row) -> dict:
+    return {
+        "job_id": row["job_id"],
+        "shard": row["shard"],
+        "video_path": row["video_path"],
+        "first_chunk": row["first_chunk"],
+        "last_chunk": row["last_chunk"],
+        "payload": json.loads(row["payload"]),
+        "state": row["state"],
+        "worker": row["worker"],
+        "attempts": row["attempts"],
+        "requeues": row["requeues"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+    }
+
+
+class _Transaction:
+    """Connection context: BEGIN IMMEDIATE on enter, commit or roll back and close on exit."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.db.close()